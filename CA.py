@@ -0,0 +1,362 @@
+'''
+	Script that generates the CAlite (.S.ca) file of a conversation from its
+	CHAT transcript, in place of running the CLAN jeffersonize (chat2calite)
+	and indent programs on the CHAT file.
+	CHAT markup is converted to Jeffersonian symbols turn by turn and the
+	markers of overlapping talk are then aligned by character column, giving
+	the same file as the CLAN programs did.
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/21/19
+'''
+
+import io
+import re 										# Regular expression library
+
+# *** Global variables / invariants ***
+
+# Header that CA files start with.
+CAfontHeader = "@Font:\tCAfont:13:7\n"
+
+# Rules converting CHAT markup to CA symbols, applied in order.
+# Each rule is (Opening symbol, Closing symbol, New opening, New closing,
+# Opening offset, Closing offset, Mode) as used by chat2calite.
+# Mode 1 leaves [ʔ] alone and mode 2 restarts at nested overlap openings.
+# 'loud' and 'latch' mark the positions of the two special conversions.
+CArules = [
+	(u'ˌ',' ','.',' ',0,0,0),
+	(u'ʔ',' ','?',' ',0,0,1),
+	(u'！','.','!','.',0,0,0),
+	('<','> [?]','(',')',0,0,0),
+	('<','>[?]','(',')',0,0,0),
+	(u'▲',u'▲','>>','<<',0,0,0),
+	(u'▼',u'▼','<<','>>',0,0,0),
+	(u'☺',u'☺',u'\xa3',u'\xa3',0,0,0),
+	(u'⁎',u'⁎','#','#',0,0,0),
+	'loud',
+	('<','>[>]',u'⌈',u'⌉',0,0,2),
+	('<','>[<]',u'⌊',u'⌋',0,0,2),
+	('<','> [>]',u'⌈',u'⌉',0,0,2),
+	('<','> [<]',u'⌊',u'⌋',0,0,2),
+	(u'∆',u'∆','>','<',0,0,0),
+	(u'∇',u'∇','<','>',0,0,0),
+	('[^ ',']','((','))',0,0,0),
+	('xxx',' ','(   )',' ',0,0,0),
+	(u'∬',u'∬',u'\xb0\xb0',u'\xb0\xb0',0,0,0),
+	(u'➶',' ',u':̲',' ',0,0,0),
+	(u'➴',' ',u'̲:',' ',1,0,0),
+	'latch',
+	(u'▁',u'▁',u'↓↓',u'↓↓',0,0,0),
+	(u'▔',u'▔',u'↑↑',u'↑↑',0,0,0),
+	(u'◁',' ','<',' ',0,0,0)
+]
+
+# Dictionary of unicode symbols used in CA transcripts
+CAsymbols = {
+	"loud" : u'◉',
+	"latch" : u'≈',
+	"bullet" : u'\u0015',
+	"overlapOpen" : u'⌈',
+	"overlapAnswer" : u'⌊'
+}
+
+# Number of turns following a turn that are aligned with its overlap markers.
+overlapWindow = 30
+
+
+# *** CA file functions ***
+
+# Function that writes the CA file of a conversation.
+# Input: CA file name, List of CHAT header lines, CHAT list of the conversation.
+def writeCA(CAfilename,headers,CHATList):
+	with io.open(CAfilename,"w",encoding = 'utf-8') as outfile:
+		outfile.write(renderCA(headers,CHATList))
+
+# Function that converts a CHAT transcript to a CA transcript.
+# Input: List of CHAT header lines, CHAT list i.e. lines of the transcript
+#		ending with the @End line.
+# Returns: CA transcript string.
+def renderCA(headers,CHATList):
+	if len(CHATList) > 0 and CHATList[-1].startswith("@End"): CHATList = CHATList[:-1]
+	body = "".join(CHATList)
+	# Converting each turn with the lines that follow it.
+	turns = [convertTurn(turn) for turn in re.split(r'(?<=\n)(?=\*)',body) if turn != '']
+	tiers = splitTiers("".join(turns))
+	alignOverlaps(tiers)
+	return CAfontHeader + "".join(headers) + "".join(
+		[tier[0]+"".join(tier[1]) for tier in tiers]) + "@End\n"
+
+
+# *** Helper functions for CHAT to CA conversion ***
+
+# Function that converts the CHAT markup of a turn to CA symbols.
+# Input: Turn string i.e. a speaker line and its continuation / gap lines.
+# Returns: Converted turn string.
+def convertTurn(turn):
+	chars = list(turn)
+	for rule in CArules:
+		if rule == 'loud':
+			if CAsymbols['loud'] in chars: convertLoud(chars)
+		elif rule == 'latch': removeLatchSpaces(chars)
+		elif rule[0][0] in chars: convertPair(chars,*rule)
+	capitalizeTurns(chars)
+	removeFinalPeriods(chars)
+	return "".join(chars)
+
+# Function that replaces each opening and closing symbol pair in a turn.
+# Unmatched openings are dropped at the end of a turn and partial matches
+# skip the following character, as in chat2calite.
+def convertPair(chars,opening,closing,newOpening,newClosing,openOffset,closeOffset,mode):
+	symbols = closing[0] + '<' if mode == 2 else closing[0]
+	i = find(chars,opening[0],0)
+	while i != -1:
+		k = 1
+		while k < len(opening) and charAt(chars,i+k) == opening[k]: k += 1
+		if k < len(opening):
+			i = find(chars,opening[0],i+k+2) ; continue
+		openPos = i ; pos = find(chars,symbols,i+len(opening)) ; i = -1
+		while pos != -1:
+			# Nested overlap openings start a new pair.
+			if mode == 2 and chars[pos] == '<':
+				i = pos ; break
+			if "".join(chars[pos:pos+len(closing)]) != closing or (mode == 1
+					and charAt(chars,openPos+1) == ']' and charAt(chars,openPos-1) == '['):
+				pos = find(chars,symbols,pos+len(closing)+1) ; continue
+			chars[openPos:openPos+len(opening)] = []
+			chars[openPos+openOffset:openPos+openOffset] = newOpening
+			closePos = pos - len(opening) + len(newOpening)
+			chars[closePos:closePos+len(closing)] = []
+			chars[closePos+closeOffset:closePos+closeOffset] = newClosing
+			i = find(chars,opening[0],openPos+2) ; break
+
+# Function that capitalizes talk between two loud markers.
+def convertLoud(chars):
+	i = 0 ; found = False ; openPos = 0
+	while i < len(chars):
+		if chars[i] == CAsymbols['loud'] and not found:
+			found = True ; openPos = i ; i += 1
+		if charAt(chars,i) == '\n' and charAt(chars,i+1) == '*': found = False
+		elif found and charAt(chars,i) == CAsymbols['loud']:
+			del chars[openPos]
+			chars[openPos:i-1] = [char.upper() if 'a' <= char <= 'z' else char
+				for char in chars[openPos:i-1]]
+			del chars[i-1] ; found = False
+		i += 1
+
+# Function that attaches latch markers to the talk before and after them.
+def removeLatchSpaces(chars):
+	i = find(chars,CAsymbols['latch'],0)
+	while i != -1:
+		if charAt(chars,i-1) == ' ':
+			del chars[i-1] ; i -= 1
+		if charAt(chars,i+1) in (' ','\t'): del chars[i+1]
+		i = find(chars,CAsymbols['latch'],i+1)
+
+# Function that capitalizes the first letter of each speaker line.
+def capitalizeTurns(chars):
+	i = find(chars,':',0)
+	while i != -1:
+		if charAt(chars,i+1) != '\t':
+			i = find(chars,':',i+1) ; continue
+		j = i + 2
+		while j < len(chars):
+			if 'a' <= chars[j] <= 'z':
+				chars[j] = chars[j].upper() ; break
+			if 'A' <= chars[j] <= 'Z': break
+			if charAt(chars,j+1) == '\n':
+				j += 1 ; break
+			if charAt(chars,j+2) == '*':
+				if 'a' <= chars[j+1] <= 'z': chars[j+1] = chars[j+1].upper()
+				j += 1 ; break
+			j += 1
+		i = find(chars,':',j+1)
+
+# Function that removes periods ending talk i.e. before a timing bullet.
+def removeFinalPeriods(chars):
+	i = find(chars,'.',1)
+	while i != -1:
+		if chars[i-1] in (CAsymbols['latch'],' '):
+			j = i + 1
+			while charAt(chars,j) in (' ','\t'): j += 1
+			if charAt(chars,j) == CAsymbols['bullet']: del chars[i]
+		i = find(chars,'.',i+1)
+
+# Function that returns a character of a list or an empty string if the
+# position is outside the list.
+def charAt(chars,pos):
+	return chars[pos] if 0 <= pos < len(chars) else ''
+
+# Function that returns the first position of any of the given characters in
+# a list from a start position, or -1 if there is none.
+def find(chars,symbols,start):
+	positions = []
+	for symbol in symbols:
+		try: positions.append(chars.index(symbol,start))
+		except ValueError: pass
+	return min(positions) if len(positions) > 0 else -1
+
+# *** Helper functions for aligning overlap markers ***
+
+# Function that splits a transcript into tiers.
+# Lines that do not start a new tier are continuations of the previous tier.
+# Returns: List of [Speaker, List of characters of the tier] lists.
+def splitTiers(transcript):
+	tiers = []
+	for line in re.findall(r'[^\n]*\n|[^\n]+',transcript):
+		if line[0] in '*@%' or len(tiers) == 0:
+			speaker,tab,text = line.partition('\t')
+			tiers.append([speaker+tab,list(text)])
+		else: tiers[-1][1].extend(line)
+	return tiers
+
+# Function that indents the overlap answer markers of the turns following a
+# turn to the columns of its overlap markers.
+# When an answer cannot be moved back far enough, the overlap at the start of
+# the line is moved forward instead and the alignment starts over.
+# Turns are only aligned again once their lines, or the lines following
+# them, have changed.
+def alignOverlaps(tiers):
+	versions = [0] * len(tiers) ; aligned = {}
+	while True:
+		for count,tier in enumerate(tiers):
+			if not tier[0].startswith('*'): continue
+			window = tuple(versions[count:count+overlapWindow+1])
+			if aligned.get(count) == window: continue
+			changed = alignTurn(tiers,count,versions)
+			if changed == None: break
+			if not changed: aligned[count] = tuple(versions[count:count+overlapWindow+1])
+		else: return
+
+# Function that aligns the turns following a turn with its overlap markers.
+# Returns: True if a following line changed, False otherwise, None if the
+#		turn itself was indented.
+def alignTurn(tiers,count,versions):
+	overlaps = overlapMarkers(tiers[count][1])
+	if len(overlaps) == 0: return False
+	changed = False
+	for nxtCount in range(count+1,min(count+1+overlapWindow,len(tiers))):
+		line = tiers[nxtCount][1] ; original = list(line)
+		shift = alignAnswers(line,overlaps,tiers[count][0].lower() != tiers[nxtCount][0].lower())
+		if line != original: versions[nxtCount] += 1 ; changed = True
+		if shift != None:
+			indentLine(tiers[count][1],*shift) ; versions[count] += 1
+			return None
+		pos = find(line,CAsymbols['overlapOpen'],0)
+		while pos != -1:
+			digit = charAt(line,pos+1)
+			digit = digit if digit != '' and digit in '0123456789' else ''
+			for overlap in overlaps:
+				if overlap['digit'] == digit: overlap['closed'] = True
+			pos = find(line,CAsymbols['overlapOpen'],pos+1)
+	return changed
+
+# Function that returns the overlap markers of a turn.
+# Columns count the UTF-8 bytes of the line, as in CLAN, except for the
+# overlap markers themselves.
+# Returns: List of dictionaries with the column, line, and number of each marker.
+def overlapMarkers(line):
+	normalizeTabs(line)
+	if CAsymbols['overlapOpen'] not in line: return []
+	text = "".join(line) ; overlaps = []
+	pos = text.find(CAsymbols['overlapOpen'])
+	while pos != -1:
+		# Columns start after the tab that continuation lines begin with.
+		start = text.rfind('\n',0,pos) + 1
+		if start > 0 and text[start] == '\t': start += 1
+		before = text[start:pos] ; nxt = text[pos+1:pos+2]
+		overlaps.append({"col" : charWidth(before) - 2 * before.count(CAsymbols['overlapOpen'])
+				- (text[pos-1:pos] == CAsymbols['overlapAnswer']),
+			"line" : text.count('\n',0,pos), "digit" : nxt if nxt != '' and nxt in '0123456789' else '',
+			"used" : False, "closed" : False})
+		pos = text.find(CAsymbols['overlapOpen'],pos+1)
+	return overlaps
+
+# Function that moves the overlap answer markers of a line to the columns of
+# their overlap markers, by adding spaces before their word or removing
+# double spaces before it.
+# Input: List of line characters, List of overlap markers, Whether the line
+#		is of a different speaker.
+# Returns: None or (Line number, Number of spaces) if the line of the overlap
+#		marker needs to be indented.
+def alignAnswers(line,overlaps,otherSpeaker):
+	if len([overlap for overlap in overlaps if overlap['digit'] == '']) <= 1:
+		for overlap in overlaps: overlap['used'] = False
+	normalizeTabs(line)
+	if not otherSpeaker: return
+	pos = find(line,CAsymbols['overlapAnswer'],0) ; scanned = 0 ; col = 0
+	while pos != -1:
+		col = column(line,scanned,pos,col) ; width = charWidth(CAsymbols['overlapAnswer'])
+		nxt = charAt(line,pos+1) ; digit = nxt if nxt != '' and nxt in '0123456789' else ''
+		matches = [overlap for overlap in overlaps if not overlap['closed']
+			and not overlap['used'] and overlap['digit'] == digit]
+		if len(matches) > 0:
+			overlap = matches[0] ; width = 1
+			if digit == '': overlap['used'] = True
+			if col < overlap['col']:
+				if charAt(line,pos-1) == CAsymbols['overlapOpen']: pos -= 1 ; col -= 1
+				start = wordStart(line,pos)
+				line[start:start] = [' '] * (overlap['col'] - col)
+				pos += overlap['col'] - col ; col = overlap['col']
+			elif col > overlap['col']:
+				start = wordStart(line,pos)
+				while (start >= 2 and col > overlap['col']
+						and line[start-1] == ' ' and line[start-2] == ' '):
+					del line[start-1] ; start -= 1 ; pos -= 1 ; col -= 1
+				if col > overlap['col'] and overlap['col'] == 0:
+					return (overlap['line'],col - overlap['col'])
+		col += width ; scanned = pos + 1
+		pos = find(line,CAsymbols['overlapAnswer'],scanned)
+
+# Function that returns the column of a position of a line given the column
+# of an earlier position, with no overlap answer markers in between.
+def column(line,start,end,col):
+	text = "".join(line[start:end]) ; newline = text.rfind('\n')
+	if newline != -1: return 1 + charWidth(text[newline+1:])
+	return col + charWidth(text)
+
+# Function that replaces tabs within lines by spaces.
+# Tabs starting continuation lines are kept.
+def normalizeTabs(line):
+	pos = find(line,'\t',0)
+	while pos != -1:
+		if pos == 0 or line[pos-1] != '\n': line[pos] = ' '
+		pos = find(line,'\t',pos+1)
+
+# Function that indents a line of a tier by a number of spaces.
+def indentLine(line,lineNumber,spaces):
+	start = 0
+	for count in range(lineNumber):
+		start = line.index('\n',start) + 1
+		if charAt(line,start) == '\t': start += 1
+	line[start:start] = [' '] * spaces
+
+# Function that returns the start position of the word a position is in.
+# Words end at spaces, line ends, punctuation and timing bullets.
+def wordStart(line,pos):
+	while pos > 0 and not isSkip(line,pos-1): pos -= 1
+	return pos
+
+# Function that returns the number of columns of text i.e. its number of
+# UTF-8 bytes.
+def charWidth(text):
+	return len(text.encode('utf-8'))
+
+# Function that determines whether the character at a position ends a word.
+# Periods within pauses e.g. (0.5) or (.) do not end words.
+def isSkip(line,pos):
+	if line[pos] == '.' and isPause(line,pos): return False
+	return line[pos] in " \t\n\r\v\f,[]<>;.?!\x0e\x0f\x15"
+
+# Function that determines whether a position is within a pause.
+def isPause(line,pos):
+	start = pos ; end = pos + 1
+	while start > 0 and line[start-1] in "0123456789.:": start -= 1
+	while end < len(line) and line[end] in "0123456789.:": end += 1
+	return charAt(line,start-1) == '(' and charAt(line,end) == ')'
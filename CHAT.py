@@ -13,19 +13,20 @@
 '''
 
 
-import csv
 import sys, time, os
 from termcolor import colored					# Text coloring library
-import itertools								# Iterating dictionary
 import operator									# Sorting library
 import io
-import subprocess
 from prettytable import PrettyTable				# Table printing library
 import re 										# Regular expression library
-import shutil
+import heapq 									# Heap of turns in progress for overlap detection.
+import numpy 									# Library to have multi-dimensional homogenous arrays.
 
 # Gailbot scripts
 import timing 									# Beat / absolute timing transcription module
+import tableWriter 								# Writes CSV / Parquet / Feather tables.
+import CA 										# Generates CA files from CHAT transcripts.
+import profiling 								# Per-stage timing traces of requests.
 
 # *** Global variables / invariants ***
 
@@ -63,13 +64,6 @@ CHATheaders = {
 }
 CHATheadersOriginal = CHATheaders.copy()
 
-# Shell commands:
-shellCommands = {
-    "CHAT2CA" : "./jeffersonize chat2calite {0}",		#.format(CHATfilename)
-    "indentCA" : "./indent {0}"							#.format(CAfilename)
-}
-
-
 # Dictionary of unicode symbols used in CHAT transcripts
 CHATsymbols = {
     "latch" : u'\u2248',
@@ -321,7 +315,7 @@ def formatCHAT(infoList):
     for infoDic in infoList:
         print("Loading file: {}".format(infoDic['outputDir']+"/"+infoDic['jsonFile']))
     for action in CHAT_actions.values(): 
-        infoList = action(infoList)
+        infoList = profiling.runAction(action,infoList)
         if len(infoList) == 0: return infoList
     print(colored("\nCHAT/CA file generation completed\n",'green'))
     return infoList
@@ -333,50 +327,60 @@ def formatCHAT(infoList):
 # Input: Dictionay containing perocessed file information
 def commentMarkers(infoList):
     for infoDic in infoList:
-        for elem in infoDic['jsonList'][1:]:
-            if elem[3].find("%HESITATION") != -1:
-                elem[3]=elem[3].replace("%HESITATION","uhm")
+        transcript = infoDic['jsonList'].transcript
+        transcript[:] = [word.replace("%HESITATION","uhm") for word in transcript]
     return infoList
 
 
 # Function that constructs turn per individual CSV file based on turn construction 
 # thresholds.
+# Successive words of the same speaker are one turn unless the gap between
+# them is greater than the turn end threshold.
 # Input: Dictionay containing perocessed file information
 def constructTurn(infoList):
     for infoDic in infoList:
-        newList = [] ; count = 0 ; changed = False
-        jsonList = infoDic['jsonList'][1:]
-        jsonList = [elem[:4] for elem in jsonList]				# Extracting transcription relevent data.
-        while count < len(jsonList) - 1:
-            curr = jsonList[count] ; nxt = jsonList[count+1]
-            if nxt[1] - curr[2] <= CHATVals['turnEndThreshold'] and curr[0] == nxt[0]:
-                changed = True
-                jsonList[count] = [curr[0],curr[1],nxt[2],curr[3]+" "+nxt[3]]
-                del jsonList[count+1]
-            else: count +=1
-        infoDic['jsonListTurns'] = jsonList
+        table = infoDic['jsonList']
+        if len(table) == 0: infoDic['jsonListTurns'] = [] ; continue
+        # Index of the first and last word of every turn.
+        joined = ((table.start[1:] - table.end[:-1] <= CHATVals['turnEndThreshold'])
+            & (table.speaker[1:] == table.speaker[:-1]))
+        boundaries = numpy.flatnonzero(~joined) + 1
+        firsts = numpy.concatenate(([0],boundaries))
+        lasts = numpy.concatenate((boundaries,[len(table)])) - 1
+        transcript = table.transcript.tolist()
         # Removing extra period markers
-        for elem in jsonList: elem[3]=elem[3].translate({ord('.'):None}) 
+        jsonList = [[speaker,start,end," ".join(transcript[first:last+1]).translate({ord('.'):None})]
+            for speaker,start,end,first,last in zip(table.speaker[firsts].tolist(),
+                table.start[firsts].tolist(),table.end[lasts].tolist(),firsts,lasts)]
+        infoDic['jsonListTurns'] = jsonList
     return infoList
 
 # directories are grouped.
+# Files are grouped by output directory in one pass, in order of appearance.
+# Malformed groups are reported i.e. the same audio file listed more than once,
+# which is only transcribed once, or separate speaker streams that do not
+# contain exactly one speaker each.
 # Input: list of individual dictionaries
 # Output: list of lists containing dictionaries.
 def groupDictionaries(infoList):
-    newInfo = [];dirs = []
-    if len(infoList) == 1: newInfo.append([infoList[0]])
-        # Generating all possible combinations of items in infoList
-    for a,b in itertools.combinations(infoList,2):
-        if a['outputDir'] == b['outputDir']:
-            newInfo.append([a,b]);dirs.append(a['outputDir'])
-    for a,b in itertools.combinations(infoList,2):
-        if a['outputDir'] not in dirs: 
-            newInfo.append([a]);dirs.append(a['outputDir'])
-        if b['outputDir'] not in dirs: 
-            newInfo.append([b]);dirs.append(b['outputDir'])
+    groups = {}
+    for infoDic in infoList: groups.setdefault(infoDic['outputDir'],[]).append(infoDic)
+    newInfo = []
+    for outputDir,item in groups.items():
+        unique = [];audioFiles = set()
+        for dic in item:
+            if dic['audioFile'] in audioFiles: continue
+            unique.append(dic);audioFiles.add(dic['audioFile'])
+        if len(unique) < len(item):
+            print(colored("Malformed group: {} lists an audio file more than once".format(outputDir),'red'))
+            item = unique
+        if len(item) > 1 and any(len(dic['names']) != 1 for dic in item):
+            print(colored("Malformed group: {} combines files that do not have "
+                "exactly one speaker each".format(outputDir),'red'))
+        newInfo.append(item)
     return newInfo
 
-# Function that builds a combined transcript for both speakers.
+# Function that builds a combined transcript for all speakers.
 # Useful in case audio was analyzed on separate streams
 # Input: list of lists containing dictionaries.
 # Output : list of lists containing dictionaries.
@@ -385,43 +389,90 @@ def combineTranscripts(infoList):
         jsonListCombined = []
         if len(item) == 1: 
             item[0]['jsonListCombined'] = item[0]['jsonListTurns'];continue
-        for list1 in item[0]['jsonListTurns']: jsonListCombined.append(list1)
-        for list2 in item[1]['jsonListTurns']: jsonListCombined.append(list2)
+        for dic in item: jsonListCombined.extend(dic['jsonListTurns'])
         jsonListCombined=sorted(jsonListCombined, key = operator.itemgetter(1))
         for dic in item: dic['jsonListCombined'] = jsonListCombined
     return infoList
 
 # Function that transcribes overlaps
+# Every pair of overlapping turns is marked, including turns that overlap
+# turns other than the next one. Marker positions are found on the unmarked
+# turns and the spans of each turn are merged before the markers are added,
+# so that markers are never nested.
 # Input: list of lists containing dictionaries.
 # Output : list of lists containing dictionaries.
 def overlaps(infoList):
-    markerLimit = 4 										# Minimum number of chars to have a marker
     for item in infoList:
-        newList = []
-        jsonListCombined = item[0]['jsonListCombined']
-        for count,curr in enumerate(jsonListCombined[:-1]):
-            nxt = jsonListCombined[count+1]
-            if curr[2] > nxt[1]:
-                pos = overlapPositions(curr,nxt)			# Getting overlap marker positions
-                # Not adding markers if difference is below limit
-                if (abs(pos['posXcurr'] - pos['posYcurr']) <= markerLimit
-                    or abs(pos['posXnxt'] - pos['posYnxt']) <= markerLimit):
-                    newList.append(curr);continue
-                # Not adding markers if there is no character within limit
-                # Not adding markers encompassing comments.
-                if (not re.search('[a-zA-Z]',curr[3][pos['posXcurr']:pos['posYcurr']])
-                    or not re.search('[a-zA-Z]',curr[3][pos['posXcurr']:pos['posYcurr']])):
-                    newList.append(curr);continue
-                # Adding overlap markers
-                newCurrTrans = curr[3][:pos['posXcurr']] +' < ' + curr[3][pos['posXcurr']:]
-                curr[3] = (newCurrTrans[:pos['posYcurr']] + ' > [>] ' + newCurrTrans[pos['posYcurr']:]).rstrip()
-                newNxtTrans = nxt[3][:pos['posXnxt']] +' < ' + nxt[3][pos['posXnxt']:]
-                nxt[3] = (newNxtTrans[:pos['posYnxt']] + ' > [<] ' + newNxtTrans[pos['posYnxt']:]).rstrip()
-            newList.append(curr)
-        newList.append(jsonListCombined[-1])
-        for dic in item: dic['jsonListCombined'] = newList
+        jsonListCombined = item[0]['jsonListCombined'] ; spans = {}
+        for first,second in overlappingPairs(jsonListCombined):
+            pairSpans = overlapSpans(jsonListCombined[first],jsonListCombined[second])
+            if pairSpans == None: continue
+            firstSpans = spans.setdefault(first,[]) ; secondSpans = spans.setdefault(second,[])
+            # Pairs whose spans cross a span of the other marker are not marked.
+            if (not fitsOverlapSpan(firstSpans,pairSpans[0],'[>]')
+                or not fitsOverlapSpan(secondSpans,pairSpans[1],'[<]')): continue
+            addOverlapSpan(firstSpans,pairSpans[0],'[>]')
+            addOverlapSpan(secondSpans,pairSpans[1],'[<]')
+        for index,turnSpans in spans.items():
+            jsonListCombined[index][3] = addOverlapMarkers(jsonListCombined[index][3],turnSpans)
+        for dic in item: dic['jsonListCombined'] = jsonListCombined
     return infoList	
 
+# Function that finds all pairs of overlapping turns with a sweep line over
+# the turns in start time order.
+# Input: List of turns sorted by start time.
+# Returns: List of (first,second) index pairs sorted by first then second index.
+def overlappingPairs(turns):
+    pairs = [] ; active = []								# Heap of (end time, index) of turns in progress.
+    for count,turn in enumerate(turns):
+        while len(active) > 0 and active[0][0] <= turn[1]: heapq.heappop(active)
+        pairs.extend((index,count) for end,index in active)
+        heapq.heappush(active,(turn[2],count))
+    pairs.sort()
+    return pairs
+
+# Function that finds the overlapping part of two overlapping turns.
+# Input: Earlier and later turn list
+# Returns: (start,end) character positions in the earlier and later turn,
+#           or None if the overlap is too short to be marked.
+def overlapSpans(curr,nxt):
+    markerLimit = 4 										# Minimum number of chars to have a marker
+    pos = overlapPositions(curr,nxt)			# Getting overlap marker positions
+    # Not adding markers if difference is below limit
+    if (abs(pos['posXcurr'] - pos['posYcurr']) <= markerLimit
+        or abs(pos['posXnxt'] - pos['posYnxt']) <= markerLimit):
+        return None
+    # Not adding markers if there is no character within limit
+    # Not adding markers encompassing comments.
+    if (not re.search('[a-zA-Z]',curr[3][pos['posXcurr']:pos['posYcurr']])
+        or not re.search('[a-zA-Z]',curr[3][pos['posXcurr']:pos['posYcurr']])):
+        return None
+    # End positions include the opening marker, which is not added yet.
+    return ((pos['posXcurr'],pos['posYcurr']-3),(pos['posXnxt'],pos['posYnxt']-3))
+
+# Function that checks that a span does not cross a span of another marker.
+# Input: Spans of a turn, (start,end) span, Marker i.e. [>] or [<]
+def fitsOverlapSpan(turnSpans,span,marker):
+    return not any(other[2] != marker and span[0] < other[1] and other[0] < span[1]
+        for other in turnSpans)
+
+# Function that adds a span to the spans of a turn, merging it with the
+# spans of the same marker it crosses.
+# Input: Spans of a turn, (start,end) span, Marker i.e. [>] or [<]
+def addOverlapSpan(turnSpans,span,marker):
+    start,end = span
+    for other in [other for other in turnSpans if start < other[1] and other[0] < end]:
+        start = min(start,other[0]) ; end = max(end,other[1]) ; turnSpans.remove(other)
+    turnSpans.append([start,end,marker])
+
+# Function that adds overlap markers around the spans of a turn.
+# Input: Turn transcript, List of [start,end,marker] spans that do not cross.
+# Returns: Marked transcript.
+def addOverlapMarkers(trans,turnSpans):
+    for start,end,marker in sorted(turnSpans,reverse=True):
+        trans = trans[:start] + ' < ' + trans[start:end] + ' > ' + marker + ' ' + trans[end:]
+    return trans.rstrip()
+
 
 # Function that adds pause markers to the combined speaker transcripts.
 # Pauses added to combined list to prevent end of line pause transcriptions.
@@ -503,6 +554,13 @@ def CHATList(infoList):
     return infoList
 
 
+# Function that returns a header value for a speaker.
+# Speakers after the second use the default values of the second speaker.
+# Input: Speaker position, Header name i.e. Role or Gender.
+def speakerHeader(count,header):
+    key = "speaker{0}{1}".format(min(count+1,2),header)
+    return CHATheaders[key] if count < 2 else CHATheadersOriginal[key]
+
 # Function that writes a CHAT file
 # Input: list of lists containing dictionaries.
 # Output : list of lists containing dictionaries.
@@ -513,8 +571,8 @@ def buildCHAT(infoList):
         if len(item) == 1: 
             if len(item[0]['names']) == 2: names = ([item[0]['names'][0].upper(),item[0]['names'][1].upper()])
             elif len(item[0]['names']) == 1: names = ([item[0]['names'][0].upper(),item[0]['names'][0].upper()])
-        elif len(item) == 2: names = ([item[0]['names'][0].upper(),item[1]['names'][0].upper()])
-        speakerID = [names[0][0:3].upper(),names[1][0:3].upper()]
+        else: names = [dic['names'][0].upper() for dic in item]
+        speakerID = [name[0:3].upper() for name in names]
         if item[0]['audioFile'][:item[0]['audioFile'].find('.')].find('/') == -1:
             audioName = item[0]['audioFile'][:item[0]['audioFile'].find('.')]
         else:
@@ -525,14 +583,13 @@ def buildCHAT(infoList):
         else: timingMode = "Absolute timing mode: Pauses/Gaps in seconds"
         headers = [
             "@Begin\n@Languages:\t{0}\n".format(CHATheaders['language']),
-            "@Participants:\t{0} {1} {2}, {3} {4} {5}\n".format(
-                speakerID[0],names[0],CHATheaders['speaker1Role'],
-                speakerID[1],names[1],CHATheaders['speaker2Role']),
-            "@Options:\tCA\n",
-            "@ID:\t{0}|{1}|{4}||{2}|||{3}|||\n".format(CHATheaders['language'],CHATheaders['corpusName'],
-                CHATheaders['speaker1Gender'],CHATheaders['speaker1Role'],speakerID[0]),
+            "@Participants:\t{0}\n".format(", ".join("{0} {1} {2}".format(
+                speakerID[count],names[count],speakerHeader(count,'Role'))
+                for count in range(len(names)))),
+            "@Options:\tCA\n"] + [
             "@ID:\t{0}|{1}|{4}||{2}|||{3}|||\n".format(CHATheaders['language'],CHATheaders['corpusName'],
-                CHATheaders['speaker2Gender'],CHATheaders['speaker2Role'],speakerID[1]),
+                speakerHeader(count,'Gender'),speakerHeader(count,'Role'),speakerID[count])
+                for count in range(len(names))] + [
             "@Media:\t{0},audio\n".format(audioName),
             "@Comment:\t{0}\n".format(timingMode),
             "@Transcriber:\tGailbot 0.3.0\n",		
@@ -555,35 +612,23 @@ def buildCHAT(infoList):
             print(colored("\nCHAT file generation FAILED",'red'))
             print("Directory or file not found\n")
             return []
-        # Adding CHAT filename to item list.
-        for elem in item:elem['CHATfilename'] = CHATfilename
+        # Adding CHAT filename and headers to item list.
+        for elem in item:
+            elem['CHATfilename'] = CHATfilename ; elem['CHATheaderList'] = headers
     return infoList
 
-# Function that creates a CA file by running shell commands on the created CHAT file.
+# Function that creates a CA file from the CHAT transcript.
 # Input: list of lists containing dictionaries.
 # Output : list of lists containing dictionaries.
 def buildCA(infoList):
     for item in infoList:
         CHATfilename = item[0]['CHATfilename']
         CAfilename = CHATfilename[:CHATfilename.find('.')]+'.S.ca'
-        indentFilename = CAfilename[:CAfilename.rfind('.')]+'.indnt.cex'
-        # Redirecting shell output to null
-        devnull = open(os.devnull, 'w')
-        # Creating CA file 
-        cmd_CA = shellCommands['CHAT2CA'].format(CHATfilename)
-        try: subprocess.check_call(cmd_CA,shell=True,stderr=devnull,stdout=devnull)
-        except subprocess.CalledProcessError: 
-            print(colored("\nCHAT to CAlite conversion: FAILED",'red'))
-            print("Missing executable: jeffersonize\n")
-        # Indenting the CA file
-        cmd_indent = shellCommands['indentCA'].format(CAfilename)
-        val = indent(item[0]['outputDir'],CAfilename[CAfilename.rfind('/')+1:])
-        if not val: return []
-        # Renaming the files
-        try:
-            os.remove(CAfilename)
-            os.rename(indentFilename,CAfilename)
-        except: pass
+        try: CA.writeCA(CAfilename,item[0]['CHATheaderList'],item[0]['CHATList'])
+        except FileNotFoundError:
+            print(colored("\nCA file generation FAILED",'red'))
+            print("Directory or file not found\n")
+            return []
     return infoList
 
 
@@ -594,13 +639,11 @@ def writeCSVs(infoList):
     for item in infoList:
         currItem = item[0]
         csvName = currItem['CHATfilename'][:currItem['CHATfilename'].find('.')]+'.csv'
-        currItem['jsonListCombined'].insert(0,CSVfields)
-        try: writer = csv.writer(open(csvName, 'w'))
+        try: tableWriter.writeRows(csvName,CSVfields,currItem['jsonListCombined'])
         except FileNotFoundError:
             print(colored("\nCHAT file generation FAILED",'red'))
             print("Directory or file not found\n")
             return False
-        writer.writerows(currItem['jsonListCombined'])
     return infoList
 
 
@@ -704,24 +747,6 @@ def overlapPositions(curr,nxt):
 # Lambda function to calculate the pverlap positions
 overlapPos =lambda diff,Len,transLen : int(round((((abs(diff)/Len))*transLen)))
 
-# Function that copies the indent script to the generated folder and runs it
-# Used because Talkbank's indent script does NOT work for subdirectories.
-# Returns None if exe is not found.
-def indent(outputDir,CAfilename):
-    import sys 
-    shutil.copy('indent',outputDir)
-    cmd_indent = shellCommands['indentCA'].format(CAfilename)
-    devnull = open(os.devnull, 'w')
-    try: 
-        subprocess.check_call(cmd_indent,shell=True,cwd=outputDir,stderr=devnull,
-            stdout=devnull) ; os.remove(outputDir+'/indent')
-    except subprocess.CalledProcessError: 
-        print(colored("\nCA file indentation: FAILED",'red'))
-        print("Missing executable: indent\n")
-        os.remove(outputDir+'/indent')
-        return False
-    return True
-
 
 
 
@@ -35,6 +35,11 @@ from autobahn.twisted.websocket import WebSocketClientProtocol, \
     WebSocketClientFactory, connectWS
 from twisted.python import log	
 from twisted.internet import ssl, reactor
+from twisted.internet.interfaces import IPushProducer
+from zope.interface import implementer
+
+# Gailbot scripts
+import transcriptCache 				# Cached results of previous requests.
 
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
@@ -51,7 +56,12 @@ opt_out_key = "X-Watson-Learning-Opt-Out"			# Opt out key for header sent to STT
 Watson_token_key = "X-Watson-Authorization-Token"	# Key for using Watson instead of access tokens for authentication.
 Access_token_key = "Authorization"					# Key for using Watson access tokens for authentication.
 
-Audio_chunk_size_bytes = 2000						# Size of Audio Sample that can be sent to Watson in one message.
+Audio_chunk_size_bytes = 64000						# Size of Audio Sample that can be sent to Watson in one message.
+
+# Set True to keep only final results and speaker labels, written to the json
+# file as newline-delimited json while they are recieved.
+# Otherwise all results, including interim results, are written on completion.
+finalResultsOnly = True
 
 # Output information tuple
 outputInfo = []
@@ -154,6 +164,71 @@ class WSInterfaceFactory(WebSocketClientFactory):
 
 
 
+# Writes final results and speaker labels to the json file as newline-delimited
+# json while they are recieved. Interim results are discarded.
+class ResultWriter:
+
+	'''
+		file : Open json file.
+	'''
+	def __init__(self,path,json_output=()):
+		self.file = open(path,'w')
+		for jsonObject in json_output: self.append(jsonObject)
+
+	# Function that writes a message unless it is an interim result.
+	def append(self,jsonObject):
+		if 'results' in jsonObject and not jsonObject['results'][0]['final']: return
+		self.file.write(json.dumps(jsonObject,sort_keys=True) + "\n")
+		self.file.flush()
+
+	def close(self):
+		self.file.close()
+
+
+# Streams an audio file to the service one chunk at a time.
+# Registered with the connection transport, which pauses the producer when its
+# write buffer is full and resumes it once the buffer has drained.
+@implementer(IPushProducer)
+class AudioProducer:
+
+	'''
+		protocol : Client protocol the audio is sent over.
+		audioFile : Open audio file being sent.
+		chunkSize : Size of audio chunk being sent to Watson.
+		paused : Indicates if the transport has paused the producer.
+	'''
+	def __init__(self,protocol,sampleName,chunkSize):
+		self.protocol = protocol
+		self.audioFile = open(str(sampleName),'rb')
+		self.chunkSize = chunkSize
+		self.paused = False
+
+	# Function that sends chunks until the transport pauses the producer or
+	# the complete audio has been sent.
+	def resumeProducing(self):
+		self.paused = False
+		while not self.paused and self.audioFile != None:
+			chunk = self.audioFile.read(self.chunkSize)
+			# Empty message marks the end of the audio sample.
+			if len(chunk) == 0:
+				self.protocol.sendMessage(b'',isBinary=True)
+				self.protocol.transport.unregisterProducer()
+				self.stopProducing()
+				return
+			self.protocol.bytesSent += len(chunk)				# Updating the bytes sent to server.
+			self.protocol.sendMessage(chunk,isBinary=True)
+
+	def pauseProducing(self):
+		self.paused = True
+
+	# Function that closes the audio file.
+	def stopProducing(self):
+		self.paused = True
+		if self.audioFile != None:
+			self.audioFile.close()
+			self.audioFile = None
+
+
 # WebSockets interface to the STT service
 # Object is created for every Websocket connection.
 class WSInterfaceProtocol(WebSocketClientProtocol):
@@ -178,6 +253,7 @@ class WSInterfaceProtocol(WebSocketClientProtocol):
 		self.json_output = []								# List of all json outputs recieved.
 		self.chunkSize = Audio_chunk_size_bytes
 		self.bytesSent = 0
+		self.producer = None
 		self.customization_weight = customization_weight
 		self.custom = custom
 		self.resultIndex = 0
@@ -191,35 +267,11 @@ class WSInterfaceProtocol(WebSocketClientProtocol):
 		self.dirOutput = audioSampleInfo[2]
 		self.sampleNumber = audioSampleInfo[1]
 		self.sampleName = audioSampleInfo[0]
-		if self.sampleName.find('/') == -1:
-			self.jsonFile = self.sampleName[:self.sampleName.rfind(".")]+"-json.txt"
-		else:
-			name = self.sampleName[self.sampleName.rfind('/')+1:]
-			self.jsonFile = name[:name.rfind(".")]+"-json.txt"
+		self.jsonFile = jsonFileName(self.sampleName)
 		# Removing json file data will be written to if it already exists.
 		try : os.remove(self.dirOutput + "/" +self.jsonFile)
 		except OSError : pass
-
-	# Function that deals with the amount of audio sent per message. (Helper function)
-	# Audio is chunked and callback function is used.
-	def checkChunk(self,data):
-		# Function that sends a chunk of audio to the server
-		def sendChunk(chunk,final=False):
-			self.bytesSent += len(chunk)						# Updating the bytes sent to server.
-			self.sendMessage(chunk,isBinary = True)
-			# If this is the final chunk that is part of one audio sample.
-			if final: self.sendMessage(b'',isBinary=True)
-
-		if (self.bytesSent+self.chunkSize >= len(data)):
-			# Sending Final chunk
-			if (len(data) > self.bytesSent):
-				sendChunk(data[self.bytesSent:len(data)],True)
-				return
-		# Sending intermediate chunks
-		sendChunk(data[self.bytesSent:self.bytesSent+self.chunkSize])
-		# Calls the defined function at time x in the future.
-		self.factory.reactor.callLater(0.01,self.checkChunk,data=data)
-		return 
+		if finalResultsOnly: self.json_output = ResultWriter(self.dirOutput + "/" +self.jsonFile)
 
 	# Function that handles data recieved from the server during handshake.
 	def onConnect(self, response):
@@ -233,32 +285,15 @@ class WSInterfaceProtocol(WebSocketClientProtocol):
 	# possible.
 	def onOpen(self):
 		print("Opening API Connection")
-		# Setting labels off for non standrd base_model
-		if self.base_model not in IDModels:labels = False
-		else: labels = True
-		params = {
-			"action":"start",												# Sent as initialization to Watson
-			"continuous" : True,											# Prevents timeout due to inactivity.
-			"audio_metrics":True,											# Returns signal characteristics of data
-			"content-type": str(self.contentType),							# Specifies format of audio data sent.
-			"inactivity_timeout": 600,										# Time (seconds) of no audio after which service terminates request
-			"interim_results": True,										# Service returns intermediate results
-			'max_alternatives': 1,											# The number of alternative results recieved.
-			"processing_metrics": True,										# Detailed service analysis notes
-			"profanity_filter":False,										# Profanity
-			"timestamps":True,												# Word timing data
-			"speaker_labels":labels,										# Labels to identify diffenrent individuals in conversation
-			'word_confidence': True,										# Confidence values for the words
-		}
-		# Adding customization weight only if custom model is being used.
-		if self.custom : params["customization_weight"] = float(self.customization_weight)
+		params = recognitionParams(self.contentType,self.base_model,self.custom,
+			self.customization_weight)
 		# Intitial data/parameters sent on handshake completion as json string.
 		self.sendMessage(json.dumps(params).encode('utf8'))
-		# Audio data sent to and buffered in server.
-		with open(str(self.sampleName),'rb') as f:			
-			self.bytesSent = 0
-			audioFile = f.read()
-		self.checkChunk(audioFile)
+		# Audio data streamed to and buffered in server.
+		self.bytesSent = 0
+		self.producer = AudioProducer(self,self.sampleName,self.chunkSize)
+		self.transport.registerProducer(self.producer,True)
+		self.producer.resumeProducing()
 
 	# Callback fired when a complete WebSocket message was recieved.
 	def onMessage(self,payload,isBinary):
@@ -274,43 +309,20 @@ class WSInterfaceProtocol(WebSocketClientProtocol):
 			# A total of two {'state' : value } JSON objects are sent for a single request.
 			# The second indicates end of resukts for audio sent.
 			if self.listening_state_count == 2: self.sendClose(1000)
-		# Recieving results from service
-		elif 'results' in jsonObject:
-			# Return if all the length of the audio has been seen by the engine
-			if 'processing_metrics' in jsonObject['results'][0]:
-				r = jsonObject['results'][0]['processing_metrics']['processed_audio']['received']
-				s = jsonObject['results'][0]['processing_metrics']['processed_audio']['seen_by_engine']
-				if float(r) == float(s):
-					return
-			# Empty transcription
-			if len(jsonObject['results']) == 0: print("Empty transcipt returned")
-			# Normal transcript
-			else:
-				# Dumping result to list
-				self.json_output.append(jsonObject)
-				bFinal = (jsonObject['results'][0]['final'] == True)				# Case when final results recieved.
-				trans = jsonObject['results'][0]['alternatives'][0]['transcript']	# Transcript recieved.
-				if bFinal: pass
-				else: 
-					# Indicating message recieved on stdout.
-					sys.stdout.write('.')
-					sys.stdout.flush()
-		elif 'speaker_labels' in jsonObject or 'result_index' in jsonObject:
-			self.json_output.append(jsonObject)
-
-
-		# Printing an error message if it exists
-		if 'error' in jsonObject:
-			print("\nServer error encountered\nDetails: {}\n".format(jsonObject['error']))
+		# Recieving results / speaker labels from service
+		else: processMessage(jsonObject,self.json_output)
 
 	# Callback fired when the WebSocket Connection has closed.
 	def onClose(self, wasClean, code, reason):
+		# Closing the audio file if the connection closed while sending.
+		if self.producer != None: self.producer.stopProducing()
 		print("\nClosing API WebSocket connection")
 		print('Websocket Connection closed:\n\tCode: {0}\n\tReason: {1}\n'
 		'\twasClean: {2}'.format(code,reason,wasClean))
 		# Dumping results to a json file.
 		print("Data dumped: {}".format(self.dirOutput + "/"+ self.jsonFile))
-		with open(self.dirOutput + "/" +self.jsonFile,"a") as f: f.write(json.dumps(self.json_output, indent=4,sort_keys=True))
+		if finalResultsOnly: self.json_output.close()
+		else: writeResults(self.dirOutput + "/" +self.jsonFile,self.json_output)
 
 		# Adding file info to output information dictionary
 		dic = {"outputDir" : self.dirOutput,
@@ -355,6 +367,132 @@ def verifyFiles(audio_files):
 		else: newList.append(file)
 	return newList
 
+# Function that returns the name of the json output file for an audio file.
+def jsonFileName(sampleName):
+	name = sampleName[sampleName.rfind('/')+1:]
+	return name[:name.rfind(".")]+"-json.txt"
+
+# Function that returns the parameters sent to Watson when a recognition starts.
+def recognitionParams(contentType,base_model,custom,customization_weight):
+	# Setting labels off for non standrd base_model
+	if base_model not in IDModels:labels = False
+	else: labels = True
+	params = {
+		"action":"start",												# Sent as initialization to Watson
+		"continuous" : True,											# Prevents timeout due to inactivity.
+		"audio_metrics":True,											# Returns signal characteristics of data
+		"content-type": str(contentType),								# Specifies format of audio data sent.
+		"inactivity_timeout": 600,										# Time (seconds) of no audio after which service terminates request
+		"interim_results": True,										# Service returns intermediate results
+		'max_alternatives': 1,											# The number of alternative results recieved.
+		"processing_metrics": True,										# Detailed service analysis notes
+		"profanity_filter":False,										# Profanity
+		"timestamps":True,												# Word timing data
+		"speaker_labels":labels,										# Labels to identify diffenrent individuals in conversation
+		'word_confidence': True,										# Confidence values for the words
+	}
+	# Adding customization weight only if custom model is being used.
+	if custom : params["customization_weight"] = float(customization_weight)
+	return params
+
+# Function that writes a list of json outputs to the json file.
+def writeResults(path,json_output):
+	if finalResultsOnly: ResultWriter(path,json_output).close()
+	else:
+		with open(path,"w") as f: f.write(json.dumps(json_output, indent=4,sort_keys=True))
+
+# Function that reads the json outputs from a json file.
+# Reads both a json list and newline-delimited json.
+def readResults(path):
+	with open(path) as f:
+		if f.read(1) == '[': 
+			f.seek(0) ; return json.load(f)
+		f.seek(0)
+		return [json.loads(line) for line in f if len(line.strip()) > 0]
+
+# Function that writes the cached results of audio files to their json files.
+# Input: Audio files, Output directory dictionary, Speaker names dictionary,
+# Cache key dictionary.
+# Returns: Output information dictionaries of the cached files.
+def loadCached(audio_files,out_dir,names,keys):
+	cached = []
+	for fileName in audio_files:
+		json_output = transcriptCache.lookup(keys[fileName])
+		if json_output == None: continue
+		print(colored("Using cached transcript: {}".format(fileName),'green'))
+		jsonFile = jsonFileName(fileName)
+		writeResults(out_dir[fileName] + "/" + jsonFile,json_output)
+		cached.append({"outputDir" : out_dir[fileName],
+				"jsonFile" : jsonFile,
+				"audioFile" : fileName,
+				"names" : names[fileName],
+				"delete" : False})
+	return cached
+
+# Function that adds the results of completed transcriptions to the cache.
+# Files without any results are not cached.
+# Input: Output information dictionaries, Cache key dictionary.
+def storeCached(outputInfo,keys):
+	for dic in outputInfo:
+		if dic['delete'] or dic['audioFile'] not in keys: continue
+		json_output = readResults(dic['outputDir'] + "/" + dic['jsonFile'])
+		if not any(['results' in jsonObject for jsonObject in json_output]): continue
+		transcriptCache.store(keys[dic['audioFile']],dic['audioFile'],json_output)
+
+# Function that records a non-state message recieved from the service.
+# Input: Parsed message, List of json outputs or ResultWriter for the audio file.
+def processMessage(jsonObject,json_output):
+	# Recieving results from service
+	if 'results' in jsonObject:
+		# Empty transcription
+		if len(jsonObject['results']) == 0: print("Empty transcipt returned") ; return
+		# Return if all the length of the audio has been seen by the engine
+		if 'processing_metrics' in jsonObject['results'][0]:
+			r = jsonObject['results'][0]['processing_metrics']['processed_audio']['received']
+			s = jsonObject['results'][0]['processing_metrics']['processed_audio']['seen_by_engine']
+			if float(r) == float(s):
+				return
+		# Dumping result to list
+		json_output.append(jsonObject)
+		# Indicating interim message recieved on stdout.
+		if not jsonObject['results'][0]['final']:
+			sys.stdout.write('.')
+			sys.stdout.flush()
+	elif 'speaker_labels' in jsonObject or 'result_index' in jsonObject:
+		json_output.append(jsonObject)
+	# Printing an error message if it exists
+	if 'error' in jsonObject:
+		print("\nServer error encountered\nDetails: {}\n".format(jsonObject['error']))
+
+# Function that returns the headers used to authenticate a request.
+# Sets the IBM_HOST based on the region.
+def requestHeaders(username,password,opt_out,watson_token,region):
+	# Initializing Headers passed to Watson STT as part of request.
+	headers = {opt_out_key : '1'} if opt_out else {}
+
+	# Setting the IBM_HOST based on the Region
+	global IBM_HOST
+	IBM_HOST = REGION_MAP[region]
+
+	# Authenticating using Watson tokens.
+	if watson_token == 1:
+		headers[Watson_token_key] = (Utilities.getAuthenticationToken(
+			'https://'+IBM_HOST,STT_service,username,password))
+	else:
+	# Authenticating using Access tokens tokens.
+		auth = username + ":" + password
+		headers[Access_token_key] = "Basic " + base64.urlsafe_b64encode(auth.encode('UTF-8')).decode('ascii')	# Encoding token in base 64
+	return headers
+
+# Function that returns the recognize url including custom model ids.
+def requestURL(base_model,language_id,acoustic_id):
+	# Creating and adding additional parameters to request url.
+	fmt = "wss://{0}/{1}/api/v1/recognize?model={2}"
+	url = fmt.format(IBM_HOST,STT_service,base_model)
+	if language_id != None: url += '&language_customization_id={}'.format(language_id)		# Adding custom language model id.
+	if acoustic_id != None: url += '&acoustic_customization_id={}'.format(acoustic_id)		# Adding custom acoustic model id.
+	return url
+
 # Main function that interacts with Watson STT
 '''
 	out_dir = output directory name dictionary (Filename : Directory)
@@ -394,27 +532,18 @@ def run(username,password,out_dir,base_model,acoustic_id,language_id,
 		print("ERROR: Audio file does not exist")
 		return
 
-	# Initializing Headers passed to Watson STT as part of request.
-	headers = {opt_out_key : '1'} if opt_out else {}
-
-	# Setting the IBM_HOST based on the Region
-	global IBM_HOST
-	IBM_HOST = REGION_MAP[region]
-
-	# Authenticating using Watson tokens.
-	if watson_token == 1:
-		headers[Watson_token_key] = (Utilities.getAuthenticationToken(
-			'https://'+IBM_HOST,STT_service,username,password))
-	else:
-	# Authenticating using Access tokens tokens.
-		auth = username + ":" + password
-		headers[Access_token_key] = "Basic " + base64.urlsafe_b64encode(auth.encode('UTF-8')).decode('ascii')	# Encoding token in base 64
-
-	# Creating and adding additional parameters to request url.
-	fmt = "wss://{0}/{1}/api/v1/recognize?model={2}"
-	url = fmt.format(IBM_HOST,STT_service,base_model)
-	if language_id != None: url += '&language_customization_id={}'.format(language_id)		# Adding custom language model id.																		# Set if a custom language model for customization weight.
-	if acoustic_id != None: url += '&acoustic_customization_id={}'.format(acoustic_id)		# Adding custom acoustic model id.
+	# Using cached results instead of sending the same audio again.
+	keys = {fileName : transcriptCache.cacheKey(fileName,base_model,language_id,
+		acoustic_id,customization_weight) for fileName in audio_files}
+	cached = loadCached(audio_files,out_dir,names,keys)
+	audio_files = [fileName for fileName in audio_files
+		if fileName not in [dic['audioFile'] for dic in cached]]
+	if len(audio_files) == 0:
+		print(colored("\nTranscription process completed\n",'green'))
+		return cached
+
+	headers = requestHeaders(username,password,opt_out,watson_token,region)
+	url = requestURL(base_model,language_id,acoustic_id)
 	if language_id != None: custom = True 													# Indicating if custom weight used.
 	else : custom = False
 
@@ -444,6 +573,8 @@ def run(username,password,out_dir,base_model,acoustic_id,language_id,
 	# Moves the reactor to running state.
 	# Twisted Reactor library python: https://twistedmatrix.com/documents/current/api/twisted.internet.interfaces.IReactorCore.html
 	reactor.run()
+	storeCached(outputInfo,keys)
+	outputInfo.extend(cached)
 
 	# Returning information dictionary
 	print(colored("\nTranscription process completed\n",'green'))
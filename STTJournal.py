@@ -0,0 +1,80 @@
+'''
+	Script that keeps a journal of the transcription jobs in an output directory.
+	Each line of the journal is a json record of the state of one audio file
+	i.e. started, checkpoint, completed or failed, along with the last final
+	result index and the audio offset (seconds) the final results cover.
+	Records are only ever appended, so the journal survives interrupted runs.
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 5/25/19
+'''
+
+import json                        		# json
+import os                          		# for listing directories
+import time 							# Timing library
+
+# *** Global variables / invariants ***
+
+# Name of the journal file in each output directory.
+journalFileName = ".stt-journal.jsonl"
+
+
+# *** Journal functions ***
+
+# Function that returns the path of the journal in an output directory.
+def journalPath(outputDir):
+	return os.path.join(outputDir,journalFileName)
+
+# Function that appends a record for an audio file to the journal.
+# Input: Output directory, Audio file name, Job state, Additional fields.
+def record(outputDir,audioFile,state,**fields):
+	entry = {"audioFile" : audioFile, "state" : state, "time" : time.time()}
+	entry.update(fields)
+	with open(journalPath(outputDir),'a') as f:
+		f.write(json.dumps(entry,sort_keys=True) + "\n")
+		f.flush()
+		os.fsync(f.fileno())
+
+# Function that returns the latest record for an audio file.
+# Incomplete lines from an interrupted write are ignored.
+# Returns: Record dictionary or None
+def lastEntry(outputDir,audioFile):
+	entry = None
+	try:
+		with open(journalPath(outputDir)) as f:
+			for line in f:
+				try: current = json.loads(line)
+				except ValueError: continue
+				if current.get("audioFile") == audioFile: entry = current
+	except FileNotFoundError: pass
+	return entry
+
+# Function that returns the audio files whose latest record is not completed
+# i.e. whose transcription can be resumed from the output directory.
+# Returns: List of audio file names.
+def unfinished(outputDir):
+	entries = {}
+	try:
+		with open(journalPath(outputDir)) as f:
+			for line in f:
+				try: current = json.loads(line)
+				except ValueError: continue
+				if "audioFile" in current: entries[current["audioFile"]] = current
+	except FileNotFoundError: pass
+	return [audioFile for audioFile,entry in entries.items() if entry.get("state") != "completed"]
+
+# Function that checks if an output directory holds unfinished transcriptions
+# of the given audio files only, so that a request for them can resume.
+# Unfinished records of any other file e.g. from an earlier request mean the
+# directory is not resumed.
+# Input: Output directory, Names the audio files may have been transcribed as.
+def resumableFor(outputDir,audioFiles):
+	files = unfinished(outputDir)
+	return len(files) > 0 and all(audioFile in audioFiles for audioFile in files)
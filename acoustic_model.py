@@ -25,12 +25,14 @@ import json
 import codecs
 import os, sys, time
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
-from pydub import AudioSegment
-from pydub.utils import make_chunks
 from termcolor import colored
 from prettytable import PrettyTable				# Table printing library
 import inquirer 								# Selection interface library.
 
+# Gailbot scripts
+import lazyImport 								# Imports modules on first use.
+pydub = lazyImport.module("pydub") 				# Audio library, loaded when audio is added.
+
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
 
@@ -309,7 +311,7 @@ def add_audio(username,password,filename,customID):
 	os.system('clear')
 	custom_headers = {'Content-Type': "audio/wav"}
 
-	if len(AudioSegment.from_file(filename)) <= 600000:
+	if len(pydub.AudioSegment.from_file(filename)) <= 600000:
 		print('Error: The audio file must be at least 10 minutes long') ; return
 	if check_extension(filename,'wav') == False:
 		print("Error: Wav audio file expected") ;return
@@ -0,0 +1,317 @@
+'''
+	Script that sends requests to IBM Watson's STT API using asyncio websockets
+	and receives the results in json format.
+	Unlike STT.run, which drives the Twisted reactor that cannot be restarted,
+	run can be called any number of times in the same process.
+	The number of concurrent recognitions is bounded by a semaphore.
+	Recognitions that are cut off are retried and resume after the last final
+	result, using the journal kept in the output directory. Recognitions that
+	are refused e.g. for failed authentication are not retried.
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 5/25/19
+'''
+
+import asyncio 							# Event loop and semaphore.
+import json                        		# json
+import os                          		# for listing directories
+import tempfile 						# Temporary audio files for resumed requests.
+from termcolor import colored			# Text coloring library
+import websockets 						# asyncio WebSocket client.
+
+# Gailbot scripts
+import STT 								# Request parameters shared with the Twisted client.
+import STTJournal 						# Journal of transcription jobs.
+import transcriptCache 					# Cached results of previous requests.
+
+# Invariants / Global variables
+
+maxRetries = 5 							# Number of times a cut-off recognition is retried.
+retryBackoffSeconds = 2 				# Delay before the first retry. Doubled for every retry.
+maxBackoffSeconds = 60 					# Maximum delay between retries.
+resumeJobs = True 						# Resume unfinished files recorded in the output directory journal.
+ffmpegCommand = "ffmpeg" 				# Used to cut the audio already transcribed.
+
+# Close codes and handshake HTTP status codes after which a recognition is not
+# retried, since the same request would be refused again i.e. protocol and
+# policy violations, unsupported or too large data, and failed authentication.
+fatalCloseCodes = (1002,1003,1007,1008,1009,1010)
+fatalStatusCodes = (400,401,403,404)
+
+# *** Main function that interacts with Watson STT ***
+
+# Takes the same parameters as STT.run.
+# num_threads = Maximum number of concurrent recognitions.
+# url = Recognize url. Defaults to the url for the region (used for local testing).
+# ready = Dictionary from a file that is still being prepared e.g. extracted
+#	or encoded, to a concurrent.futures.Future of the name of the file to
+#	send. Each file is transcribed as soon as it is ready.
+# Returns: List of output information dictionaries in the order of audio_files.
+def run(username,password,out_dir,base_model,acoustic_id,language_id,
+	num_threads,opt_out,watson_token,audio_files,names,combined_audio,
+	contentType,customization_weight,region,url=None,ready=None):
+
+	print(colored("Initiating transcription process..\n",'blue'))
+	if ready == None: ready = {}
+
+	# Removing files that do not exist. Files being prepared are checked once ready.
+	existing = STT.verifyFiles([fileName for fileName in audio_files if fileName not in ready])
+	audio_files = [fileName for fileName in audio_files if fileName in ready or fileName in existing]
+
+	# Checking parameters for correctness (Checked runtime Errors)
+	for k,v in out_dir.items():
+		if not os.path.exists(v): raise OSError("Output directory does not exist")
+	STT.check_positive_int(num_threads)
+
+	# Using cached results instead of sending the same audio again.
+	cacheSettings = (base_model,language_id,acoustic_id,customization_weight)
+	keys = {fileName : transcriptCache.cacheKey(fileName,*cacheSettings) for fileName in existing}
+	cached = {dic['audioFile'] : dic for dic in STT.loadCached(existing,out_dir,names,keys)}
+	if len(cached) == len(audio_files):
+		print(colored("\nTranscription process completed\n",'green'))
+		return [cached[fileName] for fileName in audio_files]
+
+	headers = STT.requestHeaders(username,password,opt_out,watson_token,region)
+	if url == None: url = STT.requestURL(base_model,language_id,acoustic_id)
+	if language_id != None: custom = True 						# Indicating if custom weight used.
+	else : custom = False
+
+	transcribed = [fileName for fileName in audio_files if fileName not in cached]
+	outputInfo = asyncio.run(recognizeAll(url,headers,transcribed,ready,out_dir,
+		contentType,names,base_model,custom,cacheSettings,int(num_threads)))
+	# Files that were being prepared are cached under the name they were sent as.
+	keys.update({dic['audioFile'] : transcriptCache.cacheKey(dic['audioFile'],*cacheSettings)
+		for dic in outputInfo if dic['audioFile'] not in keys and os.path.isfile(dic['audioFile'])})
+	STT.storeCached([dic for dic in outputInfo if not dic.get('cached')],keys)
+	outputInfo = dict(zip(transcribed,outputInfo))
+	outputInfo.update(cached)
+	outputInfo = [outputInfo[fileName] for fileName in audio_files]
+	for dic in outputInfo: dic.pop('cached',None)
+
+	# Returning information dictionary
+	print(colored("\nTranscription process completed\n",'green'))
+	return outputInfo
+
+# Function that runs recognitions for all files, at most num_threads at once.
+# Returns: List of output information dictionaries in the order of audio_files.
+async def recognizeAll(url,headers,audio_files,ready,out_dir,contentType,names,
+	base_model,custom,cacheSettings,num_threads):
+	semaphore = asyncio.Semaphore(num_threads)
+	for fileNumber,fileName in enumerate(audio_files):
+		print("Adding to queue\nFilename: {0}, FileNumber: {1}, "
+			"Output Directory: {2}".format(fileName,fileNumber,out_dir[fileName]))
+		print("Speaker names: {}".format(names[fileName]))
+	return await asyncio.gather(*[recognizeWhenReady(semaphore,url,headers,fileName,
+		ready.get(fileName),out_dir[fileName],names[fileName],contentType,base_model,custom,
+		cacheSettings) for fileName in audio_files])
+
+# Function that waits until a file is prepared and transcribes it, unless
+# its results are cached. No recognition slot is held while waiting.
+# Input: Name of the file, Future of the name of the file to send or None if
+# the file is ready.
+# Returns: Output information dictionary for the file.
+async def recognizeWhenReady(semaphore,url,headers,fileName,job,dirOutput,names,
+	contentType,base_model,custom,cacheSettings):
+	sampleName = fileName
+	if job != None:
+		try: sampleName = await asyncio.wrap_future(job)
+		except Exception as e:
+			print(colored("\nERROR: Could not prepare: {0}\nDetails: {1}".format(fileName,e),'red'))
+			sampleName = None
+		if sampleName == None or len(STT.verifyFiles([sampleName])) == 0:
+			return {"outputDir" : dirOutput, "jsonFile" : STT.jsonFileName(fileName),
+				"audioFile" : fileName, "names" : names, "delete" : True}
+		key = transcriptCache.cacheKey(sampleName,*cacheSettings)
+		cached = STT.loadCached([sampleName],{sampleName : dirOutput},{sampleName : names},
+			{sampleName : key})
+		if len(cached) > 0: return dict(cached[0],cached=True)
+	params = STT.recognitionParams(contentType[sampleName],base_model,custom,cacheSettings[3])
+	return await recognize(semaphore,url,headers,sampleName,dirOutput,names,params)
+
+# Function that transcribes one audio file and writes the results to its json file.
+# A cut-off recognition is retried with exponential backoff and resumes from
+# the audio offset covered by the final results already recieved.
+# Returns: Output information dictionary for the file.
+async def recognize(semaphore,url,headers,sampleName,dirOutput,names,params):
+	async with semaphore:
+		jsonFile = STT.jsonFileName(sampleName)
+		jsonPath = dirOutput + "/" + jsonFile
+		json_output,offset = resumeState(dirOutput,sampleName,jsonPath)
+		attempt = 0
+		while True:
+			STTJournal.record(dirOutput,sampleName,'started',attempt=attempt,offset=offset)
+			# Final results are streamed to the json file as they are recieved.
+			if STT.finalResultsOnly: output = STT.ResultWriter(jsonPath,json_output)
+			else: output = json_output
+			try: code = await recognizeFrom(url,headers,sampleName,params,offset,
+				nextResultIndex(json_output),output)
+			except OSError as e:
+				print(colored("\nCould not resume: {0}\nDetails: {1}".format(sampleName,e),'red'))
+				code = None ; break
+			finally:
+				if STT.finalResultsOnly: output.close()
+			if code == 1000: break
+			if code in fatalCloseCodes or code in fatalStatusCodes:
+				print(colored("\nRequest refused: {0}\n\tCode: {1}".format(sampleName,code),'red'))
+				break
+			# Keeping the final results and checkpointing the audio they cover.
+			if STT.finalResultsOnly: json_output = STT.readResults(jsonPath)
+			json_output,offset = finalizedOutput(json_output,offset)
+			STT.writeResults(jsonPath,json_output)
+			STTJournal.record(dirOutput,sampleName,'checkpoint',attempt=attempt,code=code,
+				resultIndex=nextResultIndex(json_output)-1,offset=offset)
+			attempt += 1
+			if attempt > maxRetries: break
+			delay = min(maxBackoffSeconds,retryBackoffSeconds*2**(attempt-1))
+			print(colored("\nRetrying {0} from {1}s in {2}s (Attempt {3}/{4})".format(
+				sampleName,offset,delay,attempt,maxRetries),'yellow'))
+			await asyncio.sleep(delay)
+		# Dumping results to a json file.
+		print("Data dumped: {}".format(jsonPath))
+		if STT.finalResultsOnly: json_output = STT.readResults(jsonPath)
+		else: STT.writeResults(jsonPath,json_output)
+		STTJournal.record(dirOutput,sampleName,'completed' if code == 1000 else 'failed',
+			resultIndex=nextResultIndex(json_output)-1,offset=finalizedOffset(json_output,offset))
+		# Deleting output files for an abnormal connection. 1000 = clean connection
+		return {"outputDir" : dirOutput,
+				"jsonFile" : jsonFile,
+				"audioFile" : sampleName,
+				"names" : names,
+				"delete" : code != 1000}
+
+# Function that sends the audio after offset seconds over its own WebSocket
+# connection.
+# Input: Index of the first result, List of json outputs or STT.ResultWriter
+# the results are added to.
+# Returns: Close code, or the HTTP status code if the handshake was refused.
+async def recognizeFrom(url,headers,sampleName,params,offset,baseIndex,output):
+	audioFile = sampleName ; trimmed = None ; status = None
+	if offset > 0:
+		audioFile = trimmed = await trimAudio(sampleName,offset)
+		params = dict(params,**{"content-type" : "audio/flac"})
+	ws = None ; sender = None
+	try:
+		async with websockets.connect(url,extra_headers=headers,max_size=None) as ws:
+			print("Opening API Connection: {}".format(sampleName))
+			await ws.send(json.dumps(params))
+			sender = asyncio.ensure_future(sendAudio(ws,audioFile))
+			await receiveResults(ws,sampleName,offset,baseIndex,output)
+	except websockets.exceptions.InvalidStatusCode as e:
+		print(colored("\nConnection refused: {0}\nDetails: {1}".format(sampleName,e),'red'))
+		status = e.status_code
+	except (websockets.exceptions.WebSocketException,OSError) as e:
+		print(colored("\nConnection error: {0}\nDetails: {1}".format(sampleName,e),'red'))
+	finally:
+		if sender != None and not sender.done(): sender.cancel()
+		if trimmed != None: os.remove(trimmed)
+	if status != None: return status
+	code = ws.close_code if ws != None else None
+	print('\nWebsocket Connection closed: {0}\n\tCode: {1}'.format(sampleName,code))
+	return code
+
+# Function that writes the audio after offset seconds to a temporary flac file.
+# Returns: Name of the temporary file.
+async def trimAudio(sampleName,offset):
+	fd,trimmed = tempfile.mkstemp(suffix=".flac") ; os.close(fd)
+	process = await asyncio.create_subprocess_exec(ffmpegCommand,'-loglevel','error',
+		'-y','-ss',str(offset),'-i',sampleName,'-f','flac',trimmed,
+		stdout=asyncio.subprocess.DEVNULL,stderr=asyncio.subprocess.DEVNULL)
+	if await process.wait() != 0:
+		os.remove(trimmed)
+		raise OSError("ffmpeg could not trim {}".format(sampleName))
+	return trimmed
+
+
+# *** Helper functions for resuming recognitions ***
+
+# Function that loads the results of an unfinished job from the journal.
+# Only final results are kept and the offset is the audio they cover, since
+# an interrupted attempt may have written results after the offset it
+# started from.
+# Returns: List of json outputs, Audio offset (seconds) to resume from.
+def resumeState(dirOutput,sampleName,jsonPath):
+	entry = STTJournal.lastEntry(dirOutput,sampleName) if resumeJobs else None
+	if entry != None and entry['state'] != 'completed':
+		try:
+			return finalizedOutput(STT.readResults(jsonPath),entry.get('offset',0))
+		except (OSError,ValueError): pass
+	# Removing json file data will be written to if it already exists.
+	try : os.remove(jsonPath)
+	except OSError : pass
+	return [],0
+
+# Function that returns the result index following the last final result.
+def nextResultIndex(json_output):
+	indices = [res['result_index'] for res in json_output
+		if 'results' in res and res['results'][0]['final']]
+	return max(indices) + 1 if len(indices) > 0 else 0
+
+# Function that returns the audio offset (seconds) covered by the final results.
+def finalizedOffset(json_output,offset):
+	for res in json_output:
+		if 'results' in res and res['results'][0]['final']:
+			for word in res['results'][0]['alternatives'][0].get('timestamps',[]):
+				offset = max(offset,word[2])
+	return offset
+
+# Function that keeps the final results and the speaker labels they cover.
+# Interim results are discarded since their audio is sent again.
+# Returns: List of json outputs, Audio offset (seconds) covered by final results.
+def finalizedOutput(json_output,offset):
+	offset = finalizedOffset(json_output,offset)
+	kept = []
+	for res in json_output:
+		if 'results' in res and res['results'][0]['final']: kept.append(res)
+		elif 'speaker_labels' in res:
+			res['speaker_labels'] = [label for label in res['speaker_labels'] if label['from'] < offset]
+			kept.append(res)
+	return kept,offset
+
+# Function that moves a message of a resumed recognition to the timeline
+# of the complete audio file.
+# Input: Parsed message, Audio offset (seconds), Index of the first result.
+def shiftResult(res,offset,baseIndex):
+	if offset == 0 and baseIndex == 0: return res
+	if 'result_index' in res: res['result_index'] += baseIndex
+	for result in res.get('results',[]):
+		for alternative in result['alternatives']:
+			for word in alternative.get('timestamps',[]):
+				word[1] = round(word[1]+offset,2) ; word[2] = round(word[2]+offset,2)
+	for label in res.get('speaker_labels',[]):
+		label['from'] = round(label['from']+offset,2) ; label['to'] = round(label['to']+offset,2)
+	processed = res.get('processing_metrics',{}).get('processed_audio',{})
+	for key in ('received','seen_by_engine','transcription','speaker_labels'):
+		if key in processed: processed[key] = round(processed[key]+offset,2)
+	return res
+
+# Function that streams the audio file to the service.
+# websockets applies flow control, so each send waits for buffer space.
+async def sendAudio(ws,sampleName):
+	with open(sampleName,'rb') as f:
+		while True:
+			chunk = f.read(STT.Audio_chunk_size_bytes)
+			if len(chunk) == 0: break
+			await ws.send(chunk)
+	# Empty message marks the end of the audio.
+	await ws.send(b'')
+
+# Function that records messages until the service sends its second
+# listening state, which indicates the end of results for the audio sent.
+async def receiveResults(ws,sampleName,offset,baseIndex,output):
+	listening_state_count = 0
+	async for payload in ws:
+		jsonObject = json.loads(payload)
+		# Initial / final server response for a new connection
+		if 'state' in jsonObject:
+			listening_state_count +=1
+			if listening_state_count == 1: print('Starting listening state: {}'.format(sampleName))
+			else : print("\nEnding listening state: {}".format(sampleName))
+			if listening_state_count == 2: await ws.close(code=1000) ; return
+		else: STT.processMessage(shiftResult(jsonObject,offset,baseIndex),output)
@@ -0,0 +1,139 @@
+'''
+	Benchmark of the retry / resume path of the asyncio STT client against a
+	local fake service, like the one of tests/test_asyncSTT.py, that sends
+	interim and final results for every second of the audio it recieves and
+	cuts off the first connections half way through their results.
+	Each cut-off recognition is retried from the audio covered by its final
+	results. Runs with final results streamed to the json file (the default)
+	and with all results kept in memory, with and without cut-offs.
+	Requires ffmpeg to cut the audio already transcribed, and soundfile.
+
+	Usage: python benchmarks/asyncResume.py [-seconds 600] [-cuts 2] [-interim 5]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 5/25/19
+'''
+
+import argparse 								# Library to extract input arguments
+import asyncio, contextlib, io, json, multiprocessing, os, shutil, sys, tempfile, time
+import tracemalloc, wave
+import soundfile 								# Reads the duration of the audio recieved.
+import websockets 								# asyncio WebSocket server.
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asyncSTT 								# asyncio Speech to Text client.
+import STT 										# Request parameters and result files.
+import transcriptCache 							# Cached results of previous requests.
+
+# Words the service transcribes for each second of audio.
+VOCABULARY = ['hello','there','yeah']
+
+
+# Function that runs the fake service in its own process. The url is sent
+# over the connection once the service listens, and the number of
+# connections and audio bytes recieved when 'stop' is recieved.
+# Input: Connection to the benchmark, Number of connections cut off,
+# Number of interim results per final result.
+def serve(connection,numCuts,numInterim):
+	stats = {'connections' : 0, 'audioBytes' : 0}
+
+	# Function that answers a recognition with the results of each second of
+	# audio, cutting off the first numCuts connections half way through.
+	async def handle(ws,path=None):
+		count = stats['connections'] ; stats['connections'] += 1
+		json.loads(await ws.recv())
+		await ws.send(json.dumps({'state' : 'listening'}))
+		audio = io.BytesIO()
+		while True:
+			chunk = await ws.recv()
+			if len(chunk) == 0: break
+			audio.write(chunk)
+		stats['audioBytes'] += audio.tell() ; audio.seek(0)
+		seconds = int(soundfile.info(audio).duration)
+		for index in range(seconds):
+			if count < numCuts and index == seconds//2: await ws.close(code=1011) ; return
+			words = [[word,index+0.3*number,index+0.3*number+0.25]
+				for number,word in enumerate(VOCABULARY)]
+			for interim in range(numInterim+1):
+				partial = words[:len(words)*(interim+1)//(numInterim+1)]
+				await ws.send(json.dumps({'result_index' : index,'results' : [{
+					'final' : interim == numInterim,'alternatives' : [{
+					'transcript' : " ".join([word[0] for word in partial]),
+					'confidence' : 0.9,'timestamps' : partial,
+					'word_confidence' : [[word[0],0.9] for word in partial]}]}],
+					'processing_metrics' : {'periodic' : False,
+					'processed_audio' : {'received' : float(seconds)}}}))
+			await ws.send(json.dumps({'speaker_labels' : [{'from' : word[1],'to' : word[2],
+				'speaker' : index%2,'confidence' : 0.5,'final' : True} for word in words]}))
+		await ws.send(json.dumps({'state' : 'listening'}))
+		await ws.wait_closed()
+
+	async def main():
+		async with websockets.serve(handle,'localhost',0,max_size=None) as server:
+			connection.send("ws://localhost:{}".format(server.sockets[0].getsockname()[1]))
+			await asyncio.get_running_loop().run_in_executor(None,connection.recv)
+			connection.send(stats)
+	asyncio.run(main())
+
+# Function that writes seconds of 16 kHz noise, which the flac files of
+# resumed recognitions do not compress much, as with recorded speech.
+def audioFile(path,seconds):
+	with wave.open(path,'wb') as f:
+		f.setnchannels(1) ; f.setsampwidth(2) ; f.setframerate(16000)
+		for second in range(seconds): f.writeframes(os.urandom(2*16000))
+
+# Function that transcribes an audio file with the fake service.
+# Returns: Seconds, Peak traced memory of the client (MB), Connections,
+# Audio bytes recieved by the service, Size of the json file, Number of words.
+def transcribe(audio,outputDir,numCuts,numInterim):
+	parent,child = multiprocessing.Pipe()
+	service = multiprocessing.Process(target=serve,args=(child,numCuts,numInterim))
+	service.start() ; url = parent.recv()
+	tracemalloc.start() ; start = time.time()
+	with contextlib.redirect_stdout(io.StringIO()):
+		outputInfo = asyncSTT.run('user','password',{audio : outputDir},
+			'en-US_BroadbandModel',None,None,1,True,0,[audio],{audio : ['SP1','SP2']},'',
+			{audio : 'audio/wav'},0.5,'us-south',url=url)
+	seconds = time.time()-start ; peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	parent.send('stop') ; stats = parent.recv() ; service.join()
+	assert not outputInfo[0]['delete']
+	jsonPath = os.path.join(outputDir,outputInfo[0]['jsonFile'])
+	words = [word for res in STT.readResults(jsonPath) if 'results' in res
+		and res['results'][0]['final'] for word in res['results'][0]['alternatives'][0]['timestamps']]
+	return (seconds,peak/(1024*1024),stats['connections'],stats['audioBytes'],
+		os.path.getsize(jsonPath),len(words))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'asyncio STT retry / resume benchmark')
+	parser.add_argument('-seconds',action = 'store',dest = 'seconds',type = int,default = 600,
+		help = 'Length of the audio file')
+	parser.add_argument('-cuts',action = 'store',dest = 'cuts',type = int,default = 2,
+		help = 'Number of connections cut off')
+	parser.add_argument('-interim',action = 'store',dest = 'interim',type = int,default = 5,
+		help = 'Interim results per final result')
+	args = parser.parse_args()
+	if shutil.which(asyncSTT.ffmpegCommand) == None: sys.exit("ffmpeg is required")
+	transcriptCache.cacheDir = None ; asyncSTT.retryBackoffSeconds = 0
+	asyncSTT.maxRetries = max(asyncSTT.maxRetries,args.cuts)
+	with tempfile.TemporaryDirectory() as directory:
+		audio = os.path.join(directory,"audio.wav") ; audioFile(audio,args.seconds)
+		for finalResultsOnly in (True,False):
+			STT.finalResultsOnly = finalResultsOnly
+			for numCuts in (0,args.cuts):
+				outputDir = os.path.join(directory,"{0}-{1}".format(finalResultsOnly,numCuts))
+				os.mkdir(outputDir)
+				seconds,peak,connections,audioBytes,jsonSize,words = transcribe(audio,outputDir,
+					numCuts,args.interim)
+				print("{0:11} {1} cut-offs {2:7.2f} s {3} connections {4:6.1f} MB audio sent "
+					"{5:6.1f} MB json {6:6} words  peak memory {7:6.1f} MB".format(
+					"final only" if finalResultsOnly else "all results",numCuts,seconds,connections,
+					audioBytes/(1024*1024),jsonSize/(1024*1024),words,peak))
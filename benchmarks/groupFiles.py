@@ -0,0 +1,77 @@
+'''
+	Benchmark of grouping the files of a batch by output directory.
+	Generated file dictionaries are grouped as groupDictionaries does before
+	the CHAT files are built, half of them as pairs of speaker streams and
+	half as files with their own output directory. The pairwise grouping
+	used before can be timed next to it.
+
+	Usage: python benchmarks/groupFiles.py [-sizes 1000 10000] [-previous]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/4/19
+'''
+
+import argparse 								# Library to extract input arguments
+import contextlib, io, itertools, os, sys, time
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CHAT 									# Script to produce CHAT files.
+
+
+# Function that generates the file dictionaries of a batch.
+# Input: Number of files.
+# Returns: List of file dictionaries.
+def batch(numFiles):
+	infoList = []
+	for count in range(numFiles):
+		if count < numFiles//2:
+			outputDir = "pair{}".format(count//2) ; names = ["SP{}".format(count%2)]
+		else: outputDir = "file{}".format(count) ; names = ["SP1","SP2"]
+		infoList.append({'outputDir' : outputDir, 'names' : names,
+			'audioFile' : "{}.wav".format(count)})
+	return infoList
+
+# Function that groups the files by comparing every pair of them, as
+# groupDictionaries did before it grouped in one pass.
+def previousGroupDictionaries(infoList):
+	newInfo = [];dirs = []
+	if len(infoList) == 1: newInfo.append([infoList[0]])
+	for a,b in itertools.combinations(infoList,2):
+		if a['outputDir'] == b['outputDir']:
+			newInfo.append([a,b]);dirs.append(a['outputDir'])
+	for a,b in itertools.combinations(infoList,2):
+		if a['outputDir'] not in dirs:
+			newInfo.append([a]);dirs.append(a['outputDir'])
+		if b['outputDir'] not in dirs:
+			newInfo.append([b]);dirs.append(b['outputDir'])
+	return newInfo
+
+# Function that times a grouping function on a batch.
+# Returns: Seconds, Number of groups.
+def timeGroups(function,infoList):
+	start = time.time()
+	with contextlib.redirect_stdout(io.StringIO()): groups = function(infoList)
+	return time.time()-start,len(groups)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'File grouping benchmark')
+	parser.add_argument('-sizes',action = 'store',dest = 'sizes',type = int,nargs = '+',
+		default = [1000,10000],help = 'Numbers of files')
+	parser.add_argument('-previous',action = 'store_true',dest = 'previous',
+		help = 'Also time the pairwise grouping used before. It takes minutes above 2000 files')
+	args = parser.parse_args()
+	functions = [('groupDictionaries',CHAT.groupDictionaries)]
+	if args.previous: functions.append(('previous',previousGroupDictionaries))
+	for size in args.sizes:
+		infoList = batch(size)
+		for name,function in functions:
+			seconds,groups = timeGroups(function,infoList)
+			print("{0:18} {1:6} files {2:6} groups {3:9.4f} s".format(name,size,groups,seconds))
@@ -0,0 +1,125 @@
+'''
+	Benchmark of reading the words of a Watson json result file with the
+	streaming getJSON and with the json.load based loader used before.
+	A result file with interim results is generated, written as
+	STT.writeResults does. Each loader runs in a new process, which reports
+	its parse time and peak memory.
+
+	Usage: python benchmarks/jsonParse.py [-words 200000] [-interim 3] [-file results.json]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/4/19
+'''
+
+import argparse 								# Library to extract input arguments
+import itertools, json, os, random, subprocess, sys, tempfile, textwrap, time
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import profiling 								# Per-stage timing traces of requests.
+
+# Words the results are made of.
+VOCABULARY = ['hello','there','%HESITATION','yeah','i','think','so','okay','we','went']
+
+# Words per result.
+RESULT_WORDS = 10
+
+
+# Function that returns a recognition result message.
+def result(index,words,final,received):
+	return {'result_index' : index, 'processing_metrics' : {'periodic' : False,
+		'processed_audio' : {'received' : received}}, 'results' : [{'final' : final,
+		'alternatives' : [{'transcript' : " ".join(word[0] for word in words),
+		'word_confidence' : [[word[0],0.9] for word in words],'timestamps' : words}]}]}
+
+# Function that writes a result file of two speakers, where each final
+# result follows interim results of growing length. Messages are written one
+# at a time, formatted as json.dumps with indent=4 formats a list of them, so
+# that this process stays small and does not raise the peak memory the
+# loader processes start with.
+# Input: File name, Number of words, Number of interim results per final result.
+def writeResults(fileName,numWords,numInterim):
+	rng = random.Random(0) ; time = 0 ; separator = "[\n"
+	with open(fileName,"w") as f:
+		for index in range(-(-numWords//RESULT_WORDS)):
+			words = []
+			for count in range(min(RESULT_WORDS,numWords-index*RESULT_WORDS)):
+				words.append([rng.choice(VOCABULARY),round(time,2),round(time+0.3,2)]) ; time += 0.35
+			messages = [result(index,words[:len(words)*count//(numInterim+1)],False,time)
+				for count in range(1,numInterim+1)]
+			messages.append(result(index,words,True,time))
+			messages.append({'speaker_labels' : [{'from' : word[1],'to' : word[2],
+				'speaker' : rng.randint(0,1),'confidence' : 0.5,'final' : True} for word in words]})
+			for message in messages:
+				f.write(separator + textwrap.indent(json.dumps(message,indent=4,sort_keys=True),"    "))
+				separator = ",\n"
+		f.write("\n]" if separator != "[\n" else "[]")
+
+# Function that reads the words of a result file by loading the whole file
+# with json.load, as getJSON did before it streamed the file.
+# Returns: Rows of word fields, Speaker labels.
+def previousGetJSON(fileName):
+	jsonList = [] ; labels = {}
+	with open(fileName) as f: jsonObject = json.load(f)
+	for res in jsonObject:
+		if "speaker_labels" not in res:
+			try:
+				processingMetrics = res['processing_metrics']
+				resultIndex = res['result_index'];results = res['results']
+				final = results[0]['final'];wordData = results[0]['alternatives'][0]
+				periodic = processingMetrics['periodic']
+				recieved = processingMetrics['processed_audio']['received']
+				confidenceVals = wordData['word_confidence'];words = wordData['timestamps']
+				if final:
+					for word,confidence in itertools.zip_longest(words,confidenceVals):
+						jsonList.append([word[1],word[2],word[0],confidence[1],
+							periodic,recieved,resultIndex])
+			except KeyError: continue
+		else:
+			for label in res['speaker_labels']: labels.update({label['from']:label['speaker']})
+	return jsonList,labels
+
+# Function that runs a loader on a result file in this process.
+# Returns: Seconds, Number of words, Peak memory (MB) before and after loading.
+def load(loader,fileName):
+	if loader == 'streaming':
+		import postProcessing 					# Script that performs post-processing.
+		function = lambda: postProcessing.getJSON({'outputDir' : os.path.dirname(fileName),
+			'jsonFile' : os.path.basename(fileName),'names' : ['SP1','SP2']})
+	else: function = lambda: previousGetJSON(fileName)[0]
+	before = profiling.peakMemory() ; start = time.time()
+	words = function()
+	return time.time()-start,len(words),before,profiling.peakMemory()
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'json result file parsing benchmark')
+	parser.add_argument('-words',action = 'store',dest = 'words',type = int,default = 200000,
+		help = 'Number of words of the generated result file')
+	parser.add_argument('-interim',action = 'store',dest = 'interim',type = int,default = 3,
+		help = 'Interim results per final result')
+	parser.add_argument('-file',action = 'store',dest = 'file',
+		help = 'Result file to read instead of a generated one')
+	parser.add_argument('-loader',action = 'store',dest = 'loader',
+		choices = ['streaming','previous'],help = argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.loader != None:
+		print(json.dumps(load(args.loader,args.file))) ; sys.exit()
+	with tempfile.TemporaryDirectory() as directory:
+		fileName = args.file
+		if fileName == None:
+			fileName = os.path.join(directory,"results-json.txt")
+			writeResults(fileName,args.words,args.interim)
+		print("Result file: {:.1f} MB".format(os.path.getsize(fileName)/(1024*1024)))
+		for loader in ('streaming','previous'):
+			output = subprocess.run([sys.executable,os.path.abspath(__file__),'-loader',loader,
+				'-file',os.path.abspath(fileName)],stdout=subprocess.PIPE,check=True).stdout
+			seconds,words,before,after = json.loads(output.decode('utf-8').splitlines()[-1])
+			print("{0:10} {1:8} words {2:7.2f} s  peak memory {3:7.1f} MB (+{4:.1f} MB)".format(
+				loader,words,seconds,after,after-before))
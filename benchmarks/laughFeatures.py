@@ -0,0 +1,61 @@
+'''
+	Benchmark of the laughter feature extraction i.e. the MFCC, RMS and delta
+	features and the model input windows of an audio file.
+	Uses 30 minutes of noise unless an audio file is given.
+
+	Usage: python benchmarks/laughFeatures.py [-audio file] [-minutes 30]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/8/19
+'''
+
+import argparse 								# Library to extract input arguments
+import os, sys, time
+import numpy 									# Library to have multi-dimensional homogenous arrays.
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import laughAnalysis 							# Script that analyses audio for laughter.
+
+
+# Function that times each feature stage of a time series.
+# Returns: Dictionary from stage name to seconds.
+def benchmark(timeSeries,samplingRate):
+	seconds = {}
+	start = time.time()
+	mfccFeatures = laughAnalysis.computeMfccFeatures(timeSeries,samplingRate)
+	seconds['mfcc+rms'] = time.time() - start ; start = time.time()
+	deltaFeatures = laughAnalysis.computeDeltaFeatures(mfccFeatures)
+	seconds['delta'] = time.time() - start ; start = time.time()
+	mfccWindows = laughAnalysis.slidingWindows(mfccFeatures)
+	deltaWindows = laughAnalysis.slidingWindows(deltaFeatures)
+	# Materializing the model inputs one batch at a time, as predictWindows does.
+	for first in range(0,len(mfccWindows),laughAnalysis.PREDICT_BATCH_SIZE):
+		laughAnalysis.formatWindows(mfccWindows,deltaWindows,first,
+			min(first+laughAnalysis.PREDICT_BATCH_SIZE,len(mfccWindows)))
+	seconds['windows'] = time.time() - start
+	seconds['total'] = sum(seconds.values())
+	return seconds
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Laughter feature extraction benchmark')
+	parser.add_argument('-audio',action = 'store',dest = 'audio',help = 'Audio file')
+	parser.add_argument('-minutes',action = 'store',dest = 'minutes',type = float,default = 30,
+		help = 'Minutes of generated noise if no audio file is given')
+	args = parser.parse_args()
+	samplingRate = laughAnalysis.AUDIO_SAMPLE_RATE
+	if args.audio != None:
+		timeSeries,samplingRate = laughAnalysis.librosa.load(args.audio,sr=samplingRate)
+	else:
+		timeSeries = (0.1*numpy.random.RandomState(0).randn(
+			int(args.minutes*60*samplingRate))).astype('float32')
+	print("Audio: {:.1f} minutes".format(len(timeSeries)/samplingRate/60))
+	for stage,value in benchmark(timeSeries,samplingRate).items():
+		print("{0:10} {1:8.2f} s".format(stage,value))
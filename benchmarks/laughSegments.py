@@ -0,0 +1,86 @@
+'''
+	Benchmark of finding the laughter segments of a long probability series,
+	as transcribeProbabilities does after filtering the frame probabilities.
+	The generated series has laughs of random length at random intervals.
+	The frame-by-frame loop used before can be timed next to it.
+
+	Usage: python benchmarks/laughSegments.py [-hours 1 10] [-previous]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/8/19
+'''
+
+import argparse 								# Library to extract input arguments
+import os, sys, time
+import numpy 									# Library to have multi-dimensional homogenous arrays.
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import laughAnalysis 							# Script that analyses audio for laughter.
+
+
+# Function that generates the filtered laughter probabilities of a recording
+# with a laugh every 20 seconds on average, lasting 0.1 to 3 seconds.
+# Input: Number of 10 ms frames.
+# Returns: Filtered probability array.
+def probabilities(numFrames):
+	rng = numpy.random.RandomState(0)
+	probs = rng.uniform(0,0.3,numFrames)
+	for start in rng.randint(0,numFrames,numFrames//2000):
+		probs[start:start+rng.randint(10,300)] = rng.uniform(0.6,1)
+	filtered = laughAnalysis.lowpass(probs)
+	# Ending below the threshold, as the loop used before dropped a final laugh.
+	filtered[-1] = 0
+	return filtered
+
+# Function that finds laughter instances with the frame-by-frame loop
+# getLaughterInstances used before laughterSegments.
+# Returns: List of (start time, end time) tuples in seconds.
+def previousGetLaughterInstances(probs, threshold = 0.5, minLength = 0.2):
+	instances = []
+	current_list = []
+	for i in range(len(probs)):
+		if numpy.min(probs[i:i+1]) > threshold:
+			current_list.append(i)
+		else:
+			if len(current_list) > 0:
+				instances.append(current_list)
+				current_list = []
+	return [(i[0] / 100., i[-1] / 100.) for i in instances if len(i) > minLength]
+
+# Function that times a segmentation function on a probability series.
+# Returns: Seconds, List of instances.
+def timeSegments(function,probs,threshold,minLength):
+	start = time.time()
+	instances = function(probs,threshold,minLength)
+	return time.time()-start,instances
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Laughter segmentation benchmark')
+	parser.add_argument('-hours',action = 'store',dest = 'hours',type = float,nargs = '+',
+		default = [1,10],help = 'Lengths of the probability series')
+	parser.add_argument('-threshold',action = 'store',dest = 'threshold',type = float,
+		default = 0.5,help = 'Probability above which a laugh starts')
+	parser.add_argument('-minLength',action = 'store',dest = 'minLength',type = float,
+		default = 0.05,help = 'Minimum laugh length (frames)')
+	parser.add_argument('-previous',action = 'store_true',dest = 'previous',
+		help = 'Also time the frame-by-frame loop used before')
+	args = parser.parse_args()
+	for hours in args.hours:
+		probs = probabilities(int(hours*360000))
+		functions = [('laughterSegments',laughAnalysis.getLaughterInstances)]
+		if args.previous: functions.append(('previous',previousGetLaughterInstances))
+		results = []
+		for name,function in functions:
+			seconds,instances = timeSegments(function,probs,args.threshold,args.minLength)
+			results.append(instances)
+			print("{0:16} {1:9} frames {2:6} laughs {3:9.4f} s".format(name,len(probs),
+				len(instances),seconds))
+		assert all([instances == results[0] for instances in results])
@@ -0,0 +1,75 @@
+'''
+	Benchmark of getting laughter predictions from the model worker when it
+	has to be started (cold) and when it is already running (warm), against
+	loading the model in the Gailbot process.
+
+	Usage: python benchmarks/laughWorker.py [-model ./model.h5] [-runs 3]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/8/19
+'''
+
+import argparse 								# Library to extract input arguments
+import os, sys, time
+import numpy 									# Library to have multi-dimensional homogenous arrays.
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import laughWorker 								# Script that keeps the model loaded between runs.
+import laughAnalysis 							# Script that analyses audio for laughter.
+
+
+# Function that returns the number of features of a model input, as
+# formatWindows builds them from the features of one second of silence.
+def inputWidth():
+	timeSeries = numpy.zeros(laughAnalysis.AUDIO_SAMPLE_RATE,dtype=numpy.float32)
+	mfccFeatures = laughAnalysis.computeMfccFeatures(timeSeries,laughAnalysis.AUDIO_SAMPLE_RATE)
+	deltaFeatures = laughAnalysis.computeDeltaFeatures(mfccFeatures)
+	return laughAnalysis.formatWindows(laughAnalysis.slidingWindows(mfccFeatures),
+		laughAnalysis.slidingWindows(deltaFeatures),0,1).shape[1]
+
+# Function that times loading the model and predicting one batch.
+# Input: Function returning the model, Number of features of a model input.
+# Returns: Seconds to get the model, seconds to predict.
+def timeModel(getModel,width):
+	features = numpy.zeros((laughAnalysis.PREDICT_BATCH_SIZE,width),dtype=numpy.float32)
+	start = time.time()
+	model = getModel()
+	loaded = time.time()
+	model.predict_proba(features,verbose=0)
+	predicted = time.time()
+	if isinstance(model,laughWorker.WorkerModel): model.close()
+	return loaded-start,predicted-loaded
+
+# Function that waits until the stopped worker no longer accepts connections.
+def waitStopped():
+	while laughWorker.openClient() != None: time.sleep(0.1)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Laughter model worker benchmark')
+	parser.add_argument('-model',action = 'store',dest = 'model',default = './model.h5',
+		help = 'Path to the trained model')
+	parser.add_argument('-runs',action = 'store',dest = 'runs',type = int,default = 3,
+		help = 'Number of runs of each case')
+	args = parser.parse_args()
+	if not os.path.isfile(args.model): sys.exit("Model not found: {}".format(args.model))
+	import keras 								# Deep learning framework.
+	width = inputWidth()
+	print("Batch of {0} inputs of {1} features".format(laughAnalysis.PREDICT_BATCH_SIZE,width))
+	cases = (
+		('in-process',lambda: keras.models.load_model(args.model,compile=False)),
+		('cold worker',lambda: laughWorker.connect(args.model)),
+		('warm worker',lambda: laughWorker.connect(args.model)))
+	for name,getModel in cases:
+		for run in range(args.runs):
+			if name == 'cold worker' and laughWorker.stopWorker(): waitStopped()
+			loading,predicting = timeModel(getModel,width)
+			print("{0:12} load {1:7.2f} s  predict {2:7.2f} s".format(name,loading,predicting))
+	laughWorker.stopWorker()
@@ -0,0 +1,118 @@
+'''
+	Benchmark of the media preparation of a -dirPair request i.e. extracting
+	both speaker streams of MXF recordings, encoding them and overlaying each
+	pair. The jobs are run one after the other, as Gailbot did before, and
+	with the media scheduler. The recordings are generated test tones.
+	Requires ffmpeg. Files are encoded with opusenc if it is found and with
+	ffmpeg otherwise.
+
+	Usage: python benchmarks/mediaPrep.py [-recordings 8] [-seconds 120] [-workers 4]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 5/30/19
+'''
+
+import argparse 								# Library to extract input arguments
+import os, shutil, sys, tempfile, time
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mediaPrep 								# Runs ffmpeg / opusenc jobs concurrently.
+
+# Commands of the media jobs, as in the shellCommands of gailbot-3.py.
+# ffmpeg runs without reading the terminal and overwrites outputs of earlier runs.
+shellCommands = {
+	"tones" : "ffmpeg -y -f lavfi -i testsrc=size=320x240:rate=25:duration={1} \
+		-f lavfi -i sine=frequency=440:sample_rate=48000:duration={1} \
+		-f lavfi -i sine=frequency=660:sample_rate=48000:duration={1} \
+		-map 0 -map 1 -map 2 -c:v mpeg2video -c:a pcm_s16le {0}",				#.format(file,seconds)
+	"dualChannelFFmpeg" : "ffmpeg -y -i {0} -map 0:1 -c copy -acodec pcm_s16le -ar 16000 {1}-speaker1.wav \
+		-map 0:2 -c copy -acodec pcm_s16le -ar 16000 {1}-speaker2.wav",			#.format(file,file-No extension)
+	"convertOpus" : "opusenc --quiet --bitrate 24 {0} {1}",						#.format(audioFile, newOpusName)
+	"ffmpegOpus" : "ffmpeg -y -i {0} -c:a libopus -b:a 24k {1}",				#.format(audioFile, newOpusName)
+	"overlay" : "ffmpeg -y -i {0} -i {1} -filter_complex join=inputs=2:channel_layout=stereo {2}"	#.format(file1,file2,outPath)
+}
+
+
+# Function that generates the MXF recordings, each with a video stream and
+# one tone per speaker.
+# Returns: Paths of the recordings without extension.
+def recordings(directory,numRecordings,seconds):
+	names = [os.path.join(directory,"recording{}".format(count)) for count in range(numRecordings)]
+	scheduler = mediaPrep.MediaScheduler()
+	jobs = [scheduler.submit(mediaPrep.runCommand,shellCommands['tones'].format(name+".mxf",seconds))
+		for name in names]
+	for job in jobs: job.result()
+	return names
+
+# Function that returns the commands of the jobs of a recording.
+# Returns: Extraction command, Encoding commands, Overlay command.
+def commands(name,encodeCommand):
+	speakers = [name+"-speaker1.wav",name+"-speaker2.wav"]
+	return (shellCommands['dualChannelFFmpeg'].format(name+".mxf",name),
+		[encodeCommand.format(speaker,speaker[:-len(".wav")]+".opus") for speaker in speakers],
+		shellCommands['overlay'].format(speakers[0],speakers[1],name+"-combined.wav"))
+
+# Function that runs every extraction, then every encoding, then every overlay.
+# Returns: Seconds until the first recording was ready to transcribe, Total seconds.
+def serial(names,encodeCommand):
+	start = time.time() ; jobs = [commands(name,encodeCommand) for name in names]
+	for extract,encodes,combine in jobs: mediaPrep.runCommand(extract)
+	for count,(extract,encodes,combine) in enumerate(jobs):
+		for encode in encodes: mediaPrep.runCommand(encode)
+		if count == 0: firstReady = time.time()-start
+	for extract,encodes,combine in jobs: mediaPrep.runCommand(combine)
+	return firstReady,time.time()-start
+
+# Function that runs the jobs with the media scheduler. The encodings and the
+# overlay of a recording start as soon as its extraction finishes.
+# Returns: Seconds until the first recording was ready to transcribe, Total seconds.
+def scheduled(names,encodeCommand,numWorkers):
+	start = time.time() ; encodings = [] ; overlays = []
+	scheduler = mediaPrep.MediaScheduler(numWorkers)
+	for name in names:
+		extract,encodes,combine = commands(name,encodeCommand)
+		extractJob = scheduler.submit(mediaPrep.runCommand,extract)
+		encodings.append([scheduler.submit(finishTime,encode,dependencies=[extractJob])
+			for encode in encodes])
+		overlays.append(scheduler.submit(mediaPrep.runCommand,combine,dependencies=[extractJob]))
+	firstReady = min([max([job.result() for job in jobs]) for jobs in encodings]) - start
+	for job in overlays: job.result()
+	return firstReady,time.time()-start
+
+# Function that runs a job and returns the time it finished.
+def finishTime(cmd):
+	mediaPrep.runCommand(cmd)
+	return time.time()
+
+# Function that removes the outputs of the jobs so each run starts from the recordings.
+def clean(directory):
+	for fileName in os.listdir(directory):
+		if not fileName.endswith(".mxf"): os.remove(os.path.join(directory,fileName))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Media preparation benchmark')
+	parser.add_argument('-recordings',action = 'store',dest = 'recordings',type = int,default = 8,
+		help = 'Number of MXF recordings')
+	parser.add_argument('-seconds',action = 'store',dest = 'seconds',type = int,default = 120,
+		help = 'Length of each recording')
+	parser.add_argument('-workers',action = 'store',dest = 'workers',type = int,
+		default = mediaPrep.maxWorkers,help = 'Number of media worker threads')
+	args = parser.parse_args()
+	if shutil.which("ffmpeg") == None: sys.exit("ffmpeg is required")
+	encodeCommand = shellCommands['convertOpus' if shutil.which("opusenc") else 'ffmpegOpus']
+	print("{0} recordings of {1} s, encoding with {2}, {3} workers".format(args.recordings,
+		args.seconds,encodeCommand.split()[0],args.workers))
+	with tempfile.TemporaryDirectory() as directory:
+		names = recordings(directory,args.recordings,args.seconds)
+		for name,run in (("serial",lambda: serial(names,encodeCommand)),
+			("scheduled",lambda: scheduled(names,encodeCommand,args.workers))):
+			firstReady,total = run() ; clean(directory)
+			print("{0:10} first file ready {1:7.2f} s  all jobs {2:7.2f} s".format(name,firstReady,total))
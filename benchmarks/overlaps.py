@@ -0,0 +1,88 @@
+'''
+	Benchmark of finding and marking overlapping turns in conversations where
+	many speakers talk at the same time. Each generated speaker talks for most
+	of the conversation, so every turn overlaps turns of the other speakers.
+	The sweep line of overlappingPairs can be timed against the scan of
+	every pair of turns, which finds the same pairs.
+
+	Usage: python benchmarks/overlaps.py [-sizes 1000 10000 100000] [-speakers 8]
+		[-previous]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/4/19
+'''
+
+import argparse 								# Library to extract input arguments
+import copy, os, sys, time
+import numpy 									# Library to have multi-dimensional homogenous arrays.
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CHAT 									# Script to produce CHAT files.
+
+# Words the turns are made of.
+VOCABULARY = ['hello','there','yeah','i','think','so','okay','we','went','right']
+
+
+# Function that generates the combined turns of a conversation in which each
+# speaker talks 90% of the time.
+# Input: Number of turns, Number of speakers.
+# Returns: List of [speaker, start, end, transcript] turns sorted by start time.
+def conversation(numTurns,numSpeakers):
+	rng = numpy.random.RandomState(0) ; turns = []
+	for speaker in range(numSpeakers):
+		durations = rng.uniform(1,4,numTurns//numSpeakers)
+		starts = numpy.cumsum(durations/0.9) - durations
+		for start,duration in zip(starts.tolist(),durations.tolist()):
+			words = rng.choice(VOCABULARY,int(duration*3)+1).tolist()
+			turns.append(["SP{}".format(speaker),start,start+duration," ".join(words)])
+	return sorted(turns,key=lambda turn: turn[1])
+
+# Function that finds the overlapping pairs by comparing every pair of turns.
+# Returns: List of (first,second) index pairs sorted by first then second index.
+def previousOverlappingPairs(turns):
+	return [(first,second) for first in range(len(turns))
+		for second in range(first+1,len(turns))
+		if turns[first][2] > turns[second][1] and turns[second][2] > turns[first][1]]
+
+# Function that times a function on a copy of the turns.
+# Returns: Seconds, Result.
+def timeFunction(function,turns):
+	turns = copy.deepcopy(turns)
+	start = time.time()
+	result = function(turns)
+	return time.time()-start,result
+
+# Function that marks the overlaps of the turns as formatCHAT does.
+def markOverlaps(turns):
+	return CHAT.overlaps([[{'jsonListCombined' : turns}]])
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Overlapping turns benchmark')
+	parser.add_argument('-sizes',action = 'store',dest = 'sizes',type = int,nargs = '+',
+		default = [1000,10000,100000],help = 'Numbers of turns')
+	parser.add_argument('-speakers',action = 'store',dest = 'speakers',type = int,default = 8,
+		help = 'Number of speakers')
+	parser.add_argument('-previous',action = 'store_true',dest = 'previous',
+		help = 'Also time the scan of every pair of turns. It takes minutes above 50000 turns')
+	args = parser.parse_args()
+	for size in args.sizes:
+		turns = conversation(size,args.speakers)
+		seconds,pairs = timeFunction(CHAT.overlappingPairs,turns)
+		print("{0:18} {1:7} turns {2:8} pairs {3:8.3f} s".format('overlappingPairs',
+			len(turns),len(pairs),seconds))
+		if args.previous:
+			previousSeconds,previousPairs = timeFunction(previousOverlappingPairs,turns)
+			assert previousPairs == pairs
+			print("{0:18} {1:7} turns {2:8} pairs {3:8.3f} s".format('every pair',
+				len(turns),len(previousPairs),previousSeconds))
+		seconds = timeFunction(markOverlaps,turns)[0]
+		print("{0:18} {1:7} turns {2:8} pairs {3:8.3f} s".format('overlaps (markers)',
+			len(turns),len(pairs),seconds))
@@ -0,0 +1,73 @@
+'''
+	Benchmark of the time it takes to import the Gailbot driver i.e. the
+	time before the first menu is shown.
+	Uses python -X importtime in a new process for every run and lists the
+	modules that take the longest to import. Results can be appended to a
+	json lines file to track them over time.
+
+	Usage: python benchmarks/startup.py [-runs 5] [-top 15] [-record startup.jsonl]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 5/30/19
+'''
+
+import argparse 								# Library to extract input arguments
+import json
+import os, subprocess, sys, time
+
+# Directory of the Gailbot scripts.
+GAILBOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Code run by each process i.e. the driver without its main block.
+IMPORT_CODE = "import runpy; runpy.run_path({!r},run_name='gailbot')"
+
+
+# Function that imports a script in a new process.
+# Returns: Wall time (seconds), Dictionary from each module imported by the
+# script, not by other modules, to its cumulative import time (seconds).
+def importScript(script):
+	start = time.time()
+	process = subprocess.run([sys.executable,'-X','importtime','-c',IMPORT_CODE.format(script)],
+		cwd=GAILBOT_DIR,stdout=subprocess.DEVNULL,stderr=subprocess.PIPE,universal_newlines=True)
+	seconds = time.time() - start
+	if process.returncode != 0:
+		sys.exit("Import failed:\n" + "\n".join([line for line in process.stderr.splitlines()
+			if not line.startswith("import time:")]))
+	modules = {}
+	for line in process.stderr.splitlines():
+		if not line.startswith("import time:") or "cumulative" in line: continue
+		selfTime,cumulative,name = line[len("import time:"):].split("|")
+		# Modules imported by other modules are indented.
+		if name.startswith("  "): continue
+		modules[name.strip()] = modules.get(name.strip(),0) + int(cumulative)/1e6
+	return seconds,modules
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Gailbot startup benchmark')
+	parser.add_argument('-script',action = 'store',dest = 'script',default = 'gailbot-3.py',
+		help = 'Script to import')
+	parser.add_argument('-runs',action = 'store',dest = 'runs',type = int,default = 5,
+		help = 'Number of runs. The fastest is reported')
+	parser.add_argument('-top',action = 'store',dest = 'top',type = int,default = 15,
+		help = 'Number of slowest top-level imports listed')
+	parser.add_argument('-record',action = 'store',dest = 'record',
+		help = 'Json lines file the result is appended to')
+	args = parser.parse_args()
+	runs = [importScript(args.script) for run in range(args.runs)]
+	seconds,modules = min(runs,key=lambda run: run[0])
+	print("Startup: {0:.3f} s (fastest of {1}), imports: {2:.3f} s".format(seconds,
+		args.runs,sum(modules.values())))
+	topLevel = sorted([(value,name) for name,value in modules.items()],reverse=True)[:args.top]
+	for value,name in topLevel: print("{0:8.3f} s  {1}".format(value,name))
+	if args.record != None:
+		with open(args.record,'a') as f:
+			f.write(json.dumps({"time" : time.strftime('%Y-%m-%d %H:%M:%S'),"script" : args.script,
+				"seconds" : round(seconds,3),"top" : {name : round(value,3) for value,name in topLevel}}) + "\n")
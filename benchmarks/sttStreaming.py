@@ -0,0 +1,175 @@
+'''
+	Benchmark of the streaming parts of the Twisted STT client i.e. writing
+	the recieved results to the json file with ResultWriter and sending an
+	audio file with AudioProducer to a local WebSocket server that counts the
+	bytes it recieves. The result list written at the end and the 2000 byte
+	chunks sent every 10 ms before can be timed next to them.
+	Each run uses a new process, which reports its time and peak memory.
+
+	Usage: python benchmarks/sttStreaming.py [-results 20000] [-interim 3]
+		[-audioMB 90] [-previous] [-previousMB 2]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/4/19
+'''
+
+import argparse 								# Library to extract input arguments
+import json, os, subprocess, sys, tempfile, time
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import STT 										# Twisted Speech to Text client.
+import profiling 								# Per-stage timing traces of requests.
+
+# Words the results are made of.
+VOCABULARY = ['hello','there','%HESITATION','yeah','i','think','so','okay','we','went']
+
+# Words per result.
+RESULT_WORDS = 10
+
+# Size of the audio messages and the delay between them before AudioProducer.
+PREVIOUS_CHUNK_BYTES = 2000
+PREVIOUS_DELAY = 0.01
+
+
+# Function that yields the messages recieved for a transcript, where each
+# final result follows interim results of growing length and is followed by
+# its speaker labels.
+# Input: Number of final results, Number of interim results per final result.
+def messages(numResults,numInterim):
+	for index in range(numResults):
+		words = [[VOCABULARY[(index+count)%len(VOCABULARY)],index*4+count*0.35,
+			index*4+count*0.35+0.3] for count in range(RESULT_WORDS)]
+		for count in range(1,numInterim+2):
+			partial = words[:len(words)*count//(numInterim+1)]
+			yield {'result_index' : index, 'processing_metrics' : {'periodic' : False,
+				'processed_audio' : {'received' : index*4.0}}, 'results' : [{'final' : count > numInterim,
+				'alternatives' : [{'transcript' : " ".join(word[0] for word in partial),
+				'word_confidence' : [[word[0],0.9] for word in partial],'timestamps' : partial}]}]}
+		yield {'speaker_labels' : [{'from' : word[1],'to' : word[2],'speaker' : index%2,
+			'confidence' : 0.5,'final' : True} for word in words]}
+
+# Function that writes the messages as they are recieved with ResultWriter.
+def writeStreaming(path,numResults,numInterim):
+	writer = STT.ResultWriter(path)
+	for message in messages(numResults,numInterim): writer.append(message)
+	writer.close()
+
+# Function that keeps every message and writes the list when the connection
+# closes, as the client did before ResultWriter.
+def previousWrite(path,numResults,numInterim):
+	json_output = []
+	for message in messages(numResults,numInterim): json_output.append(message)
+	with open(path,"w") as f: f.write(json.dumps(json_output, indent=4,sort_keys=True))
+
+# Function that times a result writing function in this process.
+# Returns: Seconds, Peak memory (MB) before and after writing.
+def timeWrite(function,path,numResults,numInterim):
+	before = profiling.peakMemory() ; start = time.time()
+	function(path,numResults,numInterim)
+	return time.time()-start,before,profiling.peakMemory()
+
+# Function that sends an audio file to a local WebSocket server in this
+# process and returns when the server has recieved all of it.
+# Input: Audio file name, 'producer' or 'previous'.
+# Returns: Seconds, Bytes recieved, Peak memory (MB) before and after sending.
+def send(audioFile,sender):
+	from autobahn.twisted.websocket import WebSocketServerProtocol, WebSocketServerFactory, \
+		WebSocketClientProtocol, WebSocketClientFactory, connectWS, listenWS
+	from twisted.internet import reactor
+	stats = {'recieved' : 0}
+
+	# Server that counts the audio bytes and closes after the empty message.
+	class SinkProtocol(WebSocketServerProtocol):
+		def onMessage(self,payload,isBinary):
+			if isBinary and len(payload) == 0:
+				stats['seconds'] = time.time()-stats['start'] ; self.sendClose(1000)
+			elif isBinary: stats['recieved'] += len(payload)
+
+	# Client that sends the audio as WSInterfaceProtocol does.
+	class SendProtocol(WebSocketClientProtocol):
+		def onOpen(self):
+			self.bytesSent = 0 ; stats['start'] = time.time()
+			if sender == 'producer':
+				self.producer = STT.AudioProducer(self,audioFile,STT.Audio_chunk_size_bytes)
+				self.transport.registerProducer(self.producer,True)
+				self.producer.resumeProducing()
+			else:
+				with open(audioFile,'rb') as f: data = f.read()
+				self.checkChunk(data)
+
+		# Function that sends the audio in small chunks with a delay between
+		# them, as checkChunk did before AudioProducer.
+		def checkChunk(self,data):
+			chunk = data[self.bytesSent:self.bytesSent+PREVIOUS_CHUNK_BYTES]
+			self.bytesSent += len(chunk) ; self.sendMessage(chunk,isBinary=True)
+			if self.bytesSent >= len(data): self.sendMessage(b'',isBinary=True)
+			else: reactor.callLater(PREVIOUS_DELAY,self.checkChunk,data)
+
+		def onClose(self,wasClean,code,reason):
+			reactor.stop()
+
+	serverFactory = WebSocketServerFactory()
+	serverFactory.protocol = SinkProtocol
+	port = listenWS(serverFactory,interface='127.0.0.1')
+	clientFactory = WebSocketClientFactory("ws://127.0.0.1:{}".format(port.getHost().port))
+	clientFactory.protocol = SendProtocol
+	before = profiling.peakMemory()
+	connectWS(clientFactory)
+	reactor.run()
+	return stats['seconds'],stats['recieved'],before,profiling.peakMemory()
+
+# Function that runs this script in a new process.
+# Returns: Values reported by the process.
+def runProcess(*options):
+	output = subprocess.run([sys.executable,os.path.abspath(__file__)] + list(options),
+		stdout=subprocess.PIPE,check=True).stdout
+	return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'STT client streaming benchmark')
+	parser.add_argument('-results',action = 'store',dest = 'results',type = int,default = 20000,
+		help = 'Number of final results written')
+	parser.add_argument('-interim',action = 'store',dest = 'interim',type = int,default = 3,
+		help = 'Interim results per final result')
+	parser.add_argument('-audioMB',action = 'store',dest = 'audioMB',type = float,default = 90,
+		help = 'Size of the audio file sent (MB)')
+	parser.add_argument('-previous',action = 'store_true',dest = 'previous',
+		help = 'Also time writing and sending as the client did before')
+	parser.add_argument('-file',action = 'store',dest = 'file',help = argparse.SUPPRESS)
+	parser.add_argument('-previousMB',action = 'store',dest = 'previousMB',type = float,default = 2,
+		help = 'Size of the audio file sent with the previous chunking, which sends about 0.2 MB/s')
+	parser.add_argument('-write',action = 'store',dest = 'write',help = argparse.SUPPRESS)
+	parser.add_argument('-send',action = 'store',dest = 'send',nargs = 2,help = argparse.SUPPRESS)
+	args = parser.parse_args()
+	writers = {'ResultWriter' : writeStreaming, 'previous' : previousWrite}
+	if args.write != None:
+		print(json.dumps(timeWrite(writers[args.write],args.file,args.results,args.interim))) ; sys.exit()
+	if args.send != None:
+		print(json.dumps(send(*args.send))) ; sys.exit()
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory,"results-json.txt")
+		numMessages = args.results*(args.interim+2)
+		for name in ['ResultWriter','previous'] if args.previous else ['ResultWriter']:
+			seconds,before,after = runProcess('-write',name,'-file',path,'-results',str(args.results),
+				'-interim',str(args.interim))
+			print("{0:13} {1:8} messages {2:7.2f} s {3:9.0f} messages/s {4:7.1f} MB written  "
+				"peak memory {5:7.1f} MB (+{6:.1f} MB)".format(name,numMessages,seconds,
+				numMessages/seconds,os.path.getsize(path)/(1024*1024),after,after-before))
+		senders = [('producer',args.audioMB)]
+		if args.previous: senders.append(('previous',args.previousMB))
+		for name,size in senders:
+			audioFile = os.path.join(directory,"{}.raw".format(name))
+			with open(audioFile,'wb') as f:
+				for count in range(int(size*1024)): f.write(os.urandom(1024))
+			seconds,recieved,before,after = runProcess('-send',audioFile,name)
+			assert recieved == os.path.getsize(audioFile)
+			print("{0:13} {1:7.1f} MB sent {2:7.2f} s {3:8.2f} MB/s  peak memory {4:7.1f} MB (+{5:.1f} MB)".format(
+				name,recieved/(1024*1024),seconds,recieved/(1024*1024)/seconds,after,after-before))
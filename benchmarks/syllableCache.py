@@ -0,0 +1,89 @@
+'''
+	Benchmark of the syllable cache on the corpus files.
+	The transcripts are counted by several processes at the same time, as the
+	post-processing workers do, first with an empty disk cache (cold) and
+	then with the filled one (warm). Requires big_phoney.
+
+	Usage: python benchmarks/syllableCache.py [-processes 4] [files ...]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/17/19
+'''
+
+import argparse 								# Library to extract input arguments
+import os, re, sys, time, tempfile, sqlite3
+from multiprocessing import Pool 				# Worker processes.
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import syllables 								# Script that counts syllables.
+
+# Directory of the corpus files used by default.
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+	"Corpus Training files")
+
+
+# Function that reads the transcript lines of a corpus file.
+# Corpus files are either plain text or exported as RTF, where each line of
+# text ends with a backslash. RTF control words are removed.
+def readTranscripts(fileName):
+	with open(fileName,encoding='utf-8',errors='ignore') as f: text = f.read()
+	rtf = text.startswith("{\\rtf") ; transcripts = []
+	for line in text.splitlines():
+		if rtf and not line.endswith("\\"): continue
+		if rtf:
+			line = re.sub(r"\\'[0-9a-f]{2}","'",line)
+			line = re.sub(r"\\[a-z]+-?\d* ?|[{}\\]","",line)
+		if len(line.strip()) > 0: transcripts.append(line.strip())
+	return transcripts
+
+# Function that sets the disk cache of a worker process.
+def useCache(cachePath):
+	syllables.cachePath = cachePath
+
+# Function that counts the syllables of a chunk of transcripts in a worker.
+# Returns: Syllable counts, Cache statistics of the worker.
+def countChunk(transcripts):
+	for key in syllables.cacheStats: syllables.cacheStats[key] = 0
+	syllables.memoryCache.clear()
+	return syllables.countTranscripts(transcripts),dict(syllables.cacheStats)
+
+# Function that counts all transcripts with a pool of processes.
+# Returns: Seconds, Total syllables, Cache statistics of all workers.
+def run(chunks,processes,cachePath):
+	start = time.time()
+	with Pool(processes,initializer=useCache,initargs=(cachePath,)) as pool:
+		results = pool.map(countChunk,chunks,chunksize=1)
+	stats = {key : sum([result[1][key] for result in results]) for key in syllables.cacheStats}
+	return time.time()-start,sum([sum(result[0]) for result in results]),stats
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Syllable cache benchmark')
+	parser.add_argument('files',nargs = '*',help = 'Corpus files. Defaults to the corpus training files')
+	parser.add_argument('-processes',action = 'store',dest = 'processes',type = int,default = 4,
+		help = 'Number of worker processes')
+	parser.add_argument('-chunk',action = 'store',dest = 'chunk',type = int,default = 50,
+		help = 'Transcripts counted per task')
+	args = parser.parse_args()
+	files = args.files or [os.path.join(CORPUS_DIR,name) for name in sorted(os.listdir(CORPUS_DIR))]
+	transcripts = [line for fileName in files for line in readTranscripts(fileName)]
+	chunks = [transcripts[i:i+args.chunk] for i in range(0,len(transcripts),args.chunk)]
+	print("{0} transcripts, {1} words, {2} unique words, {3} processes".format(len(transcripts),
+		sum([len(line.split()) for line in transcripts]),
+		len(set(word for line in transcripts for word in line.split())),args.processes))
+	with tempfile.TemporaryDirectory() as directory:
+		cachePath = os.path.join(directory,"syllable-cache.sqlite")
+		for name in ("cold","warm"):
+			seconds,total,stats = run(chunks,args.processes,cachePath)
+			hits = stats['memoryHits'] + stats['diskHits']
+			print("{0}: {1:7.2f} s  {2} syllables  hit rate {3:.1%}  {4} counted".format(
+				name,seconds,total,hits/max(1,sum(stats.values())),stats['misses']))
+		with sqlite3.connect(cachePath) as cache:
+			print("Cached words: {}".format(cache.execute("SELECT COUNT(*) FROM syllables").fetchone()[0]))
@@ -0,0 +1,90 @@
+'''
+	Benchmark of writing the word CSV file of a transcript and the combined
+	CSV file of a conversation with the table writer, against the unclosed
+	csv writers used before. Optionally also writes Parquet and Feather files,
+	which requires pyarrow.
+
+	Usage: python benchmarks/tableWriter.py [-rows 1000000] [-formats parquet feather]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/20/19
+'''
+
+import argparse 								# Library to extract input arguments
+import csv, gc, os, sys, tempfile, time
+import numpy 									# Library to have multi-dimensional homogenous arrays.
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tableWriter 								# Writes CSV / Parquet / Feather tables.
+from wordTable import WordTable, COLUMNS 		# Columnar table of transcribed words.
+
+# Field names of the CSV files, as in postProcessing.
+CSVfields = ['Speaker Label','Start Time','End Time','Transcript','Confidence',
+	'Periodic','Recieved Audio', 'Result Index']
+
+# Words the transcript is made of.
+VOCABULARY = ['hello','there','%HESITATION','yeah','i','think','so','okay','we','went']
+
+
+# Function that generates a transcript of two speakers.
+# Returns: WordTable of the words.
+def transcript(numRows):
+	rng = numpy.random.RandomState(0)
+	starts = numpy.cumsum(rng.uniform(0.1,0.6,numRows))
+	return WordTable(rng.choice(['SP1','SP2'],numRows).tolist(),starts,starts+0.3,
+		rng.choice(VOCABULARY,numRows).tolist(),rng.uniform(0,1,numRows),None,
+		starts+1,numpy.arange(numRows)//10)
+
+# Function that writes both CSV files with the table writer.
+def writeTables(table,rows,directory):
+	tableWriter.writeColumns(os.path.join(directory,"words.csv"),CSVfields,
+		[getattr(table,name) for name in COLUMNS])
+	tableWriter.writeRows(os.path.join(directory,"combined.csv"),CSVfields,rows)
+
+# Function that writes both CSV files as jsonToCSV and writeCSVs did before
+# the table writer, with files that are left to be closed by the garbage
+# collector and the field names inserted in front of the combined rows.
+def previousWriteTables(table,rows,directory):
+	writer = csv.writer(open(os.path.join(directory,"words.csv"),'w'))
+	writer.writerow(CSVfields)
+	writer.writerows(table.rows())
+	rows.insert(0,CSVfields)
+	writer = csv.writer(open(os.path.join(directory,"combined.csv"),'w'))
+	writer.writerows(rows)
+	del rows[0]
+
+# Function that times a writing function, including closing its files.
+# Returns: Seconds.
+def timeWrite(function,table,rows,directory):
+	start = time.time()
+	function(table,rows,directory)
+	gc.collect()
+	return time.time()-start
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Table writer benchmark')
+	parser.add_argument('-rows',action = 'store',dest = 'rows',type = int,default = 1000000,
+		help = 'Number of words of the transcript')
+	parser.add_argument('-formats',action = 'store',dest = 'formats',nargs = '*',default = [],
+		help = 'Formats written besides CSV i.e. parquet, feather')
+	args = parser.parse_args()
+	table = transcript(args.rows)
+	# The combined rows hold the first four fields, as the turns of a combined transcript do.
+	rows = table.rows(4)
+	with tempfile.TemporaryDirectory() as directory:
+		for name,function in (('tableWriter',writeTables),('previous',previousWriteTables)):
+			tableWriter.tableFormats = args.formats if name == 'tableWriter' else []
+			seconds = timeWrite(function,table,rows,directory)
+			size = sum([os.path.getsize(os.path.join(directory,fileName))
+				for fileName in os.listdir(directory)])
+			print("{0:12} {1:8} rows {2:7.2f} s {3:9.0f} rows/s {4:7.1f} MB".format(
+				name,args.rows,seconds,2*args.rows/seconds,size/(1024*1024)))
+			for fileName in os.listdir(directory): os.remove(os.path.join(directory,fileName))
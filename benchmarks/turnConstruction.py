@@ -0,0 +1,87 @@
+'''
+	Benchmark of the CHAT turn construction on long transcripts.
+	Builds the turns of generated transcripts of increasing size and reports
+	the time per word, which stays flat when turn construction is linear.
+	The word-by-word merge loop used before can be timed next to it.
+
+	Usage: python benchmarks/turnConstruction.py [-sizes 25000 50000 100000 200000]
+		[-speakers 1] [-previous]
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/4/19
+'''
+
+import argparse 								# Library to extract input arguments
+import os, sys, time
+import numpy 									# Library to have multi-dimensional homogenous arrays.
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CHAT 									# Script to produce CHAT files.
+from wordTable import WordTable 				# Columnar table of transcribed words.
+
+# Words the transcripts are made of.
+VOCABULARY = ['hello','there','%HESITATION','yeah','i','think','so','okay','we','went']
+
+
+# Function that generates a transcript of words with short gaps, which mostly
+# fall under the turn end threshold.
+# Input: Number of words, Number of speakers.
+# Returns: WordTable of the words.
+def transcript(numWords,numSpeakers):
+	rng = numpy.random.RandomState(0)
+	durations = rng.uniform(0.1,0.6,numWords)
+	gaps = rng.choice([0,0.02,0.05,0.15,0.8],numWords)
+	starts = numpy.cumsum(durations+gaps) - durations
+	speakers = rng.randint(0,numSpeakers,numWords) if numSpeakers > 1 else numpy.zeros(numWords,int)
+	return WordTable(["SP{}".format(speaker) for speaker in speakers.tolist()],starts,
+		starts+durations,rng.choice(VOCABULARY,numWords).tolist())
+
+# Function that builds turns with the word-by-word merge loop used before
+# constructTurn worked on the table columns.
+def previousConstructTurn(infoList):
+	for infoDic in infoList:
+		count = 0
+		jsonList = infoDic['jsonList'].rows(4)
+		while count < len(jsonList) - 1:
+			curr = jsonList[count] ; nxt = jsonList[count+1]
+			if nxt[1] - curr[2] <= CHAT.CHATVals['turnEndThreshold'] and curr[0] == nxt[0]:
+				jsonList[count] = [curr[0],curr[1],nxt[2],curr[3]+" "+nxt[3]]
+				del jsonList[count+1]
+			else: count +=1
+		for elem in jsonList: elem[3]=elem[3].translate({ord('.'):None})
+		infoDic['jsonListTurns'] = jsonList
+	return infoList
+
+# Function that times a turn construction function on a transcript.
+# Returns: Seconds, Number of turns.
+def timeTurns(function,table):
+	infoList = [{'jsonList' : table}]
+	start = time.time()
+	function(infoList)
+	return time.time()-start,len(infoList[0]['jsonListTurns'])
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Turn construction benchmark')
+	parser.add_argument('-sizes',action = 'store',dest = 'sizes',type = int,nargs = '+',
+		default = [25000,50000,100000,200000],help = 'Numbers of words')
+	parser.add_argument('-speakers',action = 'store',dest = 'speakers',type = int,default = 1,
+		help = 'Number of speakers. One speaker is the worst case of the merge loop')
+	parser.add_argument('-previous',action = 'store_true',dest = 'previous',
+		help = 'Also time the merge loop used before')
+	args = parser.parse_args()
+	functions = [('constructTurn',CHAT.constructTurn)]
+	if args.previous: functions.append(('previous',previousConstructTurn))
+	for size in args.sizes:
+		table = transcript(size,args.speakers)
+		for name,function in functions:
+			seconds,turns = timeTurns(function,table)
+			print("{0:14} {1:8} words {2:7} turns {3:8.3f} s {4:7.3f} us/word".format(
+				name,size,turns,seconds,seconds/size*1e6))
@@ -23,16 +23,6 @@
 
 '''
 
-# Libraries to build standalone executable.
-import sklearn.ensemble
-import sklearn.tree
-import sklearn.neighbors.typedefs
-import sklearn.neighbors.quad_tree
-import sklearn.tree._utils
-import sklearn
-import sklearn.utils._cython_blas
-from sklearn.preprocessing import StandardScaler
-
 import json
 import sys, time, os
 from termcolor import colored					# Text coloring library
@@ -40,40 +30,48 @@ import time 									# Timing library
 from prettytable import PrettyTable				# Table printing library
 import copy
 import argparse  
-import subprocess
 import queue as Queue 
 import tempfile									# Directory library
 import shutil									# Directory library
-from distutils.dir_util import copy_tree
 import inquirer 								# Selection interface library.
 import AppKit 									# Terminal resizing library.
 import yaml 									# Yaml parsing library.
+import lazyImport 								# Imports modules on first use.
+import STTJournal 								# Journal of transcription jobs.
 
 # Gailbot scripts
-import STT 										# Script that sends transcription requests
+STT = lazyImport.module("STT") 					# Script that sends transcription requests
+asyncSTT = lazyImport.module("asyncSTT") 		# asyncio client that does not need a restart
+import mediaPrep 								# Runs ffmpeg / opusenc jobs concurrently.
 import language_model							# Script that selects language models
 import acoustic_model							# script that selects acoustic models
 import postProcessing 							# Script that performs post-processing.
 import CHAT										# script to produce CHAT files.
+import tableWriter 								# Writes CSV / Parquet / Feather tables.
+import profiling 								# Per-stage timing traces of requests.
 
-# Audio processing libraries
-from pydub import AudioSegment
-from pydub.utils import make_chunks
-
-# Audio recording libraries
-import pyaudio
+# Audio recording libraries, loaded when recording starts.
+pyaudio = lazyImport.module("pyaudio")
 import wave
 
-# Progressbar library
-from progressbar import AnimatedMarker, Bar, BouncingBar, Counter, ETA, \
-	AdaptiveETA, FileTransferSpeed, FormatLabel, Percentage, \
-	ProgressBar, ReverseBar, RotatingMarker, \
-	SimpleProgress, Timer, UnknownLength
+# Progressbar library, loaded when recording starts.
+progressbar = lazyImport.module("progressbar")
 
 
 # *** Global variables / invariants ***
 
 
+# Set False to run without prompts e.g. in batch mode.
+interactive = True
+
+# Use the asyncio STT client instead of the Twisted reactor.
+# The reactor cannot be restarted, so Gailbot otherwise restarts after every request.
+useAsyncSTT = True
+
+# Maximum number of files transcribed at the same time.
+# Each file holds a connection to the service and streams its audio.
+maxConcurrentRequests = 4
+
 # Constants for audio segmentation and chunking
 maxChunkBytes = 90000000   								# Max audio length per request = 90 MB.
 
@@ -84,7 +82,7 @@ recordingVals = {
 		"recordSeconds" : 30,								# Number of seconds to be recorded
 		"rate" : 48000,										# Recording rate
 	#	"audioFilename" : 'Recorded.wav',
-	"Format" : pyaudio.paInt16}								# Recording format
+	"Format" : 8}											# Recording format i.e. pyaudio.paInt16
 recordingValsOriginal = recordingVals.copy()
 
 # Watson request variables
@@ -148,6 +146,17 @@ shellCommands = {
 # Queue of intermediate files to be deleted at the end of request.
 deleteQueue = Queue.Queue()
 
+# Runs audio extraction, opus encoding and overlay jobs concurrently.
+mediaScheduler = mediaPrep.MediaScheduler()
+
+# Jobs that prepare each file of the current request. Each returns the name
+# of the file to transcribe, so a file is transcribed as soon as it is ready.
+fileJobs = {}
+
+# Overlay jobs of the current request. They only have to finish before the
+# combined audio is copied, so they run while the files are transcribed.
+overlayJobs = []
+
 # Original terminal size
 TERMcols = 75
 TERMrows = 30
@@ -281,6 +290,7 @@ def request_menu(username,password,closure):
 # Function that records a new conversation before transcribing it.
 def transcribe_new(username,password,closure):
 	if not recording_menu(username,password,closure): return
+	profiling.startTrace()
 	# Setting and verifying dictionary values.
 	pairDic = {"files" : []}
 	watsonVals['files'] = [recordingVals['audioFilename']]
@@ -288,9 +298,11 @@ def transcribe_new(username,password,closure):
 		print("\nERROR: File does not exist")
 		return
 	# Verifying content Type and extracting opus file if needed.
-	watsonVals['files'],pairDic = convertOpus(watsonVals['files'],deleteQueue,pairDic)
+	with profiling.span('convertOpus') as items:
+		fileJobs.update(convertOpus(watsonVals['files'],deleteQueue))
+		items['files'] = len(watsonVals['files'])
 	setOutputDir(watsonVals['files'],watsonVals['files'][0][:watsonVals['files'][0].rfind('.')])	
-	watsonVals['contentType'] = setContentType(audioFormatMapping,watsonVals['files'])
+	watsonVals['contentType'] = setContentType(audioFormatMapping,transcribedNames(watsonVals['files']))
 	# Setting speaker names
 	setSpeakers(watsonVals['files'],pairDic)
 
@@ -308,6 +320,7 @@ def transcribe_new(username,password,closure):
 
 # Function that transcribes a pre-recorded conversation
 def transcribe_recorded(username,password,closure):
+	profiling.startTrace()
 	if getAudioFileList(True) == None: return
 
 	# Selecting post-processing modules to be implemented
@@ -339,8 +352,9 @@ menu_actions = {
 # Function that records the audio for real-time transcription mode.
 def record_audio(username,password,closure):
 	# Setting up a progressbar
-	widgets = ['Recording: ', Percentage(), ' ', Bar("|"), ' ', ETA(), ' ']
-	pbar = ProgressBar(widgets=widgets, maxval=recordingVals['rate']/recordingVals['Recording_chunk_size'] * recordingVals['recordSeconds'])
+	widgets = ['Recording: ', progressbar.Percentage(), ' ', progressbar.Bar("|"), ' ',
+		progressbar.ETA(), ' ']
+	pbar = progressbar.ProgressBar(widgets=widgets, maxval=recordingVals['rate']/recordingVals['Recording_chunk_size'] * recordingVals['recordSeconds'])
 	print('\n\n')
 
 	# Creating a PyAudio instance
@@ -500,19 +514,24 @@ def changeDirectory(username,password,closure):
 	# Removing original directory
 	try: os.rmdir(direct)
 	except: 
-		try: copy_tree(direct,out) ;shutil.rmtree(direct)
+		import distutils.dir_util, distutils.errors 	# Loaded only when moving directories.
+		try: distutils.dir_util.copy_tree(direct,out) ;shutil.rmtree(direct)
 		except distutils.errors.DistutilsFileError:pass
 
 
 # Function that restores watsonVals to defaults
 def watsonDefaults(username,password,closure):
-	for k,v in watsonValsOriginal.items(): watsonVals[k] = v
-	watsonVals['output-directory'].clear()
+	resetWatsonVals(watsonValsOriginal)
 	#input('Values reset!\nPress any key to return to menu...\n')
 	os.system('clear')
 	# Getting new audio file names before returning to main menu 
 	getAudioFileList(closure['watsonDefaults'])			
 
+# Function that sets watsonVals to the given values and clears the files of
+# the previous request.
+def resetWatsonVals(defaults):
+	for k,v in defaults.items(): watsonVals[k] = v
+	for k in ('output-directory','names','combinedAudio'): watsonVals[k].clear()
 
 # Actions for the request menu
 request_actions = {
@@ -577,48 +596,50 @@ def getAudioFileList(getVal=True):
 		print("Press 0 to go back to options\n")
 		localDic = {}
 		if get_val(localDic,'files',list)==None: return
-
-
-		# Extracting '-dirPair' flag files
-		localDic['files']= setDirPairs(localDic['files'])
-		
-		# Extracting all files from a directory and removing -directory flag
-		localDic['files'] = setDirectoryFiles(localDic['files'])
-
-
-		if len(localDic['files']) == 0: print(colored("\nERROR: No files to process\n",'red')) ; continue
-		# Extracting pairs from the input list and removing -pair keyword
-		localDic['files'],pairDic = setFilePairs(localDic['files'])
-
-
-		# Ensuring files exist
-		if any(file for file in localDic['files'] if not os.path.isfile(file)):
-			print(colored("\nERROR: File does not exist",'red')) ; continue
-		# Verifying file formats.
-		if not verifyFormat(videoFormats,audioFormatMapping,localDic['files']): continue
-		# Extracting audio from video inputs.
-		localDic['files'],pairDic = extractAudio(localDic['files'],pairDic)
-		# Converting files larger than threshold to Opus 
-		localDic['files'],pairDic = convertOpus(localDic['files'],deleteQueue,pairDic)
-		# Setting output directories.
-		for file in localDic['files']:
-			trimmedKeys = [x[:x.find('.')] for x in watsonVals['output-directory'].keys()]
-			# Setting putput directory in case opus files were generated for file pairs.
-			if file[:file.find('.')] in trimmedKeys and file not in watsonVals['output-directory'].keys():
-				watsonVals['output-directory'][file] = watsonVals['output-directory'][file[:file.find('.')]+'.wav']
-				del watsonVals['output-directory'][file[:file.find('.')]+'.wav']
-			elif file not in watsonVals['output-directory'].keys():
-				setOutputDir([file],file[:file.rfind('.')])
-		# Setting audio content type
-		watsonVals['contentType'] = setContentType(audioFormatMapping,
-			localDic['files'])
-		# Setting speaker names
-		setSpeakers(localDic['files'],pairDic)	
-		# Overlaying pair files
-		overlay(pairDic['files'],watsonVals['output-directory'])	
-		# Setting requestd ictionary variables
-		watsonVals['files'] = localDic['files']
-		return True
+		if prepareFiles(localDic['files']): return True
+
+# Function that verifies and prepares input files for a request.
+# Uses the same flags as the file prompt i.e. '-pair', '-dir' and '-dirPair'.
+# Input: List of file names and flags.
+# Returns None if the files cannot be used. True to proceed
+def prepareFiles(files):
+	# Extracting '-dirPair' flag files
+	files = setDirPairs(files)
+	# Extracting all files from a directory and removing -directory flag
+	files = setDirectoryFiles(files)
+	if len(files) == 0: print(colored("\nERROR: No files to process\n",'red')) ; return
+	# Extracting pairs from the input list and removing -pair keyword
+	files,pairDic = setFilePairs(files)
+	# Ensuring files exist
+	if any(file for file in files if not os.path.isfile(file)):
+		print(colored("\nERROR: File does not exist",'red')) ; return
+	# Verifying file formats.
+	if not verifyFormat(videoFormats,audioFormatMapping,files): return
+	# Extracting audio from video inputs.
+	# The jobs themselves are timed in the media worker threads.
+	jobs = {}
+	with profiling.span('extractAudio') as items:
+		files,pairDic = extractAudio(files,pairDic,jobs) ; items['files'] = len(files)
+	# Overlaying pair files once their audio is extracted.
+	with profiling.span('overlay') as items:
+		overlay(pairDic['files'],watsonVals['output-directory'],jobs) ; items['pairs'] = len(pairDic['files'])
+	# Converting files larger than threshold to Opus once their audio is extracted.
+	# The files are transcribed as their jobs finish.
+	with profiling.span('convertOpus') as items:
+		fileJobs.update(convertOpus(files,deleteQueue,jobs)) ; items['files'] = len(files)
+	# Setting output directories.
+	for file in files:
+		if file not in watsonVals['output-directory'].keys(): setOutputDir([file],file[:file.rfind('.')])
+	# Setting audio content type of the files and of their opus versions.
+	watsonVals['contentType'] = setContentType(audioFormatMapping,transcribedNames(files))
+	# Setting speaker names
+	setSpeakers(files,pairDic)	
+	# Setting combined audio for pair files.
+	for pair in pairDic['files']:
+		for file in transcribedNames(pair): watsonVals['combinedAudio'][file] = combinedName(pair)
+	# Setting requestd ictionary variables
+	watsonVals['files'] = files
+	return True
 
 # Helper Function that gets an input for the recording menu
 def get_val(dic,key,type):
@@ -642,25 +663,67 @@ def get_val(dic,key,type):
 # Function that sends requests to Watson.
 def sendRequest(username,password,closure):
 	os.system('clear')
+	with profiling.span('transcribe'): outputInfo = transcribe(closure)
+	# Performing post-processing
+	with profiling.span('postProcess'): postProcessing.postProcess(outputInfo)
+	# Deleting generated opus files
+	deleteIntermediateFiles()
+	trace = profiling.writeTrace('request')
+	if trace != None: print("\nTrace written: {}".format(trace))
+	input("\nRequest Processed\nPress any key to continue")
+	# Restoring defaults after request
+	closure['watsonDefaults'] = False
+	watsonDefaults(username,password,closure)
+	recordDefaults(username,password,closure)
+	time.sleep(0.5)
+	if useAsyncSTT: return
+	# Preventing the reactor from restarting.
+	os.system('reset')
+	os.execl(sys.executable, sys.executable, *sys.argv)	
+
+# Function that transcribes the files in watsonVals and copies the audio
+# to the output directories.
+# Returns: List of output information dictionaries for successful files.
+def transcribe(closure):
 	# Setting request variables.
 	if watsonVals['token-type'] == 'Access' : token = 0
 	elif watsonVals['token-type'] == 'Watson' : token = 1
-	print
 	# Command to run the Speeach to Text core module.
-	outputInfo = STT.run(username=watsonVals['username'],password = watsonVals['password'],
-		base_model= watsonVals['base-model'],acoustic_id = watsonVals['acoustic-id'],
-		language_id=watsonVals['custom-id'],watson_token=token,
-		audio_files=watsonVals['files'],names=watsonVals['names'],combined_audio = '',
-		contentType=watsonVals['contentType'],num_threads = len(watsonVals['files']),
-		customization_weight = watsonVals['customizationWeight'],
-		out_dir=watsonVals['output-directory'],opt_out = watsonVals['opt-out'],
-		region = closure['region'])
+	client = asyncSTT if useAsyncSTT else STT
+	files = watsonVals['files'] ; outDir = watsonVals['output-directory'] ; names = watsonVals['names']
+	# The asyncio client transcribes each file as soon as its job finishes.
+	if useAsyncSTT: extra = {'ready' : dict(fileJobs)}
+	else:
+		prepared = waitForFiles(files) ; extra = {}
+		files = [prepared[file] for file in files if file in prepared]
+		outDir = {prepared[file] : outDir[file] for file in prepared}
+		names = {prepared[file] : names[file] for file in prepared}
+	fileJobs.clear()
+	with profiling.span('STT.run') as items:
+		outputInfo = client.run(username=watsonVals['username'],password = watsonVals['password'],
+			base_model= watsonVals['base-model'],acoustic_id = watsonVals['acoustic-id'],
+			language_id=watsonVals['custom-id'],watson_token=token,
+			audio_files=files,names=names,combined_audio = '',
+			contentType=watsonVals['contentType'],
+			num_threads = max(1,min(maxConcurrentRequests,len(files))),
+			customization_weight = watsonVals['customizationWeight'],
+			out_dir=outDir,opt_out = watsonVals['opt-out'],
+			region = closure['region'],**extra)
+		items['files'] = len(outputInfo)
 	# Removing unprocessed files.
+	# Partial results and the journal are kept for files that can be resumed.
 	for dic in outputInfo:
-		if dic['delete'] : 
+		if dic['delete'] and resumable():
+			print(colored("\nWARNING: Transcription incomplete, run the request "
+				"again to resume: {}".format(dic['audioFile']),'red'))
+		elif dic['delete'] : 
 			try: shutil.rmtree(dic['outputDir'])
 			except: pass 
 	outputInfo = [dic for dic in outputInfo if not dic['delete']]
+	# Waiting for the combined audio of pair files.
+	for job in overlayJobs:
+		if job.exception() != None: print(colored("\nERROR: {}".format(job.exception()),'red'))
+	overlayJobs.clear()
 	# Adding combined audio information to output.
 	for dic in outputInfo:
 		# Copying original audiofiles to output directory
@@ -675,36 +738,55 @@ def sendRequest(username,password,closure):
 			dic['audioFile'] = watsonVals['combinedAudio'][dic['audioFile']]
 		# Copying audiofiles to output directory
 		copyFile(dic['audioFile'],dic['outputDir']+'/')
-	# Performing post-processing
-	postProcessing.postProcess(outputInfo)
-	# Deleting generated opus files
+	return outputInfo
+
+# Function that deletes the intermediate files generated for a request.
+def deleteIntermediateFiles():
 	while not deleteQueue.empty(): os.remove(deleteQueue.get_nowait())
-	input("\nRequest Processed\nPress any key to continue")
-	# Restoring defaults after request
-	closure['watsonDefaults'] = False
-	watsonDefaults(username,password,closure)
-	recordDefaults(username,password,closure)
-	time.sleep(0.5)
-	# Preventing the reactor from restarting.
-	os.system('reset')
-	os.execl(sys.executable, sys.executable, *sys.argv)	
 
 # Function that converts audio to ogg / opus format.
+# Files are encoded concurrently, each as soon as its audio is extracted.
 # Requires opusend exe : https://mf4.xiph.org/jenkins/view/opus/job/opus-tools/ws/man/opusenc.html
-def convertOpus(audiofileList,queue,pairDic):
-	names = []
-	for audiofile in audiofileList:
-		if os.path.getsize(audiofile) > maxChunkBytes:
-			opusName = audiofile[:audiofile.find('.')] + ".opus"
-			cmd = shellCommands['convertOpus'].format(audiofile,opusName)
-			subprocess.call(cmd, shell=True)
-			names.append(opusName)
-			queue.put(opusName)	
-			for pair in pairDic['files']:			# Changing pair filenames
-				for count,file in enumerate(pair): 
-					if file == audiofile:pair[count] = opusName
-		else: names.append(audiofile)
-	return names,pairDic
+# Input: Files, Queue of files to delete, Dictionary from file to the job
+# that creates it.
+# Returns: Dictionary from file to the job returning the name of the file to transcribe.
+def convertOpus(audiofileList,queue,jobs=None):
+	if jobs == None: jobs = {}
+	return {audiofile : mediaScheduler.submit(encodeOpus,audiofile,queue,
+		dependencies=[jobs.get(audiofile)]) for audiofile in audiofileList}
+
+# Function that encodes a file larger than the request limit to opus.
+# The file is transcribed without encoding if encoding fails.
+# Returns: Name of the file to transcribe.
+def encodeOpus(audiofile,queue):
+	if os.path.getsize(audiofile) <= maxChunkBytes: return audiofile
+	opusName = opusFileName(audiofile)
+	try: mediaPrep.runCommand(shellCommands['convertOpus'].format(audiofile,opusName),'convertOpus.job')
+	except OSError as e:
+		print(colored("\nERROR: {}".format(e),'red')) ; return audiofile
+	queue.put(opusName)
+	return opusName
+
+# Function that returns the name of the opus file of an audio file.
+def opusFileName(audiofile):
+	return audiofile[:audiofile.find('.')] + ".opus"
+
+# Function that returns the names a file can be transcribed as i.e. its own
+# name and the name of its opus file.
+def transcribedNames(fileList):
+	return [name for file in fileList for name in (file,opusFileName(file))]
+
+# Function that waits for the jobs of the files of the current request.
+# Used by the Twisted client, which needs all files before it starts.
+# Returns: Dictionary from each file that was prepared to the name of the
+# file to transcribe.
+def waitForFiles(fileList):
+	names = {}
+	for file in fileList:
+		try: names[file] = fileJobs[file].result() if file in fileJobs else file
+		except Exception as e:
+			print(colored("\nERROR: Could not prepare: {0}\nDetails: {1}".format(file,e),'red'))
+	return names
 
 # Function that sets the contentType parameter based on the type of audio
 def setContentType(formatDic,audioFileList):
@@ -718,9 +800,11 @@ def setContentType(formatDic,audioFileList):
 
 # Function that extracts audio from video file if required.
 # Video format must be in Video Format Dictionary.
-def extractAudio(fileList,pairDic):
+# Input: Files, Pair dictionary, Dictionary the extraction job of each new file is added to.
+def extractAudio(fileList,pairDic,jobs):
 	newList = []
 	for file in fileList:
+		numFiles = len(newList)
 		for k,v in videoFormatChannels.items():
 			extension = file[file.find('.')+1:].lower()
 			fileName = file[:file.find('.')+1]
@@ -740,7 +824,10 @@ def extractAudio(fileList,pairDic):
 				# Adding files as a pair
 				pairDic['files'].append([fileName[:-1]+"-speaker1.wav",fileName[:-1]+"-speaker2.wav"])
 				break
-		subprocess.call(cmd, shell=True)
+		# Extracting concurrently. Later jobs on the extracted files depend on this job.
+		if cmd != '':
+			job = mediaScheduler.submit(mediaPrep.runCommand,cmd,'extractAudio.job')
+			for newFile in newList[numFiles:]: jobs[newFile] = job
 	return newList,pairDic
 
 # Function that verifies that the file format is supported.
@@ -755,16 +842,26 @@ def verifyFormat(videoFormatDic,audioFormatDic,fileList):
 
 # Function that maps files from a list to a given directory
 # Creates watsonVals['out_dir'] dirctionary and the directory.
+# A directory with unfinished transcriptions is kept so they can be resumed.
 def setOutputDir(fileList,dirName):
 	for file in fileList: watsonVals['output-directory'].update({file:dirName})
+	# Resuming only if the unfinished transcriptions are of these files.
+	if resumable() and STTJournal.resumableFor(dirName,transcribedNames(fileList)):
+		print(colored("\nResuming unfinished transcription in: {}".format(dirName),'yellow'))
+		return
 	if os.path.exists(dirName):
-		input(colored("\nWARNING: ", 'red') + "Overwriting existing directory: {}\n" 
-			"Press any key to continue\n".format(dirName))
+		message = colored("\nWARNING: ", 'red') + "Overwriting existing directory: {}\n".format(dirName)
+		if interactive: input(message + "Press any key to continue\n")
+		else: print(message)
 		tmp = tempfile.mktemp(dir=os.path.dirname(dirName))
 		shutil.move(dirName, tmp)
 		shutil.rmtree(tmp)
 	os.makedirs(dirName)
 
+# Function that returns True if unfinished transcriptions are resumed.
+def resumable():
+	return useAsyncSTT and asyncSTT.resumeJobs
+
 # Extracts the files that are pairs into a separate list
 def setFilePairs(fileList):
 	pairDic = {}
@@ -846,22 +943,26 @@ def setSpeakers(fileList,pairDic):
 			watsonVals['names'][file] = ['SP1','SP2']
 
 # Function that overlays two audio files to combine them into a single audio file.
+# Each pair is overlaid as soon as the audio of both files is extracted.
 # Input: List of lists containing audio file pair.
 #		Output directory for combined audio file.
-def overlay(pairList,outDirDic):
+#		Dictionary from file to the job that creates it.
+def overlay(pairList,outDirDic,jobs):
 	for pair in pairList:
-		if pair[0].find('/') != -1: 
-			name1 = pair[0][pair[0].rfind("/")+1:]
-		else: name1 = pair[0]
-		if pair[1].find('/') != -1: 
-			name2 = pair[1][pair[1].rfind("/")+1:]
-		else: name2 = pair[1]
-		name = name1[:name1.rfind('.')]+"-"+name2[:name2.rfind('.')]+'-combined.wav'
-		path = outDirDic[pair[0]]+'/'+name
+		path = outDirDic[pair[0]]+'/'+combinedName(pair)
 		cmd = shellCommands['overlay'].format(pair[0],pair[1],path)
-		devnull = open(os.devnull, 'w')
-		subprocess.call(cmd, shell=True,stdout=devnull,stderr=devnull)
-		for file in pair:watsonVals['combinedAudio'][file] = name
+		overlayJobs.append(mediaScheduler.submit(mediaPrep.runCommand,cmd,'overlay.job',
+			dependencies=[jobs.get(file) for file in pair]))
+
+# Function that returns the name of the combined audio file of a pair.
+def combinedName(pair):
+	if pair[0].find('/') != -1: 
+		name1 = pair[0][pair[0].rfind("/")+1:]
+	else: name1 = pair[0]
+	if pair[1].find('/') != -1: 
+		name2 = pair[1][pair[1].rfind("/")+1:]
+	else: name2 = pair[1]
+	return name1[:name1.rfind('.')]+"-"+name2[:name2.rfind('.')]+'-combined.wav'
 
 # Function that copies a file from one directory to another.
 def copyFile(currentPath,newDirPath):
@@ -882,6 +983,21 @@ def checkBaseModels(acousticBase,languageBase,acousticCustom):
 		input(colored("\nPress any key to return to pre-request menu...",'red'))
 		return False
 
+# Libraries to build standalone executable.
+# Hidden imports for the bundler i.e. PyInstaller, which only includes the
+# modules it finds imported in the source. librosa imports these compiled
+# sklearn modules at runtime, so they are listed here. The function is never
+# called so that sklearn is not imported on startup.
+def bundledLibraries():
+	import sklearn.ensemble
+	import sklearn.tree
+	import sklearn.neighbors.typedefs
+	import sklearn.neighbors.quad_tree
+	import sklearn.tree._utils
+	import sklearn
+	import sklearn.utils._cython_blas
+	from sklearn.preprocessing import StandardScaler
+
 # Function that re-sizes terminal to maximum size
 def resizeMax():
 	os.system('reset')
@@ -910,6 +1026,11 @@ def config():
 	try: stream = open("config.yml",'r')
 	except: return
 	dic = yaml.load(stream,Loader=yaml.FullLoader)
+	applyConfig(dic)
+
+# Function that sets the CHAT and Gailbot variables from a configuration dictionary.
+def applyConfig(dic):
+	global maxConcurrentRequests
 	# Configuring CHAT file
 	if 'CHAT' in dic.keys():
 		for k,v in dic['CHAT']['CHATheaders'].items(): CHAT.CHATheaders[k] = v
@@ -917,7 +1038,99 @@ def config():
 	if 'Gailbot' in dic.keys():
 		for k,v in dic['Gailbot']['recordingVals'].items(): recordingVals[k] = v
 		for k,v in dic['Gailbot']['watsonVals'].items(): watsonVals[k] = v
-
+		if dic['Gailbot'].get('maxConcurrentRequests') != None:
+			maxConcurrentRequests = int(dic['Gailbot']['maxConcurrentRequests'])
+		if dic['Gailbot'].get('tableFormats') != None:
+			tableWriter.tableFormats = list(dic['Gailbot']['tableFormats'])
+		for k,v in (dic['Gailbot'].get('profiling') or {}).items(): setattr(profiling,k,v)
+
+
+
+# *** Definitions for the headless batch mode ***
+
+# Function that runs all jobs in a manifest without prompts, in one process.
+# The manifest is a yaml file with a list of jobs. Each job lists its files
+# using the same flags as the file prompt. For example:
+#	jobs:
+#	  - name: interviews
+#	    files: -dir interviews
+#	  - files: [-pair, speaker1.wav, speaker2.wav]
+#	    watsonVals: {customizationWeight: 0.3}
+# 'modules' selects the post-processing modules by key i.e. syllRate, laughter.
+# 'Gailbot' and 'CHAT' sections override config.yml.
+# Jobs always use the asyncio STT client, since the Twisted reactor cannot be
+# restarted for the jobs after the first.
+# Input: Username, Password, closure, Manifest path, Summary path or None to print.
+# Returns: Exit status i.e. 0 if all files of all jobs were processed.
+def runBatch(username,password,closure,manifestPath,summaryPath=None):
+	global interactive, useAsyncSTT
+	interactive = False ; postProcessing.interactive = False
+	with open(manifestPath,'r') as stream: manifest = yaml.load(stream,Loader=yaml.FullLoader) or {}
+	applyConfig(manifest)
+	if not useAsyncSTT:
+		print(colored("\nWARNING: Batch mode uses the asyncio STT client",'red'))
+		useAsyncSTT = True
+	modules = manifest.get('modules',list(postProcessing.mapping.values()))
+	for module in modules:
+		if module not in postProcessing.funcMapping: 
+			print(colored("\nWARNING: Unknown post-processing module: {}".format(module),'red'))
+	postProcessing.createActionList([name for name,key in postProcessing.mapping.items() if key in modules])
+	defaults = dict(watsonVals,username=username,password=password)
+	for key in ('acoustic-id','custom-id'): defaults.setdefault(key,None)
+	start = time.time()
+	jobs = [runJob(job,count,defaults,closure) for count,job in enumerate(manifest.get('jobs',[]))]
+	summary = {"jobs" : jobs,
+		"completed" : len([job for job in jobs if job['status'] == 'completed']),
+		"failed" : len([job for job in jobs if job['status'] != 'completed']),
+		"seconds" : round(time.time()-start,3)}
+	output = json.dumps(summary,indent=2)
+	if summaryPath == None: print(output)
+	else:
+		with open(summaryPath,'w') as f: f.write(output + "\n")
+	return 0 if summary['failed'] == 0 else 1
+
+# Function that prepares, transcribes and post-processes the files of one job.
+# Returns: Summary dictionary for the job.
+# status = completed if all files were processed, partial if some were processed, or failed.
+# postProcessFailures = json files that were transcribed but failed post-processing.
+def runJob(job,count,defaults,closure):
+	result = {"name" : job.get('name','job-{}'.format(count+1)), "status" : "failed",
+		"files" : [], "outputDirs" : [], "postProcessFailures" : [], "seconds" : {}}
+	print(colored("\nStarting job: {}\n".format(result['name']),'blue'))
+	profiling.startTrace()
+	resetWatsonVals(defaults)
+	watsonVals.update(job.get('watsonVals',{}))
+	files = job.get('files',[])
+	if isinstance(files,str): files = files.split()
+	try:
+		if not timeStage(result,'prepare',prepareFiles,list(files)):
+			result['error'] = "No valid input files" ; return result
+		result['files'] = list(watsonVals['files'])
+		outputInfo = timeStage(result,'transcribe',transcribe,closure)
+		result['outputDirs'] = sorted(set(dic['outputDir'] for dic in outputInfo))
+		processed = timeStage(result,'postProcess',postProcessing.postProcess,outputInfo)
+		processedFiles = set(os.path.join(dic['outputDir'],dic['jsonFile']) for dic in processed)
+		result['postProcessFailures'] = [os.path.join(dic['outputDir'],dic['jsonFile'])
+			for dic in outputInfo if os.path.join(dic['outputDir'],dic['jsonFile']) not in processedFiles]
+		if len(processed) == len(result['files']): result['status'] = 'completed'
+		elif len(processed) > 0: result['status'] = 'partial'
+	except Exception as e:
+		result['error'] = "{0}: {1}".format(type(e).__name__,e)
+		print(colored("\nJob failed: {0}\n{1}".format(result['name'],result['error']),'red'))
+	finally: 
+		deleteIntermediateFiles()
+		trace = profiling.writeTrace(result['name'])
+		if trace != None: result['trace'] = trace
+	return result
+
+# Function that runs one stage of a job and records its duration in seconds.
+# The stage is also recorded as a span of the job's trace.
+# Returns: Return value of the stage function.
+def timeStage(result,stage,function,*args):
+	start = time.time()
+	try:
+		with profiling.span(stage): return function(*args)
+	finally: result['seconds'][stage] = round(time.time()-start,3)
 
 
 if __name__ == '__main__':
@@ -934,9 +1147,22 @@ if __name__ == '__main__':
 	parser.add_argument(
 		'-region',action = 'store',dest = 'region',
 		help = 'Service endpoint region', required = True)
+	parser.add_argument(
+		'-manifest',action = 'store',dest = 'manifest',
+		help = 'Yaml file of jobs to run without prompts (batch mode)')
+	parser.add_argument(
+		'-summary',action = 'store',dest = 'summary',
+		help = 'File the batch mode json summary is written to instead of printed')
+	parser.add_argument(
+		'-concurrency',action = 'store',dest = 'concurrency',type = int,
+		help = 'Maximum number of files transcribed at the same time')
 	args = parser.parse_args()
 
 	config()
+	if args.concurrency != None: maxConcurrentRequests = args.concurrency
+	if args.manifest != None:
+		sys.exit(runBatch(args.username,args.password,{'region' : args.region},
+			args.manifest,args.summary))
 	resizeMax()
 	interface(args.username,args.password,region = args.region)
 	resizeOriginal(TERMcols,TERMrows)
@@ -13,20 +13,25 @@
 
 import argparse 								# Library to extract input arguments
 import os, sys 									# General system libraries.
-import librosa									# Audio signal processing library.
-import keras 									# Deep learning framework.
+import lazyImport 								# Imports modules on first use.
+librosa = lazyImport.module("librosa")			# Audio signal processing library.
+keras = lazyImport.module("keras") 				# Deep learning framework.
 #import matplotlib.pyplot as plt 				# Library to visualize mfcc features.
 #import librosa.display 						# Library to display signal.
 import numpy 									# Library to have multi-dimensional homogenous arrays.
+from numpy.lib.stride_tricks import as_strided	# Zero-copy sliding windows over feature arrays.
 import scipy.signal as signal					# Used to apply the lowpass filter.
-import tensorflow as tf 						# Deep neural network library
-import operator
+tf = lazyImport.module("tensorflow") 			# Deep neural network library
 import logging
 from termcolor import colored
-import audioread
+audioread = lazyImport.module("audioread")
+soundfile = lazyImport.module("soundfile") 		# Block-wise audio file reading.
 
 # Gailbot scripts
 import CHAT										# Script to produce CHAT files.
+spectrogram = lazyImport.module("spectrogram") 	# Script that computes shared spectrogram features.
+import laughWorker 								# Script that keeps the model loaded between runs.
+from wordTable import WordTable 				# Columnar table of transcribed words.
 
 # Just disables the warning, doesn't enable AVX/FMA
 import os
@@ -40,6 +45,38 @@ AUDIO_SAMPLE_RATE = 44100
 # Path for the trained audio model in Hierarchical Data Format.
 modelPath = './model.h5'
 
+# Set True to run the model in a long-lived worker process that survives
+# Gailbot restarts. The model is loaded in-process if no worker can be used.
+useModelWorker = True
+
+# Model loaded in this process, kept for subsequent runs.
+cachedModel = None
+
+# Probability below which a detected laugh ends (hysteresis).
+# None ends laughs at the acceptance threshold.
+laughExitThreshold = None
+
+# Laughs separated by at most this many seconds are merged into one.
+laughMergeGap = 0.0
+
+# Transcript of the words added for laughter.
+laughMarker = " &=laughs "
+
+# Number of feature windows materialized and sent to the model at once.
+PREDICT_BATCH_SIZE = 2048
+
+# Set True to read audio in blocks so that the audio of a file is not held in
+# memory, only its features (13 values per frame).
+# Formats that soundfile cannot read fall back to loading the whole file.
+streamAudio = True
+
+# Number of 10 ms frames per streamed audio block (60 seconds).
+STREAM_BLOCK_FRAMES = 6000
+
+# Frames of audio read on either side of a block so that the centered STFT
+# frames at the block edges do not depend on block padding (n_fft <= 2048).
+STFT_CONTEXT = 3
+
 
 # *** Main driver functions ***
 
@@ -49,49 +86,94 @@ modelPath = './model.h5'
 def analyzeLaugh(infoList):
 	# Loading the existing trained and compiled model to detect laughter.
 	print(colored("Analyzing laughter...",'blue'))
-	try: model = keras.models.load_model(modelPath,compile=False)
+	try: model = loadModel()
 	except OSError:
 		print(colored("\nLaughter analysis unsuccessful",'red'))
 		print("File missing: {}\n".format(modelPath)) ; return infoList
+	probsFunc = streamLaughProbabilities if streamAudio else laughProbabilities
 	for dic in infoList:
-		dic['jsonList'] = segmentLaugh(audioFile= dic['outputDir']+"/"+dic['individualAudioFile'],
-			modelPath=modelPath,outputPath=dic['outputDir'],
+		probs = probsFunc(dic['outputDir']+"/"+dic['individualAudioFile'],model)
+		if probs is None: continue
+		# Frame probabilities are kept so the laughter can be transcribed again
+		# with different thresholds.
+		dic['laughProbs'] = probs
+		dic['jsonList'] = transcribeProbabilities(probs,
 			threshold=CHAT.CHATVals['lowerBoundLaughAcceptance'],
 			minLength=CHAT.CHATVals['LowerBoundLaughLength'],
-			jsonList=dic['jsonList'],model=model)
+			jsonList=dic['jsonList'])
+	if isinstance(model,laughWorker.WorkerModel): model.close()
 	print(colored("\nLaughter analysis completed\n",'green'))
 	return infoList
 
-# Function that calls all relevant laughter analysis functions
-# Inputs: Audio file name, trained audio model path, output Path,
-#			Lower bound for laugh acceptance probability,
-#			Minimum audio length to be classified as laughter.
-#			Inidividual word jsonList
+# Function that returns the laughter model, using the worker process if
+# enabled and available and the in-process cached model otherwise.
+# The in-process model is also used if the worker stops responding.
+# Raises OSError if the model file cannot be loaded.
+def loadModel():
+	if useModelWorker:
+		model = laughWorker.connect(modelPath)
+		if model != None: 
+			model.fallback = localModel ; return model
+	return localModel()
+
+# Function that returns the model loaded in this process, loading it once.
+def localModel():
+	global cachedModel
+	if cachedModel == None: cachedModel = keras.models.load_model(modelPath,compile=False)
+	return cachedModel
+
+# Function that transcribes the laughter of a word table again from the saved
+# frame probabilities, using the current thresholds.
+# Input: Word table including previously transcribed laughter, Frame probabilities.
 # Returns: Transcribed audio list / jsonList.
-def segmentLaugh(audioFile, modelPath, outputPath,threshold, minLength,
-	jsonList,model):
+def retranscribeLaugh(jsonList,probs):
+	jsonList = jsonList[jsonList.transcript != laughMarker]
+	return transcribeProbabilities(probs,CHAT.CHATVals['lowerBoundLaughAcceptance'],
+		CHAT.CHATVals['LowerBoundLaughLength'],jsonList)
+
+# Function that computes the laughter probability of each frame of an audio file.
+# Inputs: Audio file name, trained model.
+# Returns: Array of probabilities, one per frame, or None if the file cannot be loaded.
+def laughProbabilities(audioFile,model):
 	print("\nLoading audio file: {0}".format(audioFile))
 
 	# Loading the audio signal as a time series and obtaining its sampling rate.
 	try: timeSeries, samplingRate = librosa.load(audioFile,sr =AUDIO_SAMPLE_RATE)
 	except FileNotFoundError:
-		print(colored("ERROR: File not found: {}".format(audioFile),'red')) ; return jsonList
+		print(colored("ERROR: File not found: {}".format(audioFile),'red')) ; return None
 	except audioread.exceptions.NoBackendError:
 		print(colored("\nERROR: File is not an audio file: {}\n".format(audioFile),'red'))
-		return jsonList
-	# Getting a list of different audio features for analysis.
-	featureList = getFeatureList(timeSeries,samplingRate)
+		return None
+	# Getting strided feature windows for analysis.
+	mfccWindows,deltaWindows = getFeatureWindows(timeSeries,samplingRate)
 
-	# Generating output prediction for input samples.
-	probs = model.predict_proba(featureList,verbose=1)
+	# Generating output prediction for input samples, one batch at a time.
+	probs = predictWindows(model,mfccWindows,deltaWindows)
 
 	# Reshaping the tensor to the specified shape for further use in the neural 
 	# network/
-	probs = probs.reshape(len(probs))
-
+	return probs.reshape(len(probs))
+
+# Function that computes the laughter probability of each frame while reading
+# the audio file one block at a time.
+# Inputs: Same as laughProbabilities.
+# Returns: Array of probabilities, one per frame, or None if the file cannot be loaded.
+def streamLaughProbabilities(audioFile,model):
+	print("\nStreaming audio file: {0}".format(audioFile))
+	if not os.path.isfile(audioFile):
+		print(colored("ERROR: File not found: {}".format(audioFile),'red')) ; return None
+	try: return streamProbabilities(audioFile,model)
+	# Formats not supported by libsndfile are loaded in full instead.
+	except RuntimeError: return laughProbabilities(audioFile,model)
+
+# Function that filters the frame probabilities and transcribes the
+# resulting laughter instances.
+# Returns: Transcribed audio list / jsonList.
+def transcribeProbabilities(probs,threshold,minLength,jsonList):
 	# Filtering the input signal using the butterworth filter.
 	filtered = lowpass(probs)
-	instances = getLaughterInstances(filtered, threshold, minLength)
+	instances = getLaughterInstances(filtered, threshold, minLength,
+		exitThreshold=laughExitThreshold,maxGap=laughMergeGap)
 
 	# Transcribing the laughter in the jsonList
 	jsonList = transcribeLaugh(jsonList,instances)
@@ -121,6 +203,88 @@ def getFeatureList(timeSeries,samplingRate,window_size=37):
 	featureList = numpy.array(featureList)
 	return featureList
 
+# Function that extracts the same windows as getFeatureList without copying them.
+# Each window is a read-only strided view into the padded feature arrays.
+# Input: Time series, Series sampling rate.
+# Returns: MFCC windows and delta windows of shape (frames, 2*window_size, features)
+def getFeatureWindows(timeSeries,samplingRate,window_size=37):
+	mfccFeatures = computeMfccFeatures(timeSeries,samplingRate)
+	deltaFeatures = computeDeltaFeatures(mfccFeatures)
+	return (slidingWindows(mfccFeatures,window_size),
+		slidingWindows(deltaFeatures,window_size))
+
+# Function that zero pads a feature array and returns a strided view with one
+# window of 2*window_size rows per frame.
+# Input: Feature array of shape (frames, features)
+# Returns: Read-only view of shape (frames, 2*window_size, features)
+def slidingWindows(features,window_size=37,leftPad=None,rightPad=None):
+	if leftPad is None: leftPad = window_size
+	if rightPad is None: rightPad = window_size
+	padded = numpy.ascontiguousarray(numpy.vstack([numpy.zeros((leftPad,features.shape[1])),
+		features,numpy.zeros((rightPad,features.shape[1]))]))
+	numWindows = len(padded) - 2*window_size
+	rowStride,colStride = padded.strides
+	return as_strided(padded,shape=(numWindows,2*window_size,features.shape[1]),
+		strides=(rowStride,rowStride,colStride),writeable=False)
+
+# Function that formats a range of strided windows into model inputs.
+# Only the requested rows are copied.
+# Returns: Array of shape (end-start, features per window)
+def formatWindows(mfccWindows,deltaWindows,start,end):
+	mfccBatch = mfccWindows[start:end] ; deltaBatch = deltaWindows[start:end]
+	return numpy.hstack([mfccBatch.reshape(len(mfccBatch),-1),
+		deltaBatch.reshape(len(deltaBatch),-1)])
+
+# Function that generates laughter probabilities from strided windows in batches
+# so that only batchSize windows are materialized at any one time.
+# Returns: Array of probabilities, one per frame.
+def predictWindows(model,mfccWindows,deltaWindows,batchSize=PREDICT_BATCH_SIZE):
+	probs = numpy.zeros(len(mfccWindows))
+	for start in range(0,len(mfccWindows),batchSize):
+		end = min(start+batchSize,len(mfccWindows))
+		probs[start:end] = model.predict_proba(formatWindows(mfccWindows,
+			deltaWindows,start,end),verbose=0).reshape(end-start)
+	return probs
+
+# Function that generates laughter probabilities for an audio file by reading
+# it in blocks of blockFrames frames.
+# The mel bands and RMS of each block are computed with enough surrounding
+# audio for the STFT frames at its edges and joined. The features, which
+# depend on the loudest frame of the file, are then derived from the joined
+# bands so that the result matches the single-shot result for files sampled
+# at AUDIO_SAMPLE_RATE. Other sampling rates are resampled per block.
+# Input: Audio file name, trained model.
+# Returns: Array of probabilities, one per frame.
+def streamProbabilities(audioFile,model,blockFrames=STREAM_BLOCK_FRAMES,
+	window_size=37):
+	hopLength = int(AUDIO_SAMPLE_RATE/100)
+	with soundfile.SoundFile(audioFile) as f:
+		ratio = AUDIO_SAMPLE_RATE/f.samplerate
+		numSamples = int(numpy.ceil(f.frames*ratio))
+		numFrames = 1 + numSamples//hopLength
+		logMel = None ; rms = numpy.zeros((1,numFrames),dtype=numpy.float32)
+		for start in range(0,numFrames,blockFrames):
+			end = min(start+blockFrames,numFrames)
+			# Frame range read for this block, including context.
+			first = max(start-STFT_CONTEXT,0)
+			last = min(end+STFT_CONTEXT,numFrames)
+			sampleStart = first*hopLength
+			sampleEnd = numSamples if last == numFrames else last*hopLength
+			f.seek(int(round(sampleStart/ratio)))
+			timeSeries = f.read(frames=int(numpy.ceil((sampleEnd-sampleStart)/ratio)),
+				dtype='float32',always_2d=True).mean(axis=1)
+			if f.samplerate != AUDIO_SAMPLE_RATE:
+				timeSeries = librosa.resample(timeSeries,orig_sr=f.samplerate,
+					target_sr=AUDIO_SAMPLE_RATE)
+			blockMel,blockRms = computeBandFeatures(timeSeries,AUDIO_SAMPLE_RATE)
+			if logMel is None: logMel = numpy.zeros((len(blockMel),numFrames),dtype=blockMel.dtype)
+			logMel[:,start:end] = blockMel[:,start-first:end-first]
+			rms[:,start:end] = blockRms[:,start-first:end-first]
+			sys.stdout.write('.') ; sys.stdout.flush()
+	mfccFeatures = featuresFromBands(logMel,rms)
+	deltaFeatures = computeDeltaFeatures(mfccFeatures)
+	return predictWindows(model,slidingWindows(mfccFeatures,window_size),
+		slidingWindows(deltaFeatures,window_size))
 
 '''
 	MFCC: Mel frequency cepstral coefficients.
@@ -137,26 +301,43 @@ def getFeatureList(timeSeries,samplingRate,window_size=37):
 # Input: Time series, Series sampling rate.
 # Returns: List of features.
 def computeMfccFeatures(timeSeries, samplingRate):
+	logMel,rms = computeBandFeatures(timeSeries,samplingRate)
+	return featuresFromBands(logMel,rms)
 
-	# Extractign the mel-frequency coefficients.
-	# DCT type-II transform is used and 30 frequency bins are created.
-	# Also computing a mel-sclaed spectogram.
+# Function that computes the log-power mel bands and RMS of a time series, from
+# which computeMfccFeatures derives the features. Bands of consecutive blocks
+# of a series can be joined before the features are derived.
+# Input: Time series, Series sampling rate.
+# Returns: Log-power mel bands of shape (12, frames), RMS of shape (1, frames)
+def computeBandFeatures(timeSeries, samplingRate):
+
+	# Computing the power spectrogram the mel bands are derived from.
 	# Hop-length is the number of samples between successive frames. / columns of a spectogram.
-	# The .T attribute is the transpose of the numpy array
-	mfccFeatures = librosa.feature.mfcc(y=timeSeries,sr=samplingRate,
-		n_mfcc=12,n_mels=12,hop_length=int(samplingRate/100),dct_type=2,n_fft=int(samplingRate/40)).T
+	power = spectrogram.powerSpectrogram(timeSeries,n_fft=int(samplingRate/40),
+		hop_length=int(samplingRate/100))
 
-	# Separating the complex valued Spectrogram D into its magnitude and phase components.
-	# A complex valued spectogram does not have any negative frequency components.
-	complexValuedMatrix = librosa.stft(timeSeries,hop_length = int(samplingRate/100))
-	magnitude,phase = librosa.magphase(complexValuedMatrix)
+	# 12 mel frequency bins are created.
+	logMel = spectrogram.logMelFromSpectrogram(power,samplingRate,n_mels=12)
 
-	# Calculating the root-mean-square value / mean of the cosing function
-	# Transposing the resultant matrix.
-	rms = librosa.feature.rmse(S=magnitude).T
+	# Calculating the root-mean-square value from a spectrogram with the frame
+	# length the model was trained with, which is longer than the MFCC frames.
+	# It is therefore not derived from the MFCC spectrogram.
+	rms = spectrogram.rmsFromSeries(timeSeries,hop_length=int(samplingRate/100))
+	return logMel,rms
+
+# Function that derives the mfcc features from the mel bands and RMS of a whole
+# time series.
+# Input: Log-power mel bands, RMS.
+# Returns: List of features.
+def featuresFromBands(logMel,rms):
+
+	# Extractign the mel-frequency coefficients.
+	# DCT type-II transform is used.
+	# The .T attribute is the transpose of the numpy array
+	mfccFeatures = spectrogram.mfccFromLogMel(logMel,n_mfcc=12,dct_type=2).T
 
 	# stacking the arrays horizontally and returns resultant feature list.
-	return numpy.hstack([mfccFeatures,rms])
+	return numpy.hstack([mfccFeatures,rms.T])
 
 
 # Function that computes the delta features for the given time series.
@@ -185,34 +366,51 @@ def lowpass(sig, filter_order = 2, cutoff = 0.01):
 	# Once forwards, and once backwards.
 	return(signal.filtfilt(B,A, sig))
 
-# Extracts laughter from the filtered audio.
-def frame_span_to_time_span(frame_span):
-    return (frame_span[0] / 100., frame_span[1] / 100.)
-
-def collapse_to_start_and_end_frame(instance_list):
-    return (instance_list[0], instance_list[-1])
-
-def getLaughterInstances(probs, threshold = 0.5, minLength = 0.2):
-	instances = []
-	current_list = []
-	for i in range(len(probs)):
-		if numpy.min(probs[i:i+1]) > threshold:
-			current_list.append(i)
-		else:
-			if len(current_list) > 0:
-				instances.append(current_list)
-				current_list = []
-	instances = [frame_span_to_time_span(collapse_to_start_and_end_frame(i)) for i in instances if len(i) > minLength]
-	return instances
+# Function that extracts laughter instances from the filtered probabilities.
+# Input: Frame probabilities (one per 10 ms frame),
+#			Probability above which a laugh starts,
+#			Minimum laugh length (frames),
+#			Probability below which a laugh ends (hysteresis). Defaults to threshold.
+#			Maximum silence (seconds) between two laughs that are merged.
+# Returns: List of (start time, end time) tuples in seconds.
+def getLaughterInstances(probs, threshold = 0.5, minLength = 0.2,
+	exitThreshold = None, maxGap = 0.0):
+	starts,ends = laughterSegments(probs,threshold,minLength,exitThreshold,maxGap)
+	return list(zip(starts/100.,ends/100.))
+
+# Function that finds runs of laughter frames using array operations.
+# A run starts at the first frame above threshold and continues while frames
+# stay above exitThreshold. Runs separated by at most maxGap seconds are
+# merged before runs of minLength frames or less are removed.
+# Returns: Arrays of first and last frame indices of each run.
+def laughterSegments(probs, threshold = 0.5, minLength = 0.2,
+	exitThreshold = None, maxGap = 0.0):
+	probs = numpy.asarray(probs)
+	if exitThreshold == None or exitThreshold > threshold: exitThreshold = threshold
+	# Boundaries of runs above the exit threshold. Ends are exclusive.
+	edges = numpy.diff(numpy.concatenate(([0],(probs > exitThreshold).astype(numpy.int8),[0])))
+	starts = numpy.flatnonzero(edges == 1) ; ends = numpy.flatnonzero(edges == -1)
+	# Each run starts at its first frame above the entry threshold.
+	entries = numpy.flatnonzero(probs > threshold)
+	firstEntry = numpy.searchsorted(entries,starts)
+	entered = firstEntry < len(entries)
+	entered[entered] = entries[firstEntry[entered]] < ends[entered]
+	starts = entries[firstEntry[entered]] ; ends = ends[entered]
+	# Merging runs separated by short gaps.
+	if len(starts) > 1 and maxGap > 0:
+		split = (starts[1:] - ends[:-1])/100. > maxGap
+		starts = starts[numpy.concatenate(([True],split))]
+		ends = ends[numpy.concatenate((split,[True]))]
+	# Removing runs that are too short.
+	longEnough = (ends - starts) > minLength
+	return starts[longEnough],ends[longEnough]-1
 
 # Function that transcribes laughter in the list
 def transcribeLaugh(jsonList,instances):
-	newInst = []
-	for instance in instances: 
-		newInst.append([jsonList[1][0],instance[0],instance[1]," &=laughs "])
-	for instance in newInst:jsonList.append(instance)
-	jsonList[1:] = sorted(jsonList[1:], key = operator.itemgetter(1))
-	return jsonList
+	if len(instances) == 0 or len(jsonList) == 0: return jsonList
+	laughs = WordTable.fromRows([[jsonList.speaker[0],start,end,laughMarker]
+		for start,end in instances])
+	return WordTable.concatenate([jsonList,laughs]).sortedByStart()
 
 
 
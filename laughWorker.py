@@ -0,0 +1,288 @@
+'''
+	Script that keeps the laughter detection model loaded in a long-lived
+	background process.
+	Gailbot restarts itself after every request, which would otherwise
+	re-import Tensorflow and re-load the model for every batch of files.
+	Feature batches are sent to the worker over a local socket in a directory
+	only the user can access. Connections are authenticated in both directions
+	with a random key stored in that directory, since both sides unpickle what
+	they receive.
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/8/19
+'''
+
+import argparse 								# Library to extract input arguments
+import os, sys 									# General system libraries.
+import stat 									# Checking the worker directory permissions.
+import getpass 									# Name of the user the worker belongs to.
+import tempfile 								# Default location of the worker directory.
+import time 									# Timing library
+import threading 								# Connection and idle timeout threads.
+import subprocess 								# Starting the worker process.
+import queue as Queue 							# Queue of prediction requests.
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+import numpy 									# Library to have multi-dimensional homogenous arrays.
+from termcolor import colored					# Text coloring library
+
+# *** Global variables / invariants ***
+
+# Directory holding the worker socket and key. Only accessible by the user.
+WORKER_DIR = os.path.join(os.environ.get('XDG_RUNTIME_DIR',tempfile.gettempdir()),
+	"gailbot-{}".format(getpass.getuser()))
+
+# Names of the worker socket and of the key authenticating its connections.
+WORKER_SOCKET = "laughWorker.sock"
+WORKER_KEY = "laughWorker.key"
+
+# Bytes of the randomly generated key.
+WORKER_KEY_LENGTH = 32
+
+# Seconds without requests after which the worker exits.
+WORKER_IDLE_TIMEOUT = 1800
+
+# Seconds to wait for a newly started worker to load the model.
+WORKER_START_TIMEOUT = 120
+
+
+# Proxy that mimics the keras model interface used by laughAnalysis.
+class WorkerModel:
+
+	'''
+		connection : Connection to the worker process.
+		fallback : Function returning the model loaded in this process, used
+			if the worker stops responding, or None to raise the error.
+		model : Model loaded by fallback once the worker stopped responding.
+	'''
+	def __init__(self,connection,fallback=None):
+		self.connection = connection ; self.fallback = fallback ; self.model = None
+
+	# Function that sends a batch of features to the worker.
+	# Returns: Probability array of shape (len(features), 1)
+	def predict_proba(self,features,verbose=0):
+		if self.model != None: return self.model.predict_proba(features,verbose=verbose)
+		try:
+			self.connection.send(('predict',numpy.asarray(features,dtype=numpy.float32)))
+			status,result = self.connection.recv()
+		except (EOFError,OSError) as e:
+			if self.fallback == None: raise
+			print(colored("\nWARNING: Laughter worker stopped responding, loading the model "
+				"in this process\nDetails: {}".format(e),'red'))
+			self.connection.close() ; self.model = self.fallback()
+			return self.model.predict_proba(features,verbose=verbose)
+		if status == 'error': raise RuntimeError("Laughter worker error: {}".format(result))
+		return result
+
+	# Function that closes the connection to the worker.
+	def close(self):
+		self.connection.close()
+
+
+# *** Client functions ***
+
+# Function that connects to a running worker, starting one if required.
+# Input: Path of the model the worker should serve.
+# Returns: WorkerModel or None if no worker could be used.
+def connect(modelPath,start=True):
+	connection = openConnection(modelPath)
+	if connection != None or not start: return connection
+	if not os.path.isfile(modelPath): return None
+	process = startWorker(modelPath)
+	deadline = time.time() + WORKER_START_TIMEOUT
+	while time.time() < deadline:
+		connection = openConnection(modelPath)
+		if connection != None: return connection
+		# Worker exited i.e. the model could not be loaded or another
+		# process started a worker first.
+		if process.poll() != None: return openConnection(modelPath)
+		time.sleep(0.1)
+	return None
+
+# Function that opens a connection to a running worker serving modelPath.
+# Returns: WorkerModel or None
+# The handshake also checks that the worker knows the key, so a process
+# listening at the address in its place is not trusted.
+def openConnection(modelPath):
+	connection = openClient()
+	if connection == None: return None
+	try:
+		connection.send(('ping',None))
+		status,servedPath = connection.recv()
+	except (OSError,EOFError): return None
+	# Worker is serving a different model.
+	if servedPath != os.path.abspath(modelPath):
+		connection.close() ; return None
+	return WorkerModel(connection)
+
+# Function that starts the worker as a detached process.
+# The worker outlives the Gailbot process that started it.
+def startWorker(modelPath):
+	devnull = open(os.devnull,'w')
+	return subprocess.Popen([sys.executable,os.path.abspath(__file__),
+		'-model',os.path.abspath(modelPath)],stdout=devnull,stderr=devnull,
+		start_new_session=True)
+
+# Function that asks a running worker to exit.
+# Returns: True if a worker was stopped.
+def stopWorker():
+	connection = openClient()
+	if connection == None: return False
+	connection.send(('stop',None)) ; connection.close()
+	return True
+
+
+# *** Worker functions ***
+
+# Function that loads the model once and serves prediction requests until
+# stopped or idle for WORKER_IDLE_TIMEOUT seconds.
+# Connections are served concurrently but the model is only used from the
+# thread that loaded it.
+def serve(modelPath):
+	# Listening before loading so that concurrent clients wait for this worker.
+	listener = openListener()
+	if listener == None: return
+	os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+	import keras 								# Deep learning framework.
+	model = keras.models.load_model(modelPath,compile=False)
+	requests = Queue.Queue()
+	state = {'lastUsed' : time.time()}
+	for target,args in ((exitWhenIdle,(listener,state)),
+		(acceptConnections,(listener,requests,os.path.abspath(modelPath),state))):
+		thread = threading.Thread(target=target,args=args)
+		thread.daemon = True
+		thread.start()
+	while True:
+		features,replies = requests.get()
+		if replies == None: listener.close() ; return
+		try: replies.put(('ok',model.predict_proba(features,verbose=0)))
+		except Exception as e: replies.put(('error',str(e)))
+
+# Function that accepts connections and serves each one in its own thread.
+def acceptConnections(listener,requests,servedPath,state):
+	while True:
+		try: connection = listener.accept()
+		except Exception: continue
+		thread = threading.Thread(target=handle,args=(connection,requests,servedPath,state))
+		thread.daemon = True
+		thread.start()
+
+# Function that handles all requests sent over one connection.
+# Predictions are queued for the thread that owns the model.
+def handle(connection,requests,servedPath,state):
+	replies = Queue.Queue()
+	while True:
+		try: action,data = connection.recv()
+		except (OSError,EOFError): connection.close() ; return
+		state['lastUsed'] = time.time()
+		if action == 'stop': requests.put((None,None)) ; return
+		if action == 'ping': connection.send(('ok',servedPath)) ; continue
+		requests.put((data,replies))
+		connection.send(replies.get())
+
+# Function that exits the worker once it has been idle for too long.
+def exitWhenIdle(listener,state):
+	while True:
+		time.sleep(60)
+		if time.time() - state['lastUsed'] > WORKER_IDLE_TIMEOUT:
+			removeSocket(listener.address) ; os._exit(0)
+
+
+# *** Helper functions for the worker socket ***
+
+# Function that creates the worker directory, or checks an existing one.
+# The directory must belong to the user and not be accessible by others, as
+# any process that can reach the socket or read the key can run code in the
+# worker or in Gailbot.
+# Returns: Path of the directory or None if it cannot be used safely.
+def workerDir():
+	try:
+		os.makedirs(WORKER_DIR,mode=0o700,exist_ok=True)
+		info = os.lstat(WORKER_DIR)
+	except OSError as e:
+		print(colored("\nERROR: Laughter worker directory unavailable: {}".format(e),'red'))
+		return None
+	if os.name == 'posix' and (not stat.S_ISDIR(info.st_mode) or
+		info.st_uid != os.getuid() or info.st_mode & 0o077 != 0):
+		print(colored("\nERROR: Laughter worker directory is not private: {}".format(
+			WORKER_DIR),'red'))
+		return None
+	return WORKER_DIR
+
+# Function that returns the address of the worker.
+# A unix socket in the worker directory, or a named pipe on Windows.
+def workerAddress():
+	if os.name == 'posix': return os.path.join(WORKER_DIR,WORKER_SOCKET)
+	return r'\\.\pipe\gailbot-laughWorker-{}'.format(getpass.getuser())
+
+# Function that returns the key of the worker, generating it the first time.
+# The key is written to a private file and only then linked into place so
+# that concurrent processes never read a partial key.
+# Returns: Key bytes or None if the worker directory cannot be used.
+def workerKey():
+	if workerDir() == None: return None
+	path = os.path.join(WORKER_DIR,WORKER_KEY)
+	if not os.path.isfile(path):
+		tempPath = "{0}.{1}".format(path,os.getpid())
+		try:
+			descriptor = os.open(tempPath,os.O_WRONLY|os.O_CREAT|os.O_TRUNC,0o600)
+			with os.fdopen(descriptor,'wb') as f: f.write(os.urandom(WORKER_KEY_LENGTH))
+			try: os.link(tempPath,path)
+			except FileExistsError: pass
+		except OSError as e:
+			print(colored("\nERROR: Laughter worker key not written: {}".format(e),'red'))
+			return None
+		finally:
+			if os.path.exists(tempPath): os.remove(tempPath)
+	with open(path,'rb') as f: key = f.read()
+	return key if len(key) == WORKER_KEY_LENGTH else None
+
+# Function that opens an authenticated connection to the worker.
+# Returns: Connection or None if no worker with the key is listening.
+def openClient():
+	key = workerKey()
+	if key == None: return None
+	try: return Client(workerAddress(),authkey=key)
+	except (OSError,EOFError,AuthenticationError): return None
+
+# Function that opens the listener of the worker.
+# A socket left behind by a worker that exited without removing it is
+# replaced, but not one a running worker is listening on.
+# Returns: Listener or None if another worker is listening.
+def openListener():
+	key = workerKey()
+	if key == None: return None
+	address = workerAddress()
+	try: return Listener(address,authkey=key)
+	except OSError:
+		if os.name != 'posix' or not os.path.exists(address): return None
+	try: Client(address).close() ; return None
+	except ConnectionRefusedError: removeSocket(address)
+	except OSError: return None
+	try: return Listener(address,authkey=key)
+	except OSError: return None
+
+# Function that removes the socket file of a listener address.
+def removeSocket(address):
+	if os.name != 'posix': return
+	try: os.remove(address)
+	except OSError: pass
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+		description = 'Long-lived worker serving the Gailbot laughter detection model')
+	parser.add_argument('-model', action = 'store', dest = 'model',
+		default = './model.h5', help = 'Path to the trained model')
+	parser.add_argument('-stop', action = 'store_true', dest = 'stop',
+		help = 'Stop a running worker')
+	args = parser.parse_args()
+	if args.stop: stopWorker()
+	else: serve(args.model)
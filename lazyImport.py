@@ -0,0 +1,66 @@
+'''
+	Script that imports modules on first use.
+	The analysis modules pull in Tensorflow, Keras, librosa, matplotlib and
+	statsmodels, which take several seconds to import. Importing them lazily
+	keeps the Gailbot menus fast and only loads the libraries of the
+	post-processing stages that actually run.
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 5/30/19
+'''
+
+import sys 										# Loaded modules.
+import importlib 								# Importing modules by name.
+import importlib.util 							# Lazy module loader.
+
+
+# *** Lazy import functions ***
+
+# Function that returns a module that is only executed when one of its
+# attributes is first used.
+# Input: Module name
+# Returns: Module object, registered so that later imports return it.
+def module(name):
+	if name in sys.modules: return sys.modules[name]
+	spec = importlib.util.find_spec(name)
+	if spec == None: raise ModuleNotFoundError("No module named '{}'".format(name),name=name)
+	loader = importlib.util.LazyLoader(spec.loader)
+	spec.loader = loader
+	lazyModule = importlib.util.module_from_spec(spec)
+	sys.modules[name] = lazyModule
+	loader.exec_module(lazyModule)
+	return lazyModule
+
+
+# Function of a module that is imported when the function is first called.
+# Can be compared, hashed and pickled without importing the module, so it
+# can be passed to worker processes.
+class LazyFunction:
+
+	'''
+		moduleName : Name of the module that defines the function.
+		functionName : Name of the function.
+	'''
+	def __init__(self,moduleName,functionName):
+		self.moduleName = moduleName
+		self.functionName = functionName
+
+	def __call__(self,*args,**kwargs):
+		return getattr(importlib.import_module(self.moduleName),self.functionName)(*args,**kwargs)
+
+	def __eq__(self,other):
+		if not isinstance(other,LazyFunction): return NotImplemented
+		return (self.moduleName,self.functionName) == (other.moduleName,other.functionName)
+
+	def __hash__(self):
+		return hash((self.moduleName,self.functionName))
+
+	def __repr__(self):
+		return "<lazy function {0}.{1}>".format(self.moduleName,self.functionName)
@@ -0,0 +1,78 @@
+'''
+	Script that runs the media preparation jobs of a request i.e. audio
+	extraction, opus encoding and overlaying pair files, in a bounded pool
+	of worker threads.
+	A job can depend on other jobs and is only started once they finish, so
+	workers never wait on each other.
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 5/30/19
+'''
+
+import os 										# for listing directories
+import subprocess 								# Running ffmpeg / opusenc.
+import threading 								# Counting finished dependencies.
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Gailbot scripts
+import profiling 								# Per-stage timing traces of requests.
+
+# *** Global variables / invariants ***
+
+# Maximum number of media jobs that run at once.
+maxWorkers = os.cpu_count() or 1
+
+
+# Pool of worker threads that runs jobs once their dependencies finish.
+class MediaScheduler:
+
+	'''
+		executor : Thread pool the jobs run in.
+	'''
+	def __init__(self,numWorkers=None):
+		self.executor = ThreadPoolExecutor(max_workers=numWorkers or maxWorkers)
+
+	# Function that schedules a job.
+	# Input: Function and arguments of the job, Futures of the jobs it depends on.
+	# Returns: Future of the job. It fails without running if a dependency fails.
+	def submit(self,function,*args,dependencies=()):
+		future = Future()
+		dependencies = [dependency for dependency in dependencies if dependency != None]
+		remaining = [len(dependencies)] ; lock = threading.Lock()
+		def start():
+			for dependency in dependencies:
+				if dependency.exception() != None:
+					future.set_exception(dependency.exception()) ; return
+			self.executor.submit(run)
+		def run():
+			try: future.set_result(function(*args))
+			except Exception as e: future.set_exception(e)
+		def finished(dependency):
+			with lock:
+				remaining[0] -= 1
+				if remaining[0] > 0: return
+			start()
+		if len(dependencies) == 0: start()
+		for dependency in dependencies: dependency.add_done_callback(finished)
+		return future
+
+
+# *** Media job functions ***
+
+# Function that runs a shell command without reading the terminal.
+# Output is only shown if the command fails.
+# Input: Command, Name of the stage the command is timed as.
+def runCommand(cmd,stage='runCommand'):
+	with profiling.span(stage):
+		process = subprocess.run(cmd,shell=True,stdin=subprocess.DEVNULL,
+			stdout=subprocess.DEVNULL,stderr=subprocess.PIPE)
+	if process.returncode != 0:
+		raise OSError("Command failed: {0}\n{1}".format(cmd,
+			process.stderr.decode('utf-8','replace').strip()[-500:]))
@@ -13,7 +13,7 @@
     Initial development: 6/4/19	
 '''
 
-import json,csv
+import json
 import sys, time, os
 from termcolor import colored					# Text coloring library
 import itertools								# Iterates over lists
@@ -22,13 +22,19 @@ from prettytable import PrettyTable				# Table printing library
 import copy 		
 import numpy 									# Library to have multi-dimensional homogenous arrays.							# Copying module.
 import yaml
+import io, contextlib, traceback               # Capturing per-file output and errors.
+import importlib                                # Setting module settings in worker processes.
+import hashlib                                  # Matching saved analysis to its json file.
+import re                                       # Regular expression library
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 
 # Gailbot scripts
 import CHAT										# Script to produce CHAT files.
-import rateAnalysis  							# Script to analyze speech rate.
-import laughAnalysis 							# Script to analyze laughter.
-import soundAnalysis 							# Script to analyze different sound characterists.
+from lazyImport import LazyFunction 			# Imports the analysis modules on first use.
+from wordTable import WordTable, COLUMNS 		# Columnar table of transcribed words.
+import tableWriter 								# Writes CSV / Parquet / Feather tables.
+import profiling 								# Per-stage timing traces of requests.
 
 
 
@@ -38,6 +44,37 @@ import soundAnalysis 							# Script to analyze different sound characterists.
 # Hidden meta-data file for auto-post processing.
 metaFileName = ".meta.json"
 
+# Set False to run without prompts e.g. in batch mode.
+interactive = True
+
+# Set True to run the per-file post-processing stages for multiple files
+# in parallel processes. CHAT generation always runs in this process.
+parallelMode = True
+
+# Maximum number of processes used in parallel mode.
+maxWorkers = os.cpu_count() or 1
+
+# Set True to re-render the CHAT/CA files from the analysis saved by the last
+# full post-processing run, e.g. after changing the CHAT transcription values.
+# Files without saved analysis are fully processed.
+rerenderMode = False
+
+# Settings of the post-processing modules that are passed to the worker
+# processes of parallel mode. Workers started with the spawn method, the
+# default on macOS, would otherwise import the modules with their defaults.
+workerSettings = {
+    "laughAnalysis" : ("streamAudio","useModelWorker","laughExitThreshold","laughMergeGap")
+}
+
+# Suffix of the hidden file in which the analysis of a json file is saved.
+analysisFileSuffix = "-analysis.npz"
+
+# Number of characters of a json file read at once.
+readChunkSize = 1 << 20
+
+# Whitespace and commas between the messages of a json list.
+jsonSeparators = re.compile(r'[\s,]*')
+
 # post-processing module dictionary
 
 # Current selection status of the post-processing modules
@@ -56,11 +93,14 @@ mapping = {
 
 # Mapping between key name and appropriate post-processing function
 funcMapping = {
-    "syllRate" : rateAnalysis.analyzeSyllableRate,	
-    "laughter" : laughAnalysis.analyzeLaugh,
-    #"sound" : soundAnalysis.analyzeSound
+    "syllRate" : LazyFunction("rateAnalysis","analyzeSyllableRate"),
+    "laughter" : LazyFunction("laughAnalysis","analyzeLaugh"),
+    #"sound" : LazyFunction("soundAnalysis","analyzeSound")
 }
 
+# Function that transcribes laughter again from saved frame probabilities.
+retranscribeLaugh = LazyFunction("laughAnalysis","retranscribeLaugh")
+
 # Mapping between a function to the local menu 
 menuMapping = {
     CHAT.formatCHAT : CHAT.main_menu
@@ -75,7 +115,10 @@ CSVfields = ['Speaker Label','Start Time','End Time','Transcript','Confidence',
 
 # Function that implements the main menu.
 # Allows user to select the post-processing functions to implement.
-def main_menu():
+# Input: True to offer re-rendering existing outputs from their saved analysis.
+def main_menu(allowRerender=False):
+    global rerenderMode
+    rerenderMode = False
     while True:
         os.system('clear')
         x = PrettyTable()
@@ -85,13 +128,18 @@ def main_menu():
         x.add_row(["Laughter detection module",postModulesStatus['laughter']])
         #x.add_row(["Sound analysis module",postModulesStatus['sound']])
         print(x)
-        print("\nUse options 1 through 2 to select the post-processing modules " 
-            "to be implemented:")
+        print("\nUse options 1 through {} to select the post-processing modules " 
+            "to be implemented:".format(3 if allowRerender else 2))
         print("\n1. Change selections")
-        print(colored("2. Proceed / Confirm selection\n",'green'))
+        print(colored("2. Proceed / Confirm selection",'green'))
+        if allowRerender: print(colored("3. Re-render CHAT/CA files only (uses the saved analysis)",'green'))
+        print()
         choice = input(" >>  ")
         if choice == '2':
             return applyLocalMenu();
+        if choice == '3' and allowRerender:
+            rerenderMode = True
+            return applyLocalMenu();
         if choice == '1': 
             moduleList = inquire(postModulesStatus)
             createActionList(moduleList)
@@ -120,10 +168,13 @@ def inquire(modules):
 
 # Main menu function
 # Input: Tuple/List containing information.
+# Returns: List of the dictionaries of the files that were post-processed.
+# Files that failed or had no data are left out.
 def postProcess(infoList):
-    processWrapper(infoList)
+    processed = processWrapper(infoList)
     # Function that creates hidden file for post-processing.
     addMetaData(infoList)
+    return processed
 
 
 
@@ -137,29 +188,157 @@ def jsonToCSV(infoList):
         jsonList = getJSON(infoDic)
         # Writing to CSV file.
         filename = infoDic['outputDir'] +"/"+ infoDic['jsonFile'][:infoDic['jsonFile'].find('-json')]+".csv"
-        jsonList.insert(0,CSVfields)
-        writer = csv.writer(open(filename, 'w'))
-        writer.writerows(jsonList)
+        tableWriter.writeColumns(filename,CSVfields,[getattr(jsonList,name) for name in COLUMNS])
         # Updating dictionary
         infoDic['csv'] = filename                   # Adding exit csv filename.
         infoDic['jsonList'] = jsonList				# Adding transcribed data to dictionary 
     # Removing file from list if it is not found.
-    infoList=[infoDic for infoDic in infoList if len(infoDic['jsonList']) > 1]		
+    infoList=[infoDic for infoDic in infoList if len(infoDic['jsonList']) > 0]		
     return infoList
 
 
 # *** Helper functions ****
 
 # Wrapper function that calls all processing functions
+# The analysis of each file is saved before CHAT generation so that the
+# CHAT/CA files can be re-rendered without repeating the per-file stages.
 # Input : List passed to main/postProcess
+# Returns: List of the dictionaries of the files that were processed.
 def processWrapper(infoList):
-    for action in processingActions: 
+    fileActions = [action for action in processingActions if action != CHAT.formatCHAT]
+    actions = [action for action in processingActions if action == CHAT.formatCHAT]
+    keys = [(infoDic['outputDir'],infoDic['jsonFile']) for infoDic in infoList]
+    loaded = [infoDic for infoDic in infoList if rerenderMode and loadAnalysis(infoDic)]
+    pending = [infoDic for infoDic in infoList if not any(infoDic is dic for dic in loaded)]
+    # Running the per-file stages in parallel. CHAT generation groups pair
+    # files and therefore waits for all files.
+    if parallelMode and len(pending) > 1: 
+        with profiling.span('postProcessing.processParallel') as items:
+            pending = processParallel(pending,fileActions) ; items.update(profiling.countItems(pending))
+    else:
+        for action in fileActions:
+            if len(pending) == 0: break
+            pending = profiling.runAction(action,pending)
+    saveAnalysis(pending)
+    # Restoring the original file order, which sets the speaker order of groups.
+    processed = {(infoDic['outputDir'],infoDic['jsonFile']) : infoDic for infoDic in loaded + pending}
+    infoList = [processed[key] for key in keys if key in processed] ; processedList = infoList
+    for action in actions: 
         # Ending if no files to process.
         if len(infoList) == 0: 
             print(colored("Post-processing not applied\nNo data to process\n",'red'))
-            input("\nPress any key to continue...")
-            return
-        else: infoList = action(infoList)
+            if interactive: input("\nPress any key to continue...")
+            return processedList
+        else: infoList = profiling.runAction(action,infoList)
+    return processedList
+
+# Function that applies the per-file actions to each file in a process pool.
+# The output of a file is shown if it failed, was dropped or printed a warning.
+# Input : List passed to main/postProcess, List of per-file actions.
+# Returns: List of processed dictionaries in the original order.
+def processParallel(infoList,actions):
+    numWorkers = min(maxWorkers,len(infoList))
+    print(colored("\nProcessing {0} files using {1} processes\n".format(
+        len(infoList),numWorkers),'blue'))
+    results = [[] for infoDic in infoList]
+    with ProcessPoolExecutor(max_workers=numWorkers) as executor:
+        futures = {executor.submit(processFile,infoDic,actions,CHAT.CHATVals,
+            tableWriter.tableFormats,profiling.enabled,moduleSettings()) : count
+            for count,infoDic in enumerate(infoList)}
+        for done,future in enumerate(as_completed(futures)):
+            count = futures[future] ; name = infoList[count]['outputDir']+"/"+infoList[count]['jsonFile']
+            try: results[count],error,spans,output = future.result()
+            except Exception: error = traceback.format_exc() ; spans = [] ; output = ''
+            profiling.addSpans(spans)
+            if error == None and len(results[count]) > 0:
+                print("[{0}/{1}] Processed: {2}".format(done+1,len(infoList),name))
+                if "WARNING" in output or "ERROR" in output: print(output.strip())
+            else: 
+                print(colored("[{0}/{1}] FAILED: {2}".format(done+1,len(infoList),name),'red'))
+                if output.strip() != '': print(output.strip())
+                if error != None: print(error)
+    return [infoDic for result in results for infoDic in result]
+
+# Function that applies the per-file actions to a single file.
+# Runs in a worker process. Stage output is captured to keep the
+# progress report readable, and returned to be shown for failed files.
+# Input : Dictionary for one file, List of actions, CHAT transcription values,
+# Table output formats, Whether stages are traced, Module settings.
+# Returns: Tuple of the processed list, an error message or None, the
+# spans of the stages and the captured output.
+def processFile(infoDic,actions,CHATVals,tableFormats,tracing=False,settings={}):
+    CHAT.CHATVals.update(CHATVals)
+    tableWriter.tableFormats = tableFormats
+    applySettings(settings)
+    profiling.enabled = tracing ; profiling.collect()
+    infoList = [infoDic] ; output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            for action in actions:
+                if len(infoList) == 0: break
+                infoList = profiling.runAction(action,infoList)
+    except Exception: return [],traceback.format_exc(),profiling.collect(),output.getvalue()
+    return infoList,None,profiling.collect(),output.getvalue()
+
+# Function that returns the workerSettings of the modules imported in this
+# process. Modules that were not imported still have their defaults.
+# Returns: Dictionary from module name to a dictionary of its settings.
+def moduleSettings():
+    return {name : {key : getattr(sys.modules[name],key) for key in keys}
+        for name,keys in workerSettings.items() if name in sys.modules}
+
+# Function that sets the module settings in a worker process.
+# Input: Dictionary returned by moduleSettings.
+def applySettings(settings):
+    for name,values in settings.items():
+        module = importlib.import_module(name)
+        for key,value in values.items(): setattr(module,key,value)
+
+# Function that saves the analysis of each file i.e. its word table after the
+# per-file stages and its laughter probabilities.
+def saveAnalysis(infoList):
+    modules = [key for key,function in funcMapping.items() if function in processingActions]
+    for infoDic in infoList:
+        try:
+            arrays = infoDic['jsonList'].toArrays()
+            if 'laughProbs' in infoDic: arrays['laughProbs'] = infoDic['laughProbs']
+            arrays['info'] = numpy.array(json.dumps({"jsonHash" : fileHash(jsonPath(infoDic)),
+                "modules" : modules, "CHATVals" : CHAT.CHATVals}))
+            numpy.savez(analysisPath(infoDic),**arrays)
+        except (OSError,TypeError,ValueError) as e:
+            print(colored("\nWARNING: Analysis not saved: {0}\n{1}".format(jsonPath(infoDic),e),'red'))
+
+# Function that loads the saved analysis of a file for re-rendering.
+# Laughter is transcribed again using the current thresholds. Analysis saved
+# for a different version of the json file is not used.
+# Returns: True if the analysis was loaded, False otherwise.
+def loadAnalysis(infoDic):
+    try:
+        with numpy.load(analysisPath(infoDic)) as arrays:
+            info = json.loads(str(arrays['info']))
+            if info['jsonHash'] != fileHash(jsonPath(infoDic)): return False
+            jsonList = WordTable.fromArrays(arrays)
+            if 'laughProbs' in arrays.files: jsonList = retranscribeLaugh(jsonList,arrays['laughProbs'])
+    except (OSError,KeyError,ValueError): return False
+    print("Loaded saved analysis: {}".format(jsonPath(infoDic)))
+    if ('syllRate' in info['modules'] and 
+        info['CHATVals']['turnEndThreshold'] != CHAT.CHATVals['turnEndThreshold']):
+        print(colored("WARNING: Syllable rates use the saved turn end threshold: {}".format(
+            info['CHATVals']['turnEndThreshold']),'red'))
+    infoDic['jsonList'] = jsonList
+    return True
+
+# Function that returns the path of the json file of a file dictionary.
+def jsonPath(infoDic):
+    return infoDic['outputDir'] +"/"+ infoDic['jsonFile']
+
+# Function that returns the path of the saved analysis of a file dictionary.
+def analysisPath(infoDic):
+    return infoDic['outputDir'] +"/."+ infoDic['jsonFile'][:infoDic['jsonFile'].find('-json')] + analysisFileSuffix
+
+# Function that returns the sha256 hash of the contents of a file.
+def fileHash(path):
+    with open(path,'rb') as f: return hashlib.sha256(f.read()).hexdigest()
 
 # Function that writes a meta-data file for automatic post-processing.
 def addMetaData(infoList):
@@ -184,70 +363,157 @@ def addMetaData(infoList):
 
 
 # Function that assigns speaker names based on the number of speakers
-# Input: Transcribed word List + additional metrics from getJSON
+# Input: Transcribed word table + additional metrics from getJSON
 # TODO: MAKE THIS INTO A MODE
 def assignSpeakers(jsonList,namesList):
     if len(namesList) == 1: 
-        for listElem in jsonList: 
-            #listElem[0] = str(listElem[0])
-            listElem[0] = namesList[0]
+        jsonList.speaker[:] = namesList[0]
     elif len(namesList) == 2:
-        for listElem in jsonList:
-            if listElem[0] == 0 : 
-                #listElem[0] = str(listElem[0])
-                listElem[0] = namesList[0]
-            else: 
-                #listElem[0] = str(listElem[0])
-                listElem[0] = namesList[1]
+        first = jsonList.speaker == 0
+        jsonList.speaker[first] = namesList[0]
+        jsonList.speaker[~first] = namesList[1]
     return jsonList
 
 
 # Function that retrieves json data from file.
-# Returns: Transcribed word List + additional metrics
+# Messages are read one at a time and their words are added to one list per
+# field, so the file is never held in memory as a whole.
+# Returns: WordTable of transcribed words + additional metrics
 def getJSON(infoDic):
-    jsonList = []
+    columns = [[] for field in CSVfields[1:]]
     labels = {}
-    try:
-        with open(infoDic['outputDir'] +"/"+ infoDic['jsonFile']) as f: jsonObject = json.load(f)
+    try: f = open(jsonPath(infoDic))
     except FileNotFoundError:
-        print(colored("\nERROR: File not found: {}".format(infoDic['outputDir'] +"/"+ infoDic['jsonFile']),'red'))
-        return []
-    for res in jsonObject:
-        if "speaker_labels" not in res:
-            # Extracting main fields
-            try:
-                processingMetrics = res['processing_metrics']
-                resultIndex = res['result_index'];results = res['results']
-                final = results[0]['final'];wordData = results[0]['alternatives'][0]
-                # Extracting data to be written to file.
-                periodic = processingMetrics['periodic']
-                recieved = processingMetrics['processed_audio']['received']
-                confidenceVals = wordData['word_confidence'];words = wordData['timestamps']
-                # Writing row per word.
-                if final:
-                    for word,confidence in itertools.zip_longest(words,confidenceVals):
-                            # Extracting transcript and timing
-                            trans = word[0];startTime = word[1]
-                            endTime = word[2];confVal = confidence[1]
-                            jsonList.append([startTime,endTime,trans,confVal,
-                                periodic,recieved,resultIndex])
-            except KeyError: continue
-        else:
-            speakerLabels = res['speaker_labels']
-            for label in speakerLabels: labels.update({label['from']:label['speaker']})
+        print(colored("\nERROR: File not found: {}".format(jsonPath(infoDic)),'red'))
+        return WordTable()
+    with f: 
+        for res in iterJSON(f): addMessage(res,columns,labels)
     # Adding speaker labels to output list
-    for listElem,label in zip(jsonList,labels): listElem.insert(0,labels[label])
-    # Adding label if no speaker labels were returned.
-    if len(labels) == 0: 
-        labels = numpy.resize([0,1],len(jsonList))
-        for elem,label in zip(jsonList,labels):elem.insert(0,label)
+    speakers = joinSpeakerLabels(columns[0],labels,jsonPath(infoDic))
+    # Assigning all words to the first speaker if no speaker labels were returned.
+    if len(labels) == 0 and len(infoDic['names']) > 1:
+        print(colored("\nWARNING: No speaker labels returned, assigning all words to {0}: {1}".format(
+            infoDic['names'][0],jsonPath(infoDic)),'red'))
+    jsonList = WordTable(speakers,*columns)
     # Changing labels to provided names
     jsonList = assignSpeakers(jsonList,infoDic['names'])
     return jsonList
 
+# Function that adds the words of a final result to the field lists, or the
+# speaker labels of a speaker labels message to the labels dictionary.
+# Input: Message, List of lists of word fields in CSVfields order (after the
+# speaker label), Dictionary from word start time to speaker label.
+def addMessage(res,columns,labels):
+    if "speaker_labels" not in res:
+        # Extracting main fields
+        try:
+            processingMetrics = res['processing_metrics']
+            resultIndex = res['result_index'];results = res['results']
+            final = results[0]['final'];wordData = results[0]['alternatives'][0]
+            # Extracting data to be written to file.
+            periodic = processingMetrics['periodic']
+            recieved = processingMetrics['processed_audio']['received']
+            confidenceVals = wordData['word_confidence'];words = wordData['timestamps']
+            # Writing row per word.
+            if final:
+                rows = []
+                for word,confidence in itertools.zip_longest(words,confidenceVals):
+                        # Extracting transcript and timing
+                        trans = word[0];startTime = word[1]
+                        endTime = word[2];confVal = confidence[1]
+                        rows.append((startTime,endTime,trans,confVal,
+                            periodic,recieved,resultIndex))
+                for column,values in zip(columns,zip(*rows)): column.extend(values)
+        except KeyError: return
+    else:
+        speakerLabels = res['speaker_labels']
+        for label in speakerLabels: labels.update({label['from']:label['speaker']})
+
+# Function that returns the speaker label of each word by looking up its start
+# time in the labels, which hold the last label sent for each start time.
+# Words without a label take the label of the previous word and are reported.
+# Input: Word start times, Dictionary from word start time to speaker label,
+# json file name.
+# Returns: List of speaker labels.
+def joinSpeakerLabels(starts,labels,filename):
+    speakers = [labels.get(start) for start in starts]
+    unmatched = speakers.count(None)
+    if unmatched == 0: return speakers
+    if len(labels) > 0:
+        print(colored("\nWARNING: {0} of {1} words have no speaker label: {2}".format(
+            unmatched,len(speakers),filename),'red'))
+    previous = next((speaker for speaker in speakers if speaker != None),0)
+    for count,speaker in enumerate(speakers):
+        if speaker == None: speakers[count] = previous
+        else: previous = speaker
+    return speakers
+
+# Function that yields the messages in an open json file one at a time.
+# Reads both a json list and newline-delimited json (final results only mode).
+# Interim results are skipped without being decoded where possible.
+def iterJSON(f):
+    if f.read(1) != '[':
+        f.seek(0)
+        for line in f:
+            if len(line.strip()) > 0 and not isInterim(line): yield json.loads(line)
+        return
+    f.seek(0)
+    buffer = f.read(readChunkSize)
+    if buffer.startswith("[\n    {"): yield from splitJSONList(f,buffer)
+    else: yield from decodeJSONList(f,buffer)
+
+# Function that yields the messages of a json list written with indent=4
+# (STT.writeResults). Each message ends at the first line that only holds a
+# closing brace at the first indentation level, since json strings cannot
+# contain newlines.
+# Input: Open json file, Text already read from the file.
+def splitJSONList(f,buffer):
+    pos = searchFrom = 1
+    while True:
+        end = buffer.find("\n    }",searchFrom)
+        if end == -1:
+            chunk = f.read(readChunkSize)
+            if len(chunk) == 0:
+                if buffer[pos:].strip() != ']': raise ValueError("Incomplete json list")
+                return
+            buffer = buffer[pos:] + chunk ; pos = 0
+            searchFrom = max(len(buffer) - len(chunk) - len("\n    }"),0)
+            continue
+        text = buffer[buffer.index('{',pos):end+len("\n    }")]
+        pos = searchFrom = end + len("\n    }")
+        if not isInterim(text): yield json.loads(text)
+
+# Function that yields the messages of a json list in any other format,
+# decoding one message at a time.
+# Input: Open json file, Text already read from the file.
+def decodeJSONList(f,buffer):
+    decoder = json.JSONDecoder() ; chunkSize = readChunkSize
+    pos = buffer.index('[') + 1
+    while True:
+        pos = jsonSeparators.match(buffer,pos).end()
+        if buffer.startswith(']',pos): return
+        try: message,end = decoder.raw_decode(buffer,pos)
+        except ValueError:
+            # Reading more of the file if the message is incomplete.
+            chunk = f.read(chunkSize)
+            if len(chunk) == 0: raise
+            buffer = buffer[pos:] + chunk ; pos = 0 ; chunkSize *= 2
+            continue
+        pos = end ; chunkSize = readChunkSize
+        yield message
+
+# Function that checks if the text of a message is an interim result i.e.
+# the first result of the message is not final. Speaker labels messages
+# have no results.
+def isInterim(text):
+    results = text.find('"results":')
+    if results == -1: return False
+    final = text.find('"final":',results)
+    return final != -1 and text[final+len('"final":'):].lstrip().startswith('false')
+
 #  *** List of functions to implement ***
-processingActions = [jsonToCSV,rateAnalysis.analyzeSyllableRate,
-        laughAnalysis.analyzeLaugh,#soundAnalysis.analyzeSound,
+processingActions = [jsonToCSV,funcMapping['syllRate'],
+        funcMapping['laughter'],#LazyFunction("soundAnalysis","analyzeSound"),
         CHAT.formatCHAT]
 
 # List of functions to implement
@@ -292,7 +558,7 @@ def exec_menu(choice,function_list):
 # Function that runs the entire post-processing module as a separate entity.
 def runLocal(username,password,closure):
     if not local_menu(): return False
-    if not main_menu(): return False
+    if not main_menu(True): return False
     os.system('clear')
     postProcess(infoList)
     print(colored("\nPost-processing completed\n",'green'))
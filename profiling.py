@@ -0,0 +1,215 @@
+'''
+	Script that records how long the stages of a Gailbot request take.
+	Each stage runs in a span that records its wall time, CPU time, the peak
+	memory of the process and the number of items processed. The spans of a
+	request are written as a json trace, optionally with a cProfile or
+	pyinstrument profile of the request.
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 5/30/19
+'''
+
+import contextlib 								# Span context managers.
+import json
+import os 										# for listing directories
+import sys
+import threading 								# Spans of the media worker threads.
+import time 									# Timing library
+from termcolor import colored					# Text coloring library
+
+try: import resource 							# Peak memory, not available on Windows.
+except ImportError: resource = None
+
+# *** Global variables / invariants ***
+
+# Set True to write a trace of the stages of each request.
+enabled = False
+
+# Directory the traces are written to.
+traceDir = "traces"
+
+# Profiler run over each request i.e. None, 'cProfile' or 'pyinstrument'.
+# Both only profile the main thread.
+profiler = None
+
+# Spans recorded since the current request started.
+spans = []
+spansLock = threading.Lock()
+
+# Names of the open spans of each thread.
+openSpans = threading.local()
+
+# Start time of the current request and its running profiler.
+traceStart = time.time()
+activeProfiler = None
+
+
+# *** Trace functions ***
+
+# Function that starts the trace of a request.
+# Spans recorded before it, e.g. of a cancelled request, are dropped.
+def startTrace():
+	global traceStart, activeProfiler
+	stopProfiler() ; collect()
+	traceStart = time.time()
+	if not enabled or profiler == None: return
+	if profiler == 'cProfile':
+		import cProfile 						# Deterministic profiler.
+		activeProfiler = cProfile.Profile()
+		activeProfiler.enable()
+	elif profiler == 'pyinstrument':
+		try: import pyinstrument 				# Sampling profiler.
+		except ImportError:
+			print(colored("\nERROR: pyinstrument is required to profile requests",'red'))
+			return
+		activeProfiler = pyinstrument.Profiler()
+		activeProfiler.start()
+	else: print(colored("\nERROR: Unknown profiler: {}".format(profiler),'red'))
+
+# Function that writes the trace of the current request and its profile.
+# Input: Name of the request.
+# Returns: Path of the trace file or None if no trace was written.
+def writeTrace(name):
+	if not enabled: return None
+	running = stopProfiler() ; records = collect()
+	started = time.strftime('%Y%m%d-%H%M%S',time.localtime(traceStart))
+	base = os.path.join(traceDir,"{0}-{1}".format(str(name).replace(os.sep,'_'),started))
+	count = 1 ; path = base
+	while os.path.exists(path+'.json'): count += 1 ; path = "{0}-{1}".format(base,count)
+	try:
+		os.makedirs(traceDir,exist_ok=True)
+		profilePath = writeProfile(running,path)
+		for record in records: record['start'] = round(record['start']-traceStart,3)
+		trace = {"name" : name, "started" : started, "seconds" : round(time.time()-traceStart,3),
+			"profile" : profilePath, "stages" : totals(records), "spans" : records}
+		with open(path+'.json','w') as f: f.write(json.dumps(trace,indent=2) + "\n")
+	except (OSError,TypeError,ValueError) as e:
+		print(colored("\nWARNING: Trace not written: {0}\n{1}".format(path+'.json',e),'red'))
+		return None
+	return path+'.json'
+
+# Context manager that records a span around a stage.
+# Yields a dictionary the stage adds the number of items it processed to.
+@contextlib.contextmanager
+def span(name):
+	if not enabled:
+		yield {} ; return
+	stack = openSpans.__dict__.setdefault('stack',[])
+	record = {"name" : name, "parent" : stack[-1] if len(stack) > 0 else None,
+		"thread" : threading.current_thread().name, "pid" : os.getpid(),
+		"start" : time.time(), "items" : {}}
+	stack.append(name)
+	wall = time.perf_counter() ; cpu = time.process_time() ; childCpu = childCpuTime()
+	try: yield record['items']
+	finally:
+		stack.pop()
+		record['wall'] = round(time.perf_counter()-wall,4)
+		record['cpu'] = round(time.process_time()-cpu,4)
+		if childCpu != None: record['childCpu'] = round(childCpuTime()-childCpu,4)
+		record['peakMemoryMB'] = peakMemory()
+		with spansLock: spans.append(record)
+
+# Function that runs a pipeline action on an info list in a span named
+# after the action.
+# Returns: Return value of the action.
+def runAction(action,infoList):
+	if not enabled: return action(infoList)
+	with span(actionName(action)) as items:
+		infoList = action(infoList)
+		items.update(countItems(infoList))
+	return infoList
+
+# Function that returns the spans recorded since the last call and clears them.
+def collect():
+	global spans
+	with spansLock:
+		records = spans ; spans = []
+	return records
+
+# Function that adds spans recorded in another process e.g. a post-processing
+# worker, under the current span.
+def addSpans(records):
+	stack = openSpans.__dict__.get('stack',[])
+	for record in records:
+		if record['parent'] == None and len(stack) > 0: record['parent'] = stack[-1]
+	with spansLock: spans.extend(records)
+
+
+# *** Helper functions for recording spans ***
+
+# Function that returns the number of files, words, turns and laughter
+# frames of an info list, which is either a list of file dictionaries or a
+# list of groups of them.
+def countItems(infoList):
+	if not isinstance(infoList,list): return {}
+	dics = [dic for item in infoList for dic in (item if isinstance(item,list) else [item])
+		if isinstance(dic,dict)]
+	items = {"files" : len(dics)}
+	words = [len(dic['jsonList']) for dic in dics if 'jsonList' in dic]
+	if len(words) > 0: items['words'] = sum(words)
+	# The files of a group share their combined turns.
+	turns = {}
+	for dic in dics:
+		turnList = dic.get('jsonListCombined',dic.get('jsonListTurns'))
+		if turnList != None: turns[id(turnList)] = len(turnList)
+	if len(turns) > 0: items['turns'] = sum(turns.values())
+	frames = [len(dic['laughProbs']) for dic in dics if 'laughProbs' in dic]
+	if len(frames) > 0: items['frames'] = sum(frames)
+	return items
+
+# Function that returns the name of an action i.e. module.function.
+def actionName(action):
+	if hasattr(action,'functionName'): return action.moduleName+"."+action.functionName
+	return getattr(action,'__module__','')+"."+getattr(action,'__name__',repr(action))
+
+# Function that returns the wall time, CPU time and number of spans of each
+# stage of a trace.
+def totals(records):
+	stages = {}
+	for record in records:
+		stage = stages.setdefault(record['name'],{"count" : 0, "wall" : 0, "cpu" : 0})
+		stage['count'] += 1
+		stage['wall'] = round(stage['wall']+record['wall'],4)
+		stage['cpu'] = round(stage['cpu']+record['cpu'],4)
+	return stages
+
+# Function that stops the profiler of the request.
+# Returns: The stopped profiler or None if no profiler was running.
+def stopProfiler():
+	global activeProfiler
+	running = activeProfiler ; activeProfiler = None
+	if running == None: return None
+	if hasattr(running,'disable'): running.disable()
+	else: running.stop()
+	return running
+
+# Function that writes the output of a stopped profiler next to its trace.
+# Returns: Path of the profile or None if there is no profiler.
+def writeProfile(running,path):
+	if running == None: return None
+	if hasattr(running,'dump_stats'):
+		running.dump_stats(path+'.prof') ; return path+'.prof'
+	with open(path+'.html','w') as f: f.write(running.output_html())
+	return path+'.html'
+
+# Function that returns the peak memory i.e. resident set size of the
+# process in MB, or None if it is not available.
+def peakMemory():
+	if resource == None: return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Reported in bytes on macOS and in kilobytes on Linux.
+	return round(peak / (1024*1024 if sys.platform == 'darwin' else 1024),1)
+
+# Function that returns the CPU time used by finished child processes
+# e.g. ffmpeg, or None if it is not available.
+def childCpuTime():
+	if resource == None: return None
+	usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+	return usage.ru_utime + usage.ru_stime
@@ -28,14 +28,16 @@
 import os, sys
 import librosa.display 						# Library to display signal.
 import numpy 									# Library to have multi-dimensional homogenous arrays.
-from big_phoney import BigPhoney				# Finds the syllables per word.
 from statsmodels import robust 					# Statistics library.
 import tensorflow as tf 						# Deep neural network library
-import operator									# Sorting library
 import copy 									# Copying module.
 import logging
 from termcolor import colored
 
+# Gailbot scripts
+from wordTable import WordTable 				# Columnar table of transcribed words.
+import syllables 								# Cached syllable counts per word.
+
 
 import matplotlib.pyplot as plt 				# Library to visualize mfcc features.
 from matplotlib.font_manager import FontProperties
@@ -94,9 +96,8 @@ def analyzeSyllableRate(infoList):
 # Returns: A list of dictionaries where each dictionary contains data for one turn.
 def findSyllables(jsonListTurns):
 	dictionaryList = []
-	phoney = BigPhoney()
-	for elem in jsonListTurns:
-		syllableNum = sum([phoney.count_syllables(word) for word in elem[3].split()])
+	syllableNums = syllables.countTranscripts([elem[3] for elem in jsonListTurns])
+	for elem,syllableNum in zip(jsonListTurns,syllableNums):
 		dictionaryList.append({"elem" : elem, "syllableNum" : syllableNum,
 			"syllRate" : round(syllableNum/(abs(elem[2]-elem[1])),2)})
 	return dictionaryList
@@ -140,26 +141,23 @@ def addDelims(dictionaryList,statsDic,jsonList):
 	print("Fast turns found: {0}\nSlow turns found: {1}\n".format(fastCount,slowCount))
 	for elem in jsonListTurns:
 		for word in elem[3].split():words.append(word)
-	for word,elem in zip(words,jsonList[1:]): elem[3] = str(word)
+	size = min(len(words),len(jsonList))
+	jsonList.transcript[:size] = [str(word) for word in words[:size]]
 	return jsonList
 
 
 # Function that removes hesitation markers from jsonList
 def removeHesitation(infoList):
 	for dic in infoList:
-		dic['jsonList'] = [elem for elem in dic['jsonList'] if elem[3] != "%HESITATION"]
+		dic['jsonList'] = dic['jsonList'][dic['jsonList'].transcript != "%HESITATION"]
 	return infoList
 
 # Function that adds hesitation markers back
 # Input: Two dictionaries in infoList.
 # Returns: jsonList
 def addHesitation(dicCopy,dic):
-	jsonList = []
-	for elem in dicCopy['jsonList']:jsonList.append(elem)
-	for elem in dic['jsonList']:
-		if elem[3] == "%HESITATION":jsonList.append(elem)
-	jsonList[1:] = sorted(jsonList[1:], key = operator.itemgetter(1))
-	return jsonList
+	hesitations = dic['jsonList'][dic['jsonList'].transcript == "%HESITATION"]
+	return WordTable.concatenate([dicCopy['jsonList'],hesitations]).sortedByStart()
 
 # Function that finds the last vowel in a string
 def lastVowelPos(string):
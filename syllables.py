@@ -0,0 +1,163 @@
+'''
+	Script that counts the syllables of transcribed words.
+	The syllable counter loads a neural model, so it is loaded once per process.
+	Counts are cached in a persistent on-disk word to syllable cache, with
+	the most recently used words also kept in memory.
+	The disk cache is an sqlite database in WAL mode, so that the
+	post-processing worker processes can read and add to it at the same time.
+	Each unique word of a transcript is only counted once.
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/17/19
+'''
+
+import argparse 								# Library to extract input arguments
+import os 										# for listing directories
+import sqlite3 									# On-disk database shared by processes.
+from collections import OrderedDict 			# Least recently used memory cache.
+
+# *** Global variables / invariants ***
+
+# Path of the on-disk syllable cache. None disables the disk cache.
+# The database is not safe to share over network file systems.
+cachePath = os.path.join(os.path.dirname(os.path.abspath(__file__)),".syllable-cache.sqlite")
+
+# Seconds a process waits for another process writing to the disk cache.
+cacheTimeout = 30
+
+# Number of words looked up in the disk cache per query.
+cacheBatchSize = 500
+
+# Maximum number of words kept in the memory cache.
+memoryCacheSize = 50000
+
+# Syllable counter, loaded on first use.
+phoney = None
+
+# Words most recently counted, in order of use.
+memoryCache = OrderedDict()
+
+# Number of words found in the memory cache, the disk cache or counted.
+cacheStats = {
+	"memoryHits" : 0,
+	"diskHits" : 0,
+	"misses" : 0
+}
+
+
+# *** Syllable counting functions ***
+
+# Function that returns the number of syllables of each word.
+# Input: Iterable of words.
+# Returns: Dictionary from each unique word to its number of syllables.
+def countWords(words):
+	counts = {} ; missing = []
+	for word in set(words):
+		if word in memoryCache:
+			memoryCache.move_to_end(word)
+			counts[word] = memoryCache[word] ; cacheStats['memoryHits'] += 1
+		else: missing.append(word)
+	if len(missing) > 0: counts.update(loadWords(missing))
+	return counts
+
+# Function that returns the number of syllables of each word in each transcript.
+# Input: List of transcript strings.
+# Returns: List of syllable counts in the order of transcripts.
+def countTranscripts(transcripts):
+	words = [transcript.split() for transcript in transcripts]
+	counts = countWords(word for transcriptWords in words for word in transcriptWords)
+	return [sum([counts[word] for word in transcriptWords]) for transcriptWords in words]
+
+# Function that returns the cache hit rate since the process started.
+# Returns: Fraction of words that were found in either cache.
+def hitRate():
+	total = sum(cacheStats.values())
+	if total == 0: return 0.0
+	return (cacheStats['memoryHits'] + cacheStats['diskHits']) / total
+
+
+# *** Helper functions for the syllable cache ***
+
+# Function that gets words from the disk cache, counting the words that are
+# not cached yet, and adds them to the memory cache.
+# The disk cache is not locked while words are counted.
+# Returns: Dictionary from each word to its number of syllables.
+def loadWords(words):
+	cache = openCache()
+	counts = readCache(cache,words)
+	cacheStats['diskHits'] += len(counts)
+	missing = [word for word in words if word not in counts]
+	for word in missing: counts[word] = countSyllables(word)
+	cacheStats['misses'] += len(missing)
+	writeCache(cache,{word : counts[word] for word in missing})
+	if cache != None: cache.close()
+	for word,count in counts.items(): remember(word,count)
+	return counts
+
+# Function that counts the syllables of a word using the neural counter.
+def countSyllables(word):
+	global phoney
+	if phoney == None:
+		from big_phoney import BigPhoney 		# Finds the syllables per word.
+		phoney = BigPhoney()
+	return phoney.count_syllables(word)
+
+# Function that adds a word to the memory cache, removing the least recently
+# used word if the cache is full.
+def remember(word,count):
+	memoryCache[word] = count
+	memoryCache.move_to_end(word)
+	while len(memoryCache) > memoryCacheSize: memoryCache.popitem(last=False)
+
+# Function that opens the disk cache, creating it if required.
+# Returns: Database connection or None if the disk cache is disabled or
+# cannot be opened.
+def openCache():
+	if cachePath == None: return None
+	try:
+		cache = sqlite3.connect(cachePath,timeout=cacheTimeout)
+		cache.execute("PRAGMA journal_mode=WAL")
+		cache.execute("CREATE TABLE IF NOT EXISTS syllables (word TEXT PRIMARY KEY, count INTEGER)")
+		return cache
+	except sqlite3.Error: return None
+
+# Function that looks up words in the disk cache.
+# Returns: Dictionary from each cached word to its number of syllables.
+def readCache(cache,words):
+	counts = {}
+	if cache == None: return counts
+	try:
+		for first in range(0,len(words),cacheBatchSize):
+			batch = words[first:first+cacheBatchSize]
+			counts.update(cache.execute("SELECT word,count FROM syllables WHERE word IN ({})".format(
+				",".join("?"*len(batch))),batch).fetchall())
+	except sqlite3.Error: pass
+	return counts
+
+# Function that adds counted words to the disk cache in one transaction.
+# Words added by another process in the meantime are kept.
+def writeCache(cache,counts):
+	if cache == None or len(counts) == 0: return
+	try:
+		with cache: cache.executemany("INSERT OR IGNORE INTO syllables VALUES (?,?)",counts.items())
+	except sqlite3.Error: pass
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+		description = 'Count syllables in text files and add the words to the syllable cache')
+	parser.add_argument('files', nargs = '+', help = 'Text files with one transcript per line')
+	args = parser.parse_args()
+	for fileName in args.files:
+		with open(fileName,encoding='utf-8') as f: transcripts = f.read().splitlines()
+		total = sum(countTranscripts(transcripts))
+		print("{0}: {1} syllables in {2} lines".format(fileName,total,len(transcripts)))
+	print("Memory hits: {0}, Disk hits: {1}, Misses: {2}, Hit rate: {3:.1%}".format(
+		cacheStats['memoryHits'],cacheStats['diskHits'],cacheStats['misses'],hitRate()))
@@ -0,0 +1,84 @@
+'''
+	Script that writes the tabular outputs of Gailbot i.e. the per-file word
+	CSV files and the combined CSV file of each conversation.
+	Each table is written in one buffered pass and its file is closed before
+	returning. Tables can additionally be written as Parquet or Feather (Arrow)
+	files for analysis, which requires pyarrow.
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/20/19
+'''
+
+import csv 										# Writing CSV files.
+import itertools 								# Padding rows of unequal length.
+import os 										# for listing directories
+from termcolor import colored					# Text coloring library
+
+# *** Global variables / invariants ***
+
+# Formats tables are written in besides CSV i.e. 'parquet', 'feather'.
+tableFormats = []
+
+# Size of the write buffer of output files (bytes).
+writeBufferBytes = 1024 * 1024
+
+
+# *** Table writing functions ***
+
+# Function that writes a table given as rows.
+# Input: CSV file name, List of field names, Iterable of rows.
+# Returns: CSV file name.
+def writeRows(filename,fields,rows):
+	if len(tableFormats) > 0:
+		rows = list(rows)
+		columns = list(itertools.zip_longest(*rows)) or [() for field in fields]
+		writeArrow(filename,fields,columns)
+	writeCSV(filename,fields,rows)
+	return filename
+
+# Function that writes a table given as columns of equal length.
+# Input: CSV file name, List of field names, List of lists / numpy arrays.
+# Returns: CSV file name.
+def writeColumns(filename,fields,columns):
+	if len(tableFormats) > 0: writeArrow(filename,fields,columns)
+	writeCSV(filename,fields,zip(*[column.tolist() if hasattr(column,'tolist') else column
+		for column in columns]))
+	return filename
+
+
+# *** Helper functions for writing tables ***
+
+# Function that writes the header and rows of a CSV file.
+def writeCSV(filename,fields,rows):
+	with open(filename,'w',newline='',buffering=writeBufferBytes) as f:
+		writer = csv.writer(f)
+		writer.writerow(fields)
+		writer.writerows(rows)
+
+# Function that writes columns in each of the tableFormats next to the CSV file.
+# Columns that pyarrow cannot convert are reported and the format is skipped.
+def writeArrow(filename,fields,columns):
+	try:
+		import pyarrow 							# Arrow tables.
+		import pyarrow.parquet, pyarrow.feather
+	except ImportError:
+		print(colored("\nERROR: pyarrow is required to write {}".format(
+			", ".join(tableFormats)),'red'))
+		return
+	try: table = pyarrow.Table.from_arrays([pyarrow.array(column) for column in columns],
+		names=fields)
+	except (pyarrow.ArrowException,TypeError,ValueError) as e:
+		print(colored("\nERROR: Could not convert table: {0}\n{1}".format(filename,e),'red'))
+		return
+	base = os.path.splitext(filename)[0]
+	for fmt in tableFormats:
+		if fmt == 'parquet': pyarrow.parquet.write_table(table,base+'.parquet')
+		elif fmt == 'feather': pyarrow.feather.write_feather(table,base+'.feather')
+		else: print(colored("\nERROR: Unknown table format: {}".format(fmt),'red'))
@@ -0,0 +1,8 @@
+'''
+	Test configuration of the Gailbot-3 development project.
+	Makes the Gailbot scripts importable from the tests.
+'''
+
+import os, sys
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,28 @@
+'''
+	Tests of the CA transcripts against golden files.
+	Each fixtures/ca/<name>.cha transcript has a <name>.S.ca file written by
+	the jeffersonize and indent binaries the CA files were made with before.
+'''
+
+import glob, io, os
+import pytest
+
+import CA
+
+fixtureDir = os.path.join(os.path.dirname(os.path.abspath(__file__)),"fixtures","ca")
+fixtures = sorted(os.path.basename(path)[:-len(".cha")]
+	for path in glob.glob(os.path.join(fixtureDir,"*.cha")))
+
+# Function that reads a fixture without translating its line endings.
+def readFixture(fileName):
+	with io.open(os.path.join(fixtureDir,fileName),encoding='utf-8',newline='') as f:
+		return f.read()
+
+
+@pytest.mark.parametrize("name",fixtures)
+def test_CA_transcript_matches_golden_file(name):
+	lines = readFixture(name+".cha").splitlines(True)
+	# The header lines end before the first turn.
+	count = next(i for i,line in enumerate(lines)
+		if not line.startswith('@') or line.startswith('@End'))
+	assert CA.renderCA(lines[:count],lines[count:]) == readFixture(name+".S.ca")
@@ -0,0 +1,41 @@
+'''
+	Tests of the overlap markers of the CHAT transcripts.
+'''
+
+import pytest
+
+pytest.importorskip("prettytable")
+import CHAT
+
+
+# Function that adds the overlap markers to a list of turns.
+# Returns: Transcripts of the turns.
+def markOverlaps(turns):
+	CHAT.overlaps([[{'jsonListCombined' : turns}]])
+	return [turn[3] for turn in turns]
+
+# Function that returns True if no overlap markers in a transcript are nested.
+def wellFormed(trans):
+	depth = 0
+	for token in trans.split():
+		if token == '<': depth += 1
+		elif token == '>': depth -= 1
+		if depth not in (0,1): return False
+	return depth == 0
+
+def test_two_speaker_overlap():
+	assert markOverlaps([['A',0,4,'one two three four five six seven eight'],
+		['B',2,6,'wait what are you saying here']]) == [
+		'one two three four <  five six seven eight > [>]',
+		' < wait what are you > [<]  saying here']
+
+# A turn overlapping two later turns that overlap each other is marked once,
+# and the later turns are not marked against each other.
+def test_three_speaker_overlaps_are_not_nested():
+	marked = markOverlaps([
+		['A',0,10,'one two three four five six seven eight nine ten eleven twelve'],
+		['B',2,8,'wait what are you saying here'],
+		['C',3,6,'no way really']])
+	assert all(wellFormed(trans) for trans in marked)
+	assert [trans.count('[>]') for trans in marked] == [1,0,0]
+	assert [trans.count('[<]') for trans in marked] == [0,1,1]
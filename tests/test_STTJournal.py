@@ -0,0 +1,21 @@
+'''
+	Tests of the journal of transcription jobs.
+'''
+
+import STTJournal
+
+
+def test_directory_is_resumed_for_its_own_files(tmp_path):
+	outputDir = str(tmp_path)
+	STTJournal.record(outputDir,"a.wav",'started',attempt=0,offset=0)
+	STTJournal.record(outputDir,"b.opus",'started',attempt=0,offset=0)
+	STTJournal.record(outputDir,"b.opus",'completed')
+	assert STTJournal.resumableFor(outputDir,["a.wav","a.opus"])
+	assert not STTJournal.resumableFor(outputDir,["b.wav","b.opus"])
+
+def test_directory_with_unfinished_files_of_other_requests_is_not_resumed(tmp_path):
+	outputDir = str(tmp_path)
+	STTJournal.record(outputDir,"a.wav",'started',attempt=0,offset=0)
+	STTJournal.record(outputDir,"old.wav",'failed')
+	assert not STTJournal.resumableFor(outputDir,["a.wav","a.opus"])
+	assert not STTJournal.resumableFor(str(tmp_path / "missing"),["a.wav"])
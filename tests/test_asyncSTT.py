@@ -0,0 +1,168 @@
+'''
+	Tests of the asyncio Speech to Text client against a local fake service.
+	The fake service answers each recognition with one final result per
+	connection, relative to the audio it recieved.
+'''
+
+import asyncio, json, os, shutil, threading, time, wave
+from concurrent.futures import Future
+import pytest
+
+pytest.importorskip("websockets")
+for name in ("autobahn","twisted","requests"): pytest.importorskip(name)
+import websockets
+import asyncSTT, STT, STTJournal, transcriptCache
+
+
+# Fake Speech to Text service running its own event loop in a thread.
+class FakeService:
+
+	'''
+		closeCode : Code the service closes each connection with after the
+			audio, or None to send results.
+		status : HTTP status the handshake is refused with, or None.
+		connections : Number of connections opened.
+		opened : Time each connection was opened.
+		peak : Largest number of connections open at the same time.
+		audioBytes : Bytes of audio recieved by each connection.
+	'''
+	def __init__(self,closeCode=None,status=None):
+		self.closeCode = closeCode ; self.status = status
+		self.connections = 0 ; self.active = 0 ; self.peak = 0
+		self.audioBytes = [] ; self.opened = []
+		self.loop = asyncio.new_event_loop()
+		self.started = threading.Event()
+		self.thread = threading.Thread(target=self.run,daemon=True)
+		self.thread.start() ; self.started.wait()
+
+	def run(self):
+		asyncio.set_event_loop(self.loop)
+		self.server = self.loop.run_until_complete(websockets.serve(self.handle,
+			'localhost',0,process_request=self.processRequest))
+		self.url = "ws://localhost:{}".format(self.server.sockets[0].getsockname()[1])
+		self.started.set()
+		self.loop.run_forever()
+
+	def stop(self):
+		self.loop.call_soon_threadsafe(self.loop.stop) ; self.thread.join()
+
+	async def processRequest(self,path,headers):
+		self.connections += 1
+		if self.status != None: return (self.status,[],b'')
+
+	async def handle(self,ws,path=None):
+		self.active += 1 ; self.peak = max(self.peak,self.active)
+		self.opened.append(time.time())
+		try:
+			json.loads(await ws.recv())
+			await ws.send(json.dumps({'state' : 'listening'}))
+			received = 0
+			while True:
+				chunk = await ws.recv()
+				if len(chunk) == 0: break
+				received += len(chunk)
+			self.audioBytes.append(received)
+			await asyncio.sleep(0.1)
+			if self.closeCode != None: await ws.close(code=self.closeCode) ; return
+			await ws.send(json.dumps({'result_index' : 0, 'results' : [{'final' : True,
+				'alternatives' : [{'transcript' : 'hi ','confidence' : 0.9,
+				'timestamps' : [['hi',0.0,0.5]]}]}]}))
+			await ws.send(json.dumps({'state' : 'listening'}))
+			await ws.wait_closed()
+		finally: self.active -= 1
+
+@pytest.fixture
+def service(request):
+	service = FakeService(*getattr(request,'param',()))
+	yield service
+	service.stop()
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+	monkeypatch.setattr(transcriptCache,"cacheDir",None)
+	monkeypatch.setattr(asyncSTT,"retryBackoffSeconds",0)
+	monkeypatch.setattr(asyncSTT,"maxRetries",2)
+
+# Function that writes a second of silence for each audio file.
+def audioFiles(tmp_path,count):
+	files = []
+	for number in range(count):
+		path = str(tmp_path / "audio{}.wav".format(number))
+		with wave.open(path,'wb') as f:
+			f.setnchannels(1) ; f.setsampwidth(2) ; f.setframerate(16000)
+			f.writeframes(b'\0\0'*16000)
+		files.append(path)
+	return files
+
+# Function that transcribes the files with the fake service.
+# Returns: Output information dictionaries.
+def transcribe(service,files,outputDir,num_threads,ready=None):
+	return asyncSTT.run('user','password',{f : outputDir for f in files},
+		'en-US_BroadbandModel',None,None,num_threads,True,0,files,
+		{f : ['SP1','SP2'] for f in files},'',{f : 'audio/wav' for f in files},
+		0.5,'us-south',url=service.url,ready=ready)
+
+# Function that returns the words of a json file as (word, start, end) tuples.
+def words(outputDir,audioFile):
+	return [tuple(word) for res in STT.readResults(os.path.join(outputDir,
+		STT.jsonFileName(audioFile))) if 'results' in res
+		for word in res['results'][0]['alternatives'][0]['timestamps']]
+
+
+def test_concurrent_recognitions_are_limited(service,tmp_path):
+	files = audioFiles(tmp_path,5)
+	outputInfo = transcribe(service,files,str(tmp_path),2)
+	assert [dic['delete'] for dic in outputInfo] == [False]*5
+	assert service.connections == 5
+	assert service.peak == 2
+
+# A job interrupted after writing results resumes after them instead of
+# sending the whole audio again.
+@pytest.mark.skipif(shutil.which(asyncSTT.ffmpegCommand) == None,reason="ffmpeg is required")
+def test_interrupted_job_resumes_after_final_results(service,tmp_path):
+	audioFile = audioFiles(tmp_path,1)[0] ; outputDir = str(tmp_path)
+	STTJournal.record(outputDir,audioFile,'started',attempt=0,offset=0)
+	STT.writeResults(os.path.join(outputDir,STT.jsonFileName(audioFile)),
+		[{'result_index' : 0, 'results' : [{'final' : True,'alternatives' : [
+		{'transcript' : 'hi ','confidence' : 0.9,'timestamps' : [['hi',0.0,0.5]]}]}]}])
+	outputInfo = transcribe(service,[audioFile],outputDir,1)
+	assert not outputInfo[0]['delete']
+	assert service.connections == 1
+	assert words(outputDir,audioFile) == [('hi',0.0,0.5),('hi',0.5,1.0)]
+
+def test_resume_state_starts_after_final_results(tmp_path):
+	outputDir = str(tmp_path) ; jsonPath = os.path.join(outputDir,"a-json.txt")
+	STTJournal.record(outputDir,"a.wav",'started',attempt=0,offset=0)
+	STT.writeResults(jsonPath,[{'result_index' : 0, 'results' : [{'final' : True,
+		'alternatives' : [{'transcript' : 'hi ','timestamps' : [['hi',0.0,0.5]]}]}]}])
+	json_output,offset = asyncSTT.resumeState(outputDir,"a.wav",jsonPath)
+	assert offset == 0.5 and asyncSTT.nextResultIndex(json_output) == 1
+
+@pytest.mark.parametrize("service",[(1008,),(None,401)],indirect=True)
+def test_refused_recognitions_are_not_retried(service,tmp_path):
+	audioFile = audioFiles(tmp_path,1)[0]
+	outputInfo = transcribe(service,[audioFile],str(tmp_path),1)
+	assert outputInfo[0]['delete']
+	assert service.connections == 1
+	assert STTJournal.lastEntry(str(tmp_path),audioFile)['state'] == 'failed'
+
+def test_cut_off_recognitions_are_retried(service,tmp_path):
+	service.closeCode = 1011
+	audioFile = audioFiles(tmp_path,1)[0]
+	outputInfo = transcribe(service,[audioFile],str(tmp_path),1)
+	assert outputInfo[0]['delete']
+	assert service.connections == 1 + asyncSTT.maxRetries
+	assert STTJournal.unfinished(str(tmp_path)) == [audioFile]
+
+# Files that are still being prepared are transcribed once their job finishes,
+# without holding up the files that are ready.
+def test_files_are_transcribed_when_ready(service,tmp_path):
+	files = audioFiles(tmp_path,3) ; outputDir = str(tmp_path)
+	later = Future() ; failed = Future()
+	timer = threading.Timer(0.5,later.set_result,[files[1]]) ; timer.start()
+	failed.set_exception(OSError("Command failed"))
+	start = time.time()
+	outputInfo = transcribe(service,files,outputDir,3,{files[1] : later,files[2] : failed})
+	assert [dic['delete'] for dic in outputInfo] == [False,False,True]
+	assert service.connections == 2
+	assert service.opened[0] - start < 0.5 <= service.opened[1] - start
@@ -0,0 +1,118 @@
+'''
+	Tests of the laughter analysis features and segmentation.
+	Requires librosa. Keras and Tensorflow are required to import the module
+	but are not used.
+'''
+
+import pytest
+import numpy
+
+for name in ("librosa","soundfile","audioread","keras","tensorflow"): pytest.importorskip(name)
+import laughAnalysis
+
+
+# Short clips of noise, silence and a tone, including clips shorter than a
+# window. Clips need 9 frames for the delta features.
+def clips():
+	rng = numpy.random.RandomState(0) ; sr = laughAnalysis.AUDIO_SAMPLE_RATE
+	t = numpy.arange(int(0.8*sr))/sr
+	return [rng.randn(int(0.1*sr)).astype('float32'),
+		rng.randn(int(1.3*sr)).astype('float32'),
+		numpy.zeros(int(0.5*sr),dtype='float32'),
+		(0.3*numpy.sin(2*numpy.pi*440*t)).astype('float32')]
+
+@pytest.mark.parametrize("clip",clips())
+def test_feature_windows_match_feature_list(clip):
+	sr = laughAnalysis.AUDIO_SAMPLE_RATE
+	expected = laughAnalysis.getFeatureList(clip,sr)
+	mfccWindows,deltaWindows = laughAnalysis.getFeatureWindows(clip,sr)
+	windows = laughAnalysis.formatWindows(mfccWindows,deltaWindows,0,len(mfccWindows))
+	assert windows.shape == expected.shape
+	assert numpy.allclose(windows,expected)
+
+def test_feature_windows_are_views():
+	clip = clips()[1]
+	mfccWindows,deltaWindows = laughAnalysis.getFeatureWindows(clip,laughAnalysis.AUDIO_SAMPLE_RATE)
+	assert not mfccWindows.flags.writeable and not mfccWindows.flags.owndata
+
+# RMS is computed from default length (2048 sample) frames as the model was
+# trained with, also for signals that are not stationary.
+def test_rms_uses_default_frame_length():
+	import librosa
+	sr = laughAnalysis.AUDIO_SAMPLE_RATE
+	clip = numpy.concatenate([numpy.zeros(int(0.3*sr)),
+		numpy.random.RandomState(1).randn(int(0.2*sr))]).astype('float32')
+	features = laughAnalysis.computeMfccFeatures(clip,sr)
+	magnitude = numpy.abs(librosa.stft(clip,hop_length=int(sr/100)))
+	expected = numpy.sqrt(numpy.mean(magnitude**2,axis=0))
+	assert numpy.allclose(features[:,-1],expected,rtol=1e-4,atol=1e-6)
+
+# Function that computes RMS from a magnitude spectrogram as
+# librosa.feature.rmse did when the model was trained. From librosa 0.7,
+# librosa.feature.rms halves the DC and Nyquist bins and normalizes to the
+# frame length, which is undone here.
+def librosaRms(magnitude):
+	import librosa
+	if hasattr(librosa.feature,'rmse'): return librosa.feature.rmse(S=magnitude)
+	bins = magnitude.shape[0] ; frameLength = 2*(bins-1)
+	magnitude = magnitude.copy() ; magnitude[[0,-1]] *= numpy.sqrt(2)
+	return librosa.feature.rms(S=magnitude,frame_length=frameLength)*frameLength/numpy.sqrt(2*bins)
+
+# The MFCC and RMS features match those of librosa.feature.mfcc and
+# librosa.feature.rms the model was trained with.
+@pytest.mark.parametrize("clip",clips()[1:])
+def test_features_match_librosa(clip):
+	import librosa
+	sr = laughAnalysis.AUDIO_SAMPLE_RATE ; hop = int(sr/100)
+	features = laughAnalysis.computeMfccFeatures(clip,sr)
+	mfcc = librosa.feature.mfcc(y=clip,sr=sr,n_mfcc=12,n_mels=12,hop_length=hop,
+		dct_type=2,n_fft=int(sr/40)).T
+	rms = librosaRms(numpy.abs(librosa.stft(clip,hop_length=hop))).T
+	assert numpy.allclose(features[:,:12],mfcc,rtol=1e-4,atol=1e-3)
+	assert numpy.allclose(features[:,12:],rms,rtol=1e-4,atol=1e-6)
+
+# RMS computed one block of frames at a time matches the RMS of the whole clip.
+@pytest.mark.parametrize("blockFrames",[1,7,50,1000])
+def test_rms_blocks_match_whole_series(blockFrames):
+	import spectrogram
+	sr = laughAnalysis.AUDIO_SAMPLE_RATE ; hop = int(sr/100)
+	clip = numpy.concatenate([clips()[1],numpy.zeros(int(0.25*sr),dtype='float32')])
+	expected = spectrogram.rmsFromSpectrogram(spectrogram.powerSpectrogram(clip,
+		spectrogram.RMS_N_FFT,hop))
+	rms = spectrogram.rmsFromSeries(clip,hop,blockFrames=blockFrames)
+	assert rms.shape == expected.shape
+	assert numpy.allclose(rms,expected,rtol=1e-5,atol=1e-7)
+
+# The minimum laugh length is in frames, so the default of 0.05 keeps laughs
+# of a single frame.
+def test_laughter_min_length_is_in_frames():
+	probs = numpy.zeros(100)
+	probs[10] = 0.9 ; probs[20:23] = 0.9 ; probs[40:46] = 0.9
+	assert laughAnalysis.getLaughterInstances(probs,0.5,0.05) == [
+		(0.1,0.1),(0.2,0.22),(0.4,0.45)]
+	assert laughAnalysis.getLaughterInstances(probs,0.5,3) == [(0.4,0.45)]
+
+# Model that returns a probability computed from every value of each window,
+# so that any difference in the features changes the result.
+class WindowModel:
+	def predict_proba(self,windows,verbose=0):
+		weights = numpy.random.RandomState(2).uniform(-1,1,windows.shape[1])
+		return (1/(1+numpy.exp(-windows.dot(weights)/windows.shape[1])))[:,None]
+
+# Probabilities streamed in blocks match the single-shot probabilities,
+# including the frames at the block boundaries. The block size does not divide
+# the number of frames.
+@pytest.mark.parametrize("blockFrames",[50,97])
+def test_streamed_probabilities_match_single_shot(tmpdir,blockFrames):
+	import soundfile
+	sr = laughAnalysis.AUDIO_SAMPLE_RATE
+	audioFile = str(tmpdir.join("clip.wav"))
+	soundfile.write(audioFile,numpy.concatenate(clips()[1:]),sr,subtype='FLOAT')
+	expected = laughAnalysis.laughProbabilities(audioFile,WindowModel())
+	probs = laughAnalysis.streamProbabilities(audioFile,WindowModel(),blockFrames=blockFrames)
+	assert len(expected) % blockFrames != 0
+	assert probs.shape == expected.shape
+	boundaries = numpy.arange(blockFrames,len(probs),blockFrames)
+	assert numpy.allclose(probs[boundaries-1],expected[boundaries-1],rtol=1e-5,atol=1e-6)
+	assert numpy.allclose(probs[boundaries],expected[boundaries],rtol=1e-5,atol=1e-6)
+	assert numpy.allclose(probs,expected,rtol=1e-5,atol=1e-6)
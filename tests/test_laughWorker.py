@@ -0,0 +1,89 @@
+'''
+	Tests of the laughter worker socket and key.
+'''
+
+import os, socket, stat, threading
+import pytest
+
+pytest.importorskip("termcolor")
+if os.name != 'posix': pytest.skip("unix sockets only",allow_module_level=True)
+from multiprocessing import Pipe
+from multiprocessing.connection import Listener
+import numpy
+import laughWorker
+
+
+@pytest.fixture
+def workerDir(tmp_path,monkeypatch):
+	path = str(tmp_path / "worker")
+	monkeypatch.setattr(laughWorker,"WORKER_DIR",path)
+	return path
+
+# Function that runs a listener answering pings in a thread.
+def listen(listener,servedPath):
+	connection = listener.accept()
+	action,data = connection.recv()
+	connection.send(('ok',servedPath))
+	connection.close()
+
+def test_key_and_directory_are_private(workerDir):
+	key = laughWorker.workerKey()
+	assert len(key) == laughWorker.WORKER_KEY_LENGTH
+	assert laughWorker.workerKey() == key
+	assert stat.S_IMODE(os.stat(workerDir).st_mode) == 0o700
+	keyPath = os.path.join(workerDir,laughWorker.WORKER_KEY)
+	assert stat.S_IMODE(os.stat(keyPath).st_mode) == 0o600
+
+def test_directory_accessible_by_others_is_not_used(workerDir):
+	os.makedirs(workerDir) ; os.chmod(workerDir,0o755)
+	assert laughWorker.workerKey() == None
+	assert laughWorker.openClient() == None
+
+def test_worker_with_key_is_trusted(workerDir):
+	listener = Listener(laughWorker.workerAddress(),authkey=laughWorker.workerKey())
+	thread = threading.Thread(target=listen,args=(listener,os.path.abspath("model.h5")))
+	thread.start()
+	model = laughWorker.openConnection("model.h5")
+	thread.join() ; listener.close()
+	assert isinstance(model,laughWorker.WorkerModel)
+	model.close()
+
+# A process listening at the worker address without the key is not trusted.
+def test_listener_without_key_is_not_trusted(workerDir):
+	laughWorker.workerKey()
+	listener = Listener(laughWorker.workerAddress(),authkey=b'x'*laughWorker.WORKER_KEY_LENGTH)
+	thread = threading.Thread(target=lambda: pytest.raises(Exception,listener.accept))
+	thread.start()
+	assert laughWorker.openConnection("model.h5") == None
+	thread.join() ; listener.close()
+
+def test_stale_socket_is_replaced(workerDir):
+	laughWorker.workerKey()
+	# Socket file left behind by a worker that exited.
+	stale = socket.socket(socket.AF_UNIX)
+	stale.bind(laughWorker.workerAddress()) ; stale.close()
+	listener = laughWorker.openListener()
+	assert listener != None
+	listener.close()
+
+def test_running_worker_is_not_replaced(workerDir):
+	listener = laughWorker.openListener()
+	thread = threading.Thread(target=lambda: pytest.raises(Exception,listener.accept))
+	thread.start()
+	assert laughWorker.openListener() == None
+	thread.join() ; listener.close()
+
+# Model loaded in the Gailbot process, returning a fixed probability.
+class LocalModel:
+	def predict_proba(self,features,verbose=0):
+		return numpy.full((len(features),1),0.5)
+
+# A worker that stops responding is replaced by the model loaded in-process.
+def test_stopped_worker_falls_back_to_local_model():
+	connection,workerEnd = Pipe() ; workerEnd.close()
+	loaded = []
+	model = laughWorker.WorkerModel(connection,lambda: loaded.append(1) or LocalModel())
+	for count in range(2):
+		assert model.predict_proba(numpy.zeros((3,4))).tolist() == [[0.5]]*3
+	assert loaded == [1]
+	model.close()
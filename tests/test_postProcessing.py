@@ -0,0 +1,146 @@
+'''
+	Tests that files dropped in post-processing are reported.
+'''
+
+import json, os
+import pytest
+
+pytest.importorskip("inquirer")
+import postProcessing
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+	monkeypatch.setattr(postProcessing,"processingActions",[postProcessing.jsonToCSV])
+	monkeypatch.setattr(postProcessing,"interactive",False)
+	monkeypatch.setattr(postProcessing,"rerenderMode",False)
+
+# Function that writes a json file of Watson results for a file dictionary.
+# Input: Output directory, Name, List of (word, start, end) tuples or None
+# for a file that cannot be parsed.
+def infoDic(outputDir,name,words):
+	jsonFile = name + "-json.txt"
+	with open(os.path.join(outputDir,jsonFile),'w') as f:
+		if words == None: f.write("{ not json")
+		else:
+			f.write(json.dumps({"result_index" : 0, "results" : [{"final" : True,"alternatives" : [
+				{"transcript" : " ".join([word[0] for word in words]),"timestamps" : words,
+				"word_confidence" : [[word[0],0.9] for word in words]}]}],
+				"processing_metrics" : {"periodic" : False,"processed_audio" : {"received" : 1.0}}}) + "\n")
+			f.write(json.dumps({"speaker_labels" : [{"from" : word[1],"to" : word[2],"speaker" : 0,
+				"confidence" : 0.5,"final" : True} for word in words]}) + "\n")
+	return {"outputDir" : outputDir, "jsonFile" : jsonFile, "audioFile" : name + ".wav",
+		"names" : ["SP1","SP2"], "individualAudioFile" : name + ".wav"}
+
+@pytest.mark.parametrize("parallel",[False,True])
+def test_dropped_files_are_not_returned(tmp_path,monkeypatch,parallel):
+	monkeypatch.setattr(postProcessing,"parallelMode",parallel)
+	infoList = [infoDic(str(tmp_path),"words",[["hello",0.0,0.5],["there",0.6,1.0]]),
+		infoDic(str(tmp_path),"empty",[])]
+	if parallel: infoList.append(infoDic(str(tmp_path),"broken",None))
+	processed = postProcessing.postProcess(infoList)
+	assert [dic['jsonFile'] for dic in processed] == ["words-json.txt"]
+
+# Function that returns the contents of the output files of a directory
+# tree, except the saved analysis.
+def outputs(directory):
+	contents = {}
+	for root,dirs,files in os.walk(directory):
+		for fileName in files:
+			if fileName.endswith(postProcessing.analysisFileSuffix): continue
+			with open(os.path.join(root,fileName),'rb') as f:
+				contents[os.path.relpath(os.path.join(root,fileName),directory)] = f.read()
+	return contents
+
+def test_parallel_outputs_match_serial_outputs(tmp_path,monkeypatch):
+	monkeypatch.setattr(postProcessing,"processingActions",
+		[postProcessing.jsonToCSV,postProcessing.CHAT.formatCHAT])
+	for parallel in (False,True):
+		monkeypatch.setattr(postProcessing,"parallelMode",parallel)
+		directory = tmp_path / str(parallel) ; infoList = []
+		for count in range(3):
+			(directory / str(count)).mkdir(parents=True)
+			infoList.append(infoDic(str(directory / str(count)),"file",[["hello",0.0,0.5],
+				["there",0.6,1.0],["%HESITATION",2.0,2.2],["yes",float(count+3),float(count+4)]]))
+		postProcessing.postProcess(infoList)
+	assert len(outputs(tmp_path / "False")) > 3
+	assert outputs(tmp_path / "False") == outputs(tmp_path / "True")
+
+def test_output_of_failed_files_is_shown(tmp_path,monkeypatch,capsys):
+	monkeypatch.setattr(postProcessing,"parallelMode",True)
+	infoList = [infoDic(str(tmp_path),"words",[["hello",0.0,0.5]]),infoDic(str(tmp_path),"missing",[])]
+	os.remove(os.path.join(str(tmp_path),"missing-json.txt"))
+	postProcessing.postProcess(infoList)
+	output = capsys.readouterr().out
+	assert "FAILED" in output and "File not found" in output
+
+def test_module_settings_are_set_in_workers(monkeypatch):
+	monkeypatch.setattr(postProcessing,"workerSettings",{"tableWriter" : ("writeBufferBytes",)})
+	monkeypatch.setattr(postProcessing.tableWriter,"writeBufferBytes",4096)
+	settings = postProcessing.moduleSettings()
+	monkeypatch.setattr(postProcessing.tableWriter,"writeBufferBytes",1)
+	postProcessing.processFile({},[],{},[],False,settings)
+	assert postProcessing.tableWriter.writeBufferBytes == 4096
+
+# CHAT/CA/CSV files re-rendered from the saved analysis match those of the
+# full run, including transcripts that are not ASCII.
+def test_rerendered_outputs_match_full_run(tmp_path,monkeypatch):
+	monkeypatch.setattr(postProcessing,"processingActions",
+		[postProcessing.jsonToCSV,postProcessing.CHAT.formatCHAT])
+	monkeypatch.setattr(postProcessing,"parallelMode",False)
+	words = [["café",0.0,0.5],["über",0.6,1.0],["日本語",2.0,2.2],["%HESITATION",2.3,2.5],["ok",4.0,4.4]]
+	infoList = [infoDic(str(tmp_path),"file",words)]
+	files = dict(infoList[0])
+	postProcessing.postProcess(infoList)
+	saved = outputs(tmp_path)
+	assert os.path.isfile(postProcessing.analysisPath(files))
+	# The word CSV file of jsonToCSV is not written again when re-rendering.
+	rendered = [name for name in saved if os.path.splitext(name)[1] in (".cha",".ca",".csv")
+		and name != "file.csv"]
+	assert {os.path.splitext(name)[1] for name in rendered} == {".cha",".ca",".csv"}
+	for name in rendered: os.remove(os.path.join(str(tmp_path),name))
+	monkeypatch.setattr(postProcessing,"rerenderMode",True)
+	postProcessing.postProcess([dict(files)])
+	chat = [saved[name].decode('utf-8') for name in rendered if name.endswith(".cha")]
+	assert len(chat) > 0 and all(["café über" in text and "日本語" in text for text in chat])
+	assert {name : outputs(tmp_path)[name] for name in rendered} == {name : saved[name] for name in rendered}
+
+# Function that writes a json file of one final result of the given words
+# followed by the given speaker label messages.
+# Input: Output directory, List of (word, start, end) tuples, List of lists
+# of (start, speaker) tuples.
+# Returns: Speakers of the words read by getJSON.
+def labelledSpeakers(outputDir,words,labelMessages):
+	dic = infoDic(outputDir,"labels",[])
+	with open(postProcessing.jsonPath(dic),'w') as f:
+		f.write(json.dumps({"result_index" : 0, "results" : [{"final" : True,"alternatives" : [
+			{"transcript" : " ".join([word[0] for word in words]),"timestamps" : words,
+			"word_confidence" : [[word[0],0.9] for word in words]}]}],
+			"processing_metrics" : {"periodic" : False,"processed_audio" : {"received" : 1.0}}}) + "\n")
+		for labels in labelMessages:
+			f.write(json.dumps({"speaker_labels" : [{"from" : start,"to" : start+0.1,
+				"speaker" : speaker,"confidence" : 0.5,"final" : False} for start,speaker in labels]}) + "\n")
+	return list(postProcessing.getJSON(dic).speaker)
+
+WORDS = [["a",0.0,0.5],["b",0.6,1.0],["c",1.2,1.5],["d",2.0,2.4]]
+
+# Words take the last label sent for their start time.
+def test_revised_speaker_labels_are_used(tmp_path):
+	speakers = labelledSpeakers(str(tmp_path),WORDS,[[(0.0,0),(0.6,0),(1.2,0)],
+		[(1.2,1),(2.0,1)],[(0.6,1)]])
+	assert speakers == ["SP1","SP2","SP2","SP2"]
+
+# Words without a label take the label of the previous word, and leading words
+# the first label sent.
+def test_unlabelled_words_take_previous_label(tmp_path,capsys):
+	speakers = labelledSpeakers(str(tmp_path),WORDS,[[(0.6,1),(1.2,0)]])
+	assert speakers == ["SP2","SP2","SP1","SP1"]
+	assert "2 of 4 words have no speaker label" in capsys.readouterr().out
+	assert postProcessing.joinSpeakerLabels([0.0,0.6,1.2],{0.6 : 1},"file") == [1,1,1]
+
+# Without speaker labels every word is assigned to the first speaker.
+def test_words_without_labels_are_assigned_to_first_speaker(tmp_path,capsys):
+	assert labelledSpeakers(str(tmp_path),WORDS,[]) == ["SP1"]*4
+	output = capsys.readouterr().out
+	assert "No speaker labels returned, assigning all words to SP1" in output
+	assert "have no speaker label" not in output
@@ -0,0 +1,80 @@
+'''
+	Tests of the per-stage timing traces of requests.
+'''
+
+import json, os
+import pytest
+
+pytest.importorskip("termcolor")
+import profiling
+from wordTable import WordTable
+
+
+@pytest.fixture(autouse=True)
+def tracing(tmp_path,monkeypatch):
+	monkeypatch.setattr(profiling,"enabled",True)
+	monkeypatch.setattr(profiling,"traceDir",str(tmp_path / "traces"))
+	profiling.startTrace()
+	yield
+	profiling.collect()
+
+def test_nested_spans_record_their_parent():
+	with profiling.span("request"):
+		with profiling.span("stage") as items:
+			with profiling.span("step"): pass
+			items['files'] = 2
+		with profiling.span("other"): pass
+	records = {record['name'] : record for record in profiling.collect()}
+	assert records['request']['parent'] == None
+	assert records['stage']['parent'] == "request"
+	assert records['step']['parent'] == "stage"
+	assert records['other']['parent'] == "request"
+	assert records['stage']['items'] == {'files' : 2}
+	assert all([record['wall'] >= 0 and record['cpu'] >= 0 for record in records.values()])
+
+# Spans of a worker process are added under the span open in this process.
+# Spans that already have a parent in the worker keep it.
+def test_added_spans_are_placed_under_open_span():
+	with profiling.span("worker"):
+		with profiling.span("action"): pass
+	workerSpans = profiling.collect()
+	with profiling.span("parallel"): profiling.addSpans(workerSpans)
+	profiling.addSpans([{"name" : "late", "parent" : None}])
+	records = {record['name'] : record for record in profiling.collect()}
+	assert records['worker']['parent'] == "parallel"
+	assert records['action']['parent'] == "worker"
+	assert records['late']['parent'] == None
+
+def test_items_of_files_and_groups_are_counted():
+	turns = [["SP1",0,1,"hello there"],["SP2",1,2,"hi"]]
+	first = {"jsonList" : WordTable.fromRows([["SP1",0,0.5,"hello"],["SP1",0.5,1,"there"]]),
+		"jsonListCombined" : turns, "laughProbs" : [0.1]*100}
+	second = {"jsonList" : WordTable.fromRows([["SP2",1,2,"hi"]]),"jsonListCombined" : turns,
+		"laughProbs" : [0.1]*50}
+	assert profiling.countItems([first,second]) == {"files" : 2, "words" : 3, "turns" : 2,
+		"frames" : 150}
+	assert profiling.countItems([[first,second]]) == profiling.countItems([first,second])
+	assert profiling.countItems([{"jsonListTurns" : turns}]) == {"files" : 1, "turns" : 2}
+	assert profiling.countItems(None) == {}
+
+# Traces of requests started in the same second are written to separate files.
+def test_traces_are_written_with_unique_names(tmp_path,monkeypatch):
+	monkeypatch.setattr(profiling.time,"localtime",lambda seconds: profiling.time.gmtime(0))
+	paths = []
+	for count in range(2):
+		profiling.startTrace()
+		with profiling.span("stage"): pass
+		with profiling.span("stage"): pass
+		paths.append(profiling.writeTrace(os.path.join("dir","request")))
+	assert len(set(paths)) == 2 and all([os.path.isfile(path) for path in paths])
+	assert all([os.path.dirname(path) == str(tmp_path / "traces") for path in paths])
+	with open(paths[1]) as f: trace = json.load(f)
+	assert trace['name'] == os.path.join("dir","request")
+	assert trace['stages']['stage']['count'] == 2 and len(trace['spans']) == 2
+	assert trace['profile'] == None
+
+def test_no_trace_is_written_when_disabled(monkeypatch):
+	monkeypatch.setattr(profiling,"enabled",False)
+	with profiling.span("stage") as items: items['files'] = 1
+	assert profiling.collect() == []
+	assert profiling.writeTrace("request") == None
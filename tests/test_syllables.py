@@ -0,0 +1,47 @@
+'''
+	Tests of the syllable cache shared by processes.
+	The neural syllable counter is replaced by the word length so that the
+	tests do not need big_phoney.
+'''
+
+import multiprocessing, os, sqlite3, sys
+import pytest
+
+import syllables
+
+if sys.platform == 'win32': pytest.skip("needs fork",allow_module_level=True)
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path,monkeypatch):
+	monkeypatch.setattr(syllables,"cachePath",str(tmp_path / "syllables.sqlite"))
+	monkeypatch.setattr(syllables,"countSyllables",len)
+	monkeypatch.setattr(syllables,"memoryCache",syllables.OrderedDict())
+	for key in syllables.cacheStats: monkeypatch.setitem(syllables.cacheStats,key,0)
+	return syllables.cachePath
+
+# Function that counts a batch of words in a worker process.
+def countBatch(words):
+	return syllables.countWords(words)
+
+def test_counts_are_cached_on_disk(cache):
+	assert syllables.countTranscripts(["one two","two three"]) == [6,8]
+	syllables.memoryCache.clear()
+	assert syllables.countTranscripts(["three one"]) == [8]
+	assert syllables.cacheStats == {"memoryHits" : 0, "diskHits" : 2, "misses" : 3}
+
+# Worker processes adding words to the cache at the same time neither lose
+# nor corrupt words.
+def test_processes_share_the_cache(cache):
+	words = ["word{}".format(number) for number in range(2000)]
+	batches = [words[first::3] + words[:200] for first in range(12)]
+	with multiprocessing.get_context('fork').Pool(6) as pool:
+		results = pool.map(countBatch,batches,chunksize=1)
+	for result in results: assert all(count == len(word) for word,count in result.items())
+	with sqlite3.connect(cache) as connection:
+		assert dict(connection.execute("SELECT word,count FROM syllables")) == {
+			word : len(word) for word in words}
+
+def test_unusable_cache_still_counts(tmp_path,monkeypatch):
+	monkeypatch.setattr(syllables,"cachePath",str(tmp_path))
+	assert syllables.countTranscripts(["one two"]) == [6]
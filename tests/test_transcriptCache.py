@@ -0,0 +1,108 @@
+'''
+	Tests of the cache of transcription results.
+'''
+
+import os, subprocess, sys
+import pytest
+
+pytest.importorskip("termcolor")
+import transcriptCache
+
+
+@pytest.fixture
+def cacheDir(tmp_path,monkeypatch):
+	path = str(tmp_path / "cache")
+	monkeypatch.setattr(transcriptCache,"cacheDir",path)
+	return path
+
+# Function that writes an audio file with the given content.
+def audio(tmp_path,name,content):
+	path = tmp_path / name
+	path.write_bytes(content)
+	return str(path)
+
+# Function that returns results of the given size (bytes) when cached.
+def results(size):
+	return [{"results" : [{"final" : True}], "padding" : "x" * size}]
+
+def test_key_depends_on_audio_and_settings(tmp_path,cacheDir):
+	a = audio(tmp_path,"a.wav",b"a" * 1000) ; b = audio(tmp_path,"b.wav",b"b" * 1000)
+	copy = audio(tmp_path,"copy.wav",b"a" * 1000)
+	key = transcriptCache.cacheKey(a,"en-US_BroadbandModel",None,None,0.3)
+	assert key == transcriptCache.cacheKey(copy,"en-US_BroadbandModel",None,None,0.3)
+	assert key != transcriptCache.cacheKey(b,"en-US_BroadbandModel",None,None,0.3)
+	assert key != transcriptCache.cacheKey(a,"en-US_NarrowbandModel",None,None,0.3)
+	assert key != transcriptCache.cacheKey(a,"en-US_BroadbandModel",None,"acoustic",0.3)
+
+# The customization weight only changes the key of custom language models.
+def test_key_depends_on_weight_of_custom_language_models(tmp_path,cacheDir):
+	a = audio(tmp_path,"a.wav",b"a" * 1000)
+	assert (transcriptCache.cacheKey(a,"en-US_BroadbandModel",None,None,0.3) ==
+		transcriptCache.cacheKey(a,"en-US_BroadbandModel",None,None,0.9))
+	custom = transcriptCache.cacheKey(a,"en-US_BroadbandModel","language",None,0.3)
+	assert custom == transcriptCache.cacheKey(a,"en-US_BroadbandModel","language",None,"0.3")
+	assert custom != transcriptCache.cacheKey(a,"en-US_BroadbandModel","language",None,0.9)
+
+def test_disabled_cache_has_no_keys(tmp_path,monkeypatch):
+	monkeypatch.setattr(transcriptCache,"cacheDir",None)
+	a = audio(tmp_path,"a.wav",b"a")
+	assert transcriptCache.cacheKey(a,"en-US_BroadbandModel",None,None,0.3) == None
+	assert transcriptCache.lookup(None) == None
+
+def test_stored_results_are_found(tmp_path,cacheDir):
+	a = audio(tmp_path,"a.wav",b"a")
+	key = transcriptCache.cacheKey(a,"en-US_BroadbandModel",None,None,0.3)
+	assert transcriptCache.lookup(key) == None
+	transcriptCache.store(key,a,results(10))
+	assert transcriptCache.lookup(key) == results(10)
+	assert [entry['key'] for entry in transcriptCache.entries()] == [key]
+	assert not any([name.endswith(".tmp") for name in os.listdir(cacheDir)])
+
+# The least recently used results are removed first. Looking results up
+# marks them as used.
+def test_least_recently_used_results_are_removed(cacheDir,monkeypatch):
+	monkeypatch.setattr(transcriptCache,"maxCacheBytes",10**6)
+	for count,key in enumerate(["a","b","c"]):
+		transcriptCache.store(key,key+".wav",results(1000))
+		os.utime(transcriptCache.entryPath(key),(1000+count,1000+count))
+	transcriptCache.lookup("a")
+	# Entry sizes differ by a few bytes with the length of their creation time.
+	size = sum([os.path.getsize(transcriptCache.entryPath(key)) for key in ["c","a"]])
+	assert [entry['key'] for entry in transcriptCache.entries()] == ["b","c","a"]
+	assert transcriptCache.prune(size) == 1
+	assert [entry['key'] for entry in transcriptCache.entries()] == ["c","a"]
+	assert transcriptCache.prune(0) == 2
+	assert transcriptCache.entries() == []
+
+# Results larger than the cache are kept and older results removed.
+def test_stored_results_are_not_removed(cacheDir,monkeypatch):
+	monkeypatch.setattr(transcriptCache,"maxCacheBytes",500)
+	transcriptCache.store("old","old.wav",results(10))
+	transcriptCache.store("new","new.wav",results(1000))
+	assert transcriptCache.lookup("new") == results(1000)
+	assert [entry['key'] for entry in transcriptCache.entries()] == ["new"]
+
+def test_results_that_cannot_be_written_are_not_cached(tmp_path,monkeypatch,capsys):
+	blocked = audio(tmp_path,"file",b"")
+	monkeypatch.setattr(transcriptCache,"cacheDir",os.path.join(blocked,"cache"))
+	transcriptCache.store("key","a.wav",results(10))
+	assert "Transcript not cached: a.wav" in capsys.readouterr().out
+	assert transcriptCache.lookup("key") == None
+
+def test_results_are_removed_by_key_prefix(cacheDir):
+	for key in ["abc1","abc2","abd3"]: transcriptCache.store(key,key+".wav",results(10))
+	assert transcriptCache.removePrefixes(["abc"]) == 2
+	assert [entry['key'] for entry in transcriptCache.entries()] == ["abd3"]
+	assert transcriptCache.removePrefixes(["x"]) == 0
+
+def test_command_line_lists_and_removes_results(cacheDir):
+	for key in ["abc1","abd2"]: transcriptCache.store(key,key+".wav",results(10))
+	def run(*args):
+		return subprocess.run([sys.executable,transcriptCache.__file__,*args,'-cacheDir',cacheDir],
+			stdout=subprocess.PIPE,universal_newlines=True,check=True).stdout
+	output = run('list')
+	assert "abc1.wav" in output and "2 entries" in output
+	assert "Removed 1 entries" in run('remove','abd')
+	assert [entry['key'] for entry in transcriptCache.entries()] == ["abc1"]
+	assert "Removed 1 entries" in run('clear')
+	assert transcriptCache.entries() == []
@@ -17,7 +17,8 @@ import sys,os
 from termcolor import colored					# Text coloring library.
 
 # Gailbot scripts
-import rateAnalysis
+import lazyImport 								# Imports modules on first use.
+rateAnalysis = lazyImport.module("rateAnalysis") 	# Loaded only for beat timing.
 
 # *** Global variables / invariants ***
 
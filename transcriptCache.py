@@ -0,0 +1,173 @@
+'''
+	Script that caches the final results returned by the STT service.
+	Results are keyed on the content hash of the audio sent and the
+	recognition settings, so re-running a conversation e.g. with different
+	CHAT settings does not send the same audio to the service again.
+	The least recently used results are removed once the cache is too large.
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/18/19
+'''
+
+import argparse 								# Library to extract input arguments
+import hashlib 									# Hashing audio content.
+import json                        				# json
+import os                          				# for listing directories
+import time 									# Timing library
+from termcolor import colored					# Text coloring library
+
+# *** Global variables / invariants ***
+
+# Directory of the transcription cache. None disables the cache.
+cacheDir = os.path.join(os.path.dirname(os.path.abspath(__file__)),".transcript-cache")
+
+# Maximum total size of the cached results (bytes).
+maxCacheBytes = 500 * 1024 * 1024
+
+# Size of the blocks audio files are hashed in (bytes).
+hashBlockBytes = 1024 * 1024
+
+
+# *** Cache functions ***
+
+# Function that returns the cache key of an audio file.
+# The customization weight only changes the results of custom language models.
+# Input: Audio file name, Base model, Custom language model id,
+# Custom acoustic model id, Customization weight.
+# Returns: Key string or None if the cache is disabled.
+def cacheKey(audioFile,base_model,language_id,acoustic_id,customization_weight):
+	if cacheDir == None: return None
+	if language_id == None: customization_weight = None
+	else: customization_weight = float(customization_weight)
+	settings = [base_model,language_id,acoustic_id,customization_weight]
+	key = hashlib.sha256(audioHash(audioFile).encode('utf-8'))
+	key.update(json.dumps(settings).encode('utf-8'))
+	return key.hexdigest()
+
+# Function that returns the cached results for a key and marks them as used.
+# Returns: List of json outputs or None if they are not cached.
+def lookup(key):
+	if key == None: return None
+	path = entryPath(key)
+	try:
+		with open(path) as f: entry = json.load(f)
+		os.utime(path)
+	except (OSError,ValueError): return None
+	return entry['results']
+
+# Function that adds the results of an audio file to the cache and removes
+# old results if the cache is too large. The added results are kept even if
+# they alone are larger than the cache. Results that cannot be written are
+# not cached.
+# Input: Key, Audio file name, List of json outputs.
+def store(key,audioFile,results):
+	if key == None: return
+	entry = {"audioFile" : audioFile, "created" : time.time(), "results" : results}
+	# Writing to a temporary file first so that readers never see partial results.
+	tempPath = entryPath(key) + ".tmp"
+	try:
+		os.makedirs(cacheDir,exist_ok=True)
+		with open(tempPath,'w') as f: json.dump(entry,f)
+		os.replace(tempPath,entryPath(key))
+	except OSError as e:
+		print(colored("\nWARNING: Transcript not cached: {0}\n{1}".format(audioFile,e),'red'))
+		try: os.remove(tempPath)
+		except OSError: pass
+		return
+	prune(maxCacheBytes,keep=key)
+
+# Function that returns information on all cached results, least recently
+# used first.
+# Returns: List of dictionaries with the key, audio file, size (bytes),
+# creation time and last use time of each entry.
+def entries():
+	if cacheDir == None or not os.path.isdir(cacheDir): return []
+	info = []
+	for fileName in os.listdir(cacheDir):
+		if not fileName.endswith(".json"): continue
+		path = os.path.join(cacheDir,fileName)
+		try:
+			stat = os.stat(path)
+			with open(path) as f: entry = json.load(f)
+		except (OSError,ValueError): continue
+		info.append({"key" : fileName[:-len(".json")], "audioFile" : entry.get('audioFile'),
+			"size" : stat.st_size, "created" : entry.get('created'), "lastUsed" : stat.st_mtime})
+	return sorted(info,key=lambda entry: entry['lastUsed'])
+
+# Function that removes the least recently used results until the cache
+# is no larger than the given size.
+# Input: Maximum size (bytes), Key of results that are not removed.
+# Returns: Number of entries removed.
+def prune(maxBytes,keep=None):
+	cached = entries()
+	total = sum([entry['size'] for entry in cached])
+	removed = 0
+	for entry in cached:
+		if total <= maxBytes: break
+		if entry['key'] == keep: continue
+		remove(entry['key'])
+		total -= entry['size'] ; removed += 1
+	return removed
+
+# Function that removes the results of every key starting with one of the
+# given prefixes.
+# Input: List of keys or key prefixes.
+# Returns: Number of entries removed.
+def removePrefixes(prefixes):
+	removed = [entry['key'] for entry in entries()
+		if any([entry['key'].startswith(prefix) for prefix in prefixes])]
+	for key in removed: remove(key)
+	return len(removed)
+
+# Function that removes the results of a key from the cache.
+def remove(key):
+	try: os.remove(entryPath(key))
+	except FileNotFoundError: pass
+
+
+# *** Helper functions for the transcription cache ***
+
+# Function that returns the path of the cache file for a key.
+def entryPath(key):
+	return os.path.join(cacheDir,key + ".json")
+
+# Function that returns the sha256 hash of the contents of an audio file.
+def audioHash(audioFile):
+	digest = hashlib.sha256()
+	with open(audioFile,'rb') as f:
+		for block in iter(lambda: f.read(hashBlockBytes),b''): digest.update(block)
+	return digest.hexdigest()
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+		description = 'Inspect and prune the Gailbot transcription cache')
+	parser.add_argument('action', choices = ['list','prune','clear','remove'],
+		help = 'list entries, prune to a size, clear the cache or remove keys')
+	parser.add_argument('keys', nargs = '*', help = 'Keys (or key prefixes) to remove')
+	parser.add_argument('-maxBytes', action = 'store', dest = 'maxBytes', type = int,
+		default = maxCacheBytes, help = 'Size (bytes) the cache is pruned to')
+	parser.add_argument('-cacheDir', action = 'store', dest = 'cacheDir',
+		default = cacheDir, help = 'Directory of the transcription cache')
+	args = parser.parse_args()
+	cacheDir = args.cacheDir
+	cached = entries()
+	if args.action == 'list':
+		for entry in cached:
+			print("{0}  {1:>10}  {2}  {3}".format(entry['key'][:16],entry['size'],
+				time.strftime("%Y-%m-%d %H:%M",time.localtime(entry['lastUsed'])),entry['audioFile']))
+		print("{0} entries, {1} bytes in {2}".format(len(cached),
+			sum([entry['size'] for entry in cached]),cacheDir))
+	elif args.action == 'prune':
+		print("Removed {} entries".format(prune(args.maxBytes)))
+	elif args.action == 'clear':
+		print("Removed {} entries".format(prune(0)))
+	elif args.action == 'remove':
+		print("Removed {} entries".format(removePrefixes(args.keys)))
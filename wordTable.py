@@ -0,0 +1,170 @@
+'''
+	Script that defines the columnar word table used to pass transcribed words
+	between the post-processing modules.
+	Each field is stored as one array column, replacing a list per word.
+	Rows can still be accessed as lists of fields through WordRow views.
+
+	Part of the Gailbot-3 development project.
+
+	Developed by:
+
+		Muhammad Umair
+		Tufts University
+		Human Interaction Lab at Tufts
+
+	Initial development: 6/4/19
+'''
+
+import json 									# Storing object columns.
+import numpy 									# Library to have multi-dimensional homogenous arrays.
+
+# *** Global variables / invariants ***
+
+# Column names in the order of the fields of a word row.
+COLUMNS = ('speaker','start','end','transcript','confidence','periodic','received',
+	'resultIndex')
+
+# Data type of each column.
+DTYPES = {
+	"speaker" : object,
+	"start" : numpy.float64,
+	"end" : numpy.float64,
+	"transcript" : object,
+	"confidence" : numpy.float64,
+	"periodic" : numpy.bool_,
+	"received" : numpy.float64,
+	"resultIndex" : numpy.int32
+}
+
+# Value used for a column that is not known e.g. for inserted markers.
+DEFAULTS = {
+	"speaker" : None,
+	"start" : numpy.nan,
+	"end" : numpy.nan,
+	"transcript" : "",
+	"confidence" : numpy.nan,
+	"periodic" : False,
+	"received" : numpy.nan,
+	"resultIndex" : -1
+}
+
+
+# Table of transcribed words with one array per field.
+class WordTable:
+
+	'''
+		speaker : Speaker label / name of the word.
+		start : Start time of the word (seconds).
+		end : End time of the word (seconds).
+		transcript : Transcript of the word.
+		confidence : Word confidence returned by Watson.
+		periodic : Periodic value of the result the word belongs to.
+		received : Audio recieved (seconds) by Watson for the result.
+		resultIndex : Index of the result the word belongs to.
+	'''
+	__slots__ = COLUMNS
+
+	def __init__(self,speaker=(),start=(),end=(),transcript=(),confidence=None,
+		periodic=None,received=None,resultIndex=None):
+		values = (speaker,start,end,transcript,confidence,periodic,received,resultIndex)
+		size = len(start)
+		for name,column in zip(COLUMNS,values):
+			if column is None: column = numpy.full(size,DEFAULTS[name],dtype=DTYPES[name])
+			setattr(self,name,toColumn(column,DTYPES[name]))
+
+	def __len__(self):
+		return len(self.start)
+
+	# An integer index returns a WordRow view.
+	# Slices, index arrays and masks return a new WordTable.
+	def __getitem__(self,index):
+		if isinstance(index,(int,numpy.integer)):
+			if index < 0: index += len(self)
+			if not 0 <= index < len(self): raise IndexError("Word index out of range")
+			return WordRow(self,index)
+		return WordTable(*[getattr(self,name)[index] for name in COLUMNS])
+
+	def __iter__(self):
+		for index in range(len(self)): yield WordRow(self,index)
+
+	# Function that returns the words as lists of fields in COLUMNS order.
+	# Input: Number of leading fields to include.
+	def rows(self,numFields=len(COLUMNS)):
+		return [list(row) for row in zip(*[getattr(self,name).tolist()
+			for name in COLUMNS[:numFields]])]
+
+	# Function that returns a copy of the table sorted by start time.
+	# Words with equal start times keep their order.
+	def sortedByStart(self):
+		return self[numpy.argsort(self.start,kind='mergesort')]
+
+	# Function that returns a table built from lists of fields in COLUMNS order.
+	# Rows may omit trailing fields, which are set to their default values.
+	@staticmethod
+	def fromRows(rows):
+		columns = []
+		for count,name in enumerate(COLUMNS):
+			columns.append([row[count] if len(row) > count else DEFAULTS[name] for row in rows])
+		return WordTable(*columns)
+
+	# Function that returns the columns as arrays that can be saved with numpy.savez.
+	# Object columns are stored as json strings so that no pickling is needed.
+	def toArrays(self):
+		return {name : numpy.array(json.dumps(getattr(self,name).tolist()))
+			if DTYPES[name] == object else getattr(self,name) for name in COLUMNS}
+
+	# Function that returns a table built from arrays returned by toArrays.
+	@staticmethod
+	def fromArrays(arrays):
+		return WordTable(*[json.loads(str(arrays[name])) if DTYPES[name] == object
+			else arrays[name] for name in COLUMNS])
+
+	# Function that joins tables in the given order.
+	@staticmethod
+	def concatenate(tables):
+		if len(tables) == 0: return WordTable()
+		return WordTable(*[numpy.concatenate([getattr(table,name) for table in tables])
+			for name in COLUMNS])
+
+
+# View of one word of a WordTable that behaves like the list of its fields.
+# Assigning a field writes through to the table.
+class WordRow:
+
+	'''
+		table : WordTable the word belongs to.
+		index : Position of the word in the table.
+	'''
+	__slots__ = ('table','index')
+
+	def __init__(self,table,index):
+		self.table = table
+		self.index = index
+
+	def __getitem__(self,field):
+		if isinstance(field,slice):
+			return [self[count] for count in range(*field.indices(len(COLUMNS)))]
+		return getattr(self.table,COLUMNS[field])[self.index]
+
+	def __setitem__(self,field,value):
+		getattr(self.table,COLUMNS[field])[self.index] = value
+
+	def __len__(self):
+		return len(COLUMNS)
+
+	def __iter__(self):
+		for count in range(len(COLUMNS)): yield self[count]
+
+	def __repr__(self):
+		return repr(list(self))
+
+
+# *** Helper functions ***
+
+# Function that converts values to a one dimensional column.
+# Object columns are filled element-wise so that sequences are not expanded.
+def toColumn(values,dtype):
+	if dtype != object: return numpy.asarray(values,dtype=dtype).reshape(-1)
+	column = numpy.empty(len(values),dtype=object)
+	column[:] = list(values)
+	return column